@@ -80,6 +80,8 @@ class Settings(BaseSettings):
     face_recognition_url: str = os.environ.get("FACE_RECOGNITION_URL", "http://localhost:5000")
     face_recognition_api_key: Optional[str] = os.environ.get("FACE_RECOGNITION_API_KEY", None)
     face_recognition_enabled: bool = os.environ.get("FACE_RECOGNITION_ENABLED", "true").lower() in ("1", "true", "yes")
+    # Max concurrent calls to the face-recognition-app (bulkhead size)
+    face_recognition_max_concurrency: int = int(os.environ.get("FACE_RECOGNITION_MAX_CONCURRENCY", "8"))
     # ONNX Face Recognition Models (~170MB) - Changed default to TRUE for production safety
     # On constrained environments (Heroku 512MB RAM), lazy load models on first request
     # Set to 'false' to preload models at startup (requires 1GB+ RAM per worker)
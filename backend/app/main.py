@@ -584,6 +584,34 @@ async def shutdown_event():
     except Exception as e:
         logger.warning(f"⚠️ Error stopping SaaS background jobs: {e}")
     
+    # Close the shared face-recognition HTTP client
+    try:
+        from app.services.face_enrollment_service import close_face_client
+        await close_face_client()
+    except Exception as e:
+        logger.warning(f"⚠️ Error closing face recognition client: {e}")
+    
+    # Close the shared profile-image download client
+    try:
+        from app.services.face_service import close_download_client
+        await close_download_client()
+    except Exception as e:
+        logger.warning(f"⚠️ Error closing image download client: {e}")
+    
+    # Stop the fee voucher render worker processes
+    try:
+        from app.services.fee_voucher_service import shutdown_render_pool
+        shutdown_render_pool()
+    except Exception as e:
+        logger.warning(f"⚠️ Error stopping voucher render pool: {e}")
+    
+    # Stop the Excel import validation worker processes
+    try:
+        from app.services.excel_service import shutdown_validation_pool
+        shutdown_validation_pool()
+    except Exception as e:
+        logger.warning(f"⚠️ Error stopping import validation pool: {e}")
+    
     # Self-ping feature removed; nothing to stop here
 
 @app.get("/")
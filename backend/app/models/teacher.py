@@ -2,6 +2,7 @@ from pydantic import BaseModel, validator
 from typing import List, Optional
 from datetime import datetime
 from app.utils.validators import is_valid_pk_phone
+from app.utils.embeddings import embedding_as_list
 
 
 # ================= Teacher Models =================
@@ -40,6 +41,11 @@ class TeacherSchema(BaseModel):
     embedding_version: Optional[str] = None
     face_image_updated_at: Optional[datetime] = None
 
+    @validator('face_embedding', pre=True)
+    def decode_face_embedding(cls, v):
+        # Stored as float16 Binary by the face service; older documents hold a list
+        return embedding_as_list(v)
+
 
 class TeacherInDB(TeacherSchema):
     id: Optional[str] = None
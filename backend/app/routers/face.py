@@ -2,7 +2,7 @@
 Face Recognition Router
 API endpoints for face recognition attendance system
 """
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, BackgroundTasks, Query
 from typing import Optional, List
 from pydantic import BaseModel
 import logging
@@ -426,7 +426,7 @@ async def get_debug_rankings(
         raise HTTPException(status_code=400, detail="Empty image")
     
     face_service = FaceRecognitionService(db)
-    rankings = face_service.get_embedding_rankings(image_data)
+    rankings = await asyncio.to_thread(face_service.get_embedding_rankings, image_data)
     
     return {
         "total_comparisons": len(rankings),
@@ -457,6 +457,9 @@ async def get_cache_statistics(
 @router.post("/recognize", response_model=RecognizeResponse)
 async def recognize_face(
     file: UploadFile = File(...),
+    encoding: str = Query("image"),
+    width: Optional[int] = Query(None, ge=1, le=4096),
+    height: Optional[int] = Query(None, ge=1, le=4096),
     db=Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
@@ -464,6 +467,10 @@ async def recognize_face(
     Process face recognition from captured image.
     Returns match or retry instruction.
     
+    encoding=image (default): file is a JPEG/PNG.
+    encoding=raw: file is width*height*3 bytes of RGB24 pixels, which skips
+    image decoding on the server; width and height are required.
+    
     Implements lazy embedding loading and concurrency control:
     - Loads embeddings for this school on first access
     - Limits concurrent inferences to 2 to prevent memory spikes
@@ -487,6 +494,16 @@ async def recognize_face(
         if not image_data:
             raise HTTPException(status_code=400, detail="Empty image")
         
+        raw_size = None
+        if encoding not in ("image", "raw"):
+            raise HTTPException(status_code=400, detail="encoding must be 'image' or 'raw'")
+        if encoding == "raw":
+            if not width or not height:
+                raise HTTPException(status_code=400, detail="width and height are required for raw encoding")
+            if len(image_data) != width * height * 3:
+                raise HTTPException(status_code=400, detail="Raw frame size does not match width*height*3")
+            raw_size = (width, height)
+        
         logger.info(f"[FACE] Recognition request: {len(image_data)} bytes, school={school_id}")
         
         # ===== LAZY EMBEDDING LOAD (first access) =====
@@ -505,11 +522,10 @@ async def recognize_face(
             settings_service = FaceSettingsService(db)
             settings = await settings_service.get_settings(school_id)
             
-            # ===== RUN INFERENCE IN THREAD POOL (non-blocking) =====
-            # This prevents CPU-bound face matching from blocking the async event loop
-            result = await asyncio.to_thread(
-                lambda: asyncio.run(face_service.process_recognition(image_data, school_id, settings))
-            )
+            # ===== RUN INFERENCE (non-blocking) =====
+            # process_recognition moves the CPU-bound embedding and matching
+            # steps to worker threads itself, so concurrent captures overlap
+            result = await face_service.process_recognition(image_data, school_id, settings, raw_size)
             
             if result["status"] == "success":
                 # Record attendance
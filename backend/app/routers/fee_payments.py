@@ -1,11 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import List, Optional
 from pydantic import BaseModel
 from app.models.fee import FeePaymentCreate, FeePaymentInDB, FeePaymentUpdate, FeePaymentResponse
 from app.services.fee_payment_service import (
-    record_fee_payment, get_fee_payment_by_id, get_fee_payments_for_student,
+    record_fee_payment, record_fee_payments_bulk, get_fee_payment_by_id, get_fee_payments_for_student,
     get_fee_payments_for_class, get_all_fee_payments, update_fee_payment,
-    delete_fee_payment, get_fee_payment_summary_for_student
+    delete_fee_payment, get_fee_payment_summary_for_student, get_fee_payment_summary_for_students
 )
 from app.dependencies.auth import check_permission
 from bson import ObjectId
@@ -37,9 +37,11 @@ async def create_fee_payment(
     logger.info(f"[SCHOOL:{school_id}] [ADMIN:{admin_email}] Recording fee payment")
     
     try:
-        from app.services.fee_payment_service import get_fee_payment_summary_for_student
-        
-        summary = get_fee_payment_summary_for_student(payment_data.student_id)
+        # Validate against live totals (same check as the bulk endpoint), not
+        # the materialized summary
+        summary = get_fee_payment_summary_for_students([payment_data.student_id]).get(
+            payment_data.student_id, {"remaining_amount": 0}
+        )
         if payment_data.amount_paid > summary["remaining_amount"]:
             logger.error(f"[SCHOOL:{school_id}] ❌ Payment exceeds remaining due")
             raise HTTPException(
@@ -64,11 +66,57 @@ async def create_fee_payment(
         logger.error(f"[SCHOOL:{school_id}] ❌ Error recording payment: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to record payment")
 
+@router.post("/bulk", response_model=dict)
+async def create_fee_payments_bulk(
+    payments_data: List[FeePaymentCreate],
+    current_user: dict = Depends(check_permission("fees.manage"))
+):
+    """Record fee payments for many students in one request"""
+    school_id = current_user.get("school_id")
+    admin_email = current_user.get("email")
+    logger.info(f"[SCHOOL:{school_id}] [ADMIN:{admin_email}] Recording {len(payments_data)} fee payments")
+    
+    if not payments_data:
+        return {"count": 0, "ids": []}
+    
+    try:
+        requested = {}
+        for payment_data in payments_data:
+            requested[payment_data.student_id] = requested.get(payment_data.student_id, 0) + payment_data.amount_paid
+        
+        summaries = get_fee_payment_summary_for_students(list(requested))
+        for student_id, amount in requested.items():
+            remaining = summaries.get(student_id, {}).get("remaining_amount", 0)
+            if amount > remaining:
+                logger.error(f"[SCHOOL:{school_id}] ❌ Payment exceeds remaining due for student {student_id}")
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Payment amount (${amount}) for student {student_id} cannot exceed remaining due (${remaining})"
+                )
+        
+        items = []
+        for payment_data in payments_data:
+            data = payment_data.dict()
+            data["received_by"] = current_user["id"]
+            data["school_id"] = school_id  # Include school_id for cash session tracking
+            items.append(data)
+        
+        ids = record_fee_payments_bulk(items)
+        logger.info(f"[SCHOOL:{school_id}] ✅ Recorded {len(ids)} fee payments")
+        return {"count": len(ids), "ids": ids}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"[SCHOOL:{school_id}] ❌ Error recording bulk payments: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to record payments")
+
 @router.get("", response_model=List[dict])
 async def list_fee_payments(
     student_id: Optional[str] = None,
     class_id: Optional[str] = None,
     payment_method: Optional[str] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=1000),
     current_user: dict = Depends(check_permission("fees.view"))
 ):
     """Get all fee payments with optional filters"""
@@ -85,7 +133,7 @@ async def list_fee_payments(
         if payment_method:
             filters["payment_method"] = payment_method
         
-        payments = get_all_fee_payments(filters)
+        payments = get_all_fee_payments(filters, skip=skip, limit=limit)
         logger.info(f"[SCHOOL:{school_id}] ✅ Retrieved {len(payments)} fee payments")
         return [convert_objectids(payment) for payment in payments]
     except Exception as e:
@@ -119,6 +167,8 @@ async def get_fee_payment(
 @router.get("/student/{student_id}", response_model=List[dict])
 async def get_student_fee_payments(
     student_id: str,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=1000),
     current_user: dict = Depends(check_permission("fees.view"))
 ):
     """Get all fee payments for a student"""
@@ -127,7 +177,7 @@ async def get_student_fee_payments(
     logger.info(f"[SCHOOL:{school_id}] [ADMIN:{admin_email}] Fetching payments for student {student_id}")
     
     try:
-        payments = get_fee_payments_for_student(student_id)
+        payments = get_fee_payments_for_student(student_id, skip=skip, limit=limit)
         logger.info(f"[SCHOOL:{school_id}] ✅ Retrieved {len(payments)} payments for student")
         return [convert_objectids(payment) for payment in payments]
     except Exception as e:
@@ -137,6 +187,8 @@ async def get_student_fee_payments(
 @router.get("/class/{class_id}", response_model=List[dict])
 async def get_class_fee_payments(
     class_id: str,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=1000),
     current_user: dict = Depends(check_permission("fees.view"))
 ):
     """Get all fee payments for a class"""
@@ -145,7 +197,7 @@ async def get_class_fee_payments(
     logger.info(f"[SCHOOL:{school_id}] [ADMIN:{admin_email}] Fetching payments for class {class_id}")
     
     try:
-        payments = get_fee_payments_for_class(class_id)
+        payments = get_fee_payments_for_class(class_id, skip=skip, limit=limit)
         logger.info(f"[SCHOOL:{school_id}] ✅ Retrieved {len(payments)} payments for class")
         return [convert_objectids(payment) for payment in payments]
     except Exception as e:
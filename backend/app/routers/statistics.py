@@ -7,7 +7,8 @@ import logging
 from app.services.fee_statistics_service import (
     get_fee_collection_stats,
     get_payment_method_breakdown,
-    get_daily_collections
+    get_daily_collections,
+    get_dashboard_stats
 )
 from app.dependencies.auth import check_permission
 
@@ -82,3 +83,26 @@ async def get_daily_collections_history(
     except Exception as e:
         logger.error(f"[STATISTICS] ❌ Failed to get collections: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to retrieve collections")
+
+
+@router.get("/dashboard")
+async def get_dashboard_statistics(
+    days: int = 30,
+    current_user: dict = Depends(check_permission("fees.view"))
+):
+    """
+    Fee collection stats, payment method breakdown and daily collections
+    in one response, for loading the accountant dashboard
+    """
+    school_id = current_user.get("school_id")
+    email = current_user.get("email")
+    
+    logger.info(f"[STATISTICS] User {email} requesting dashboard stats for {days} days")
+    
+    try:
+        dashboard = get_dashboard_stats(school_id, days)
+        logger.info(f"[STATISTICS] ✅ Retrieved dashboard stats")
+        return dashboard
+    except Exception as e:
+        logger.error(f"[STATISTICS] ❌ Failed to get dashboard stats: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to retrieve dashboard statistics")
@@ -488,6 +488,7 @@ async def _run_import_background(import_id: str, user_email: str, school_id: str
             db,
             school_id,
             zip_path,
+            asyncio.get_running_loop(),
         )
 
         all_errors = log.get("errors", []) + exec_errors
@@ -529,7 +530,8 @@ async def _run_import_background(import_id: str, user_email: str, school_id: str
             embedding_count = 0
             for student in newly_imported:
                 try:
-                    embedding, status = EmbeddingGenerator.generate_embedding_from_url(
+                    embedding, status = await asyncio.to_thread(
+                        EmbeddingGenerator.generate_embedding_from_url,
                         student.get("profile_image_url"),
                         student.get("student_id")
                     )
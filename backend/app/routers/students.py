@@ -19,6 +19,7 @@ import asyncio
 from app.database import get_db
 from bson import ObjectId
 from app.utils.validators import is_valid_pk_phone
+from app.utils.embeddings import embedding_as_list
 from io import BytesIO
 from app.services.admission_form_service import generate_admission_pdf
 
@@ -778,7 +779,7 @@ async def get_students_with_embeddings(
                 "student_id": student.get("student_id"),
                 "full_name": student.get("full_name"),
                 "class_id": student.get("class_id"),
-                "embedding": student.get("face_embedding"),
+                "embedding": embedding_as_list(student.get("face_embedding")),
                 "embedding_model": student.get("embedding_model"),
                 "embedding_generated_at": student.get("embedding_generated_at")
             })
@@ -0,0 +1,36 @@
+"""
+One-off migration: dedupe same-day attendance records and create the unique
+(school, person, date) attendance indexes in every school database.
+Safe to re-run; new school databases get the indexes on creation.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from app.services.saas_db import get_all_school_databases, get_school_database
+from app.utils.indexes import ensure_daily_attendance_indexes
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def migrate_daily_attendance_indexes() -> int:
+    """Returns the number of school databases that could not be migrated"""
+    failed = 0
+    for database_name in get_all_school_databases():
+        try:
+            ensure_daily_attendance_indexes(get_school_database(database_name))
+            logger.info(f"✅ Daily attendance indexes ensured: {database_name}")
+        except Exception as e:
+            failed += 1
+            logger.error(f"❌ Failed to migrate {database_name}: {e}")
+    return failed
+
+
+if __name__ == "__main__":
+    failed = migrate_daily_attendance_indexes()
+    if failed:
+        logger.error(f"\n❌ {failed} school database(s) failed; fix and re-run")
+        sys.exit(1)
+    logger.info("\n✅ SUCCESS: Daily attendance indexes created in every school database")
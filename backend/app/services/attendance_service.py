@@ -2,6 +2,7 @@ from app.database import get_db
 from datetime import datetime
 from typing import Optional, List, Dict
 from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError
 import logging
 
 logger = logging.getLogger(__name__)
@@ -28,29 +29,32 @@ def create_attendance(school_id: str, class_id: str, student_id: str, date: str,
         "updated_at": datetime.utcnow(),
     }
     
+    key = {
+        "school_id": school_id,
+        "class_id": class_id,
+        "student_id": student_id,
+        "date": date
+    }
+    
     try:
         # UPSERT: Update if exists, create if doesn't
-        result = db.attendance.update_one(
-            {
-                "school_id": school_id,
-                "class_id": class_id,
-                "student_id": student_id,
-                "date": date
-            },
-            {
-                "$set": attendance,
-                "$setOnInsert": {"created_at": datetime.utcnow()}
-            },
-            upsert=True
-        )
+        try:
+            db.attendance.update_one(
+                key,
+                {
+                    "$set": attendance,
+                    "$setOnInsert": {"created_at": datetime.utcnow()}
+                },
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # The student already has a record for this day under another
+            # class (unique school/student/date index): update that record
+            key.pop("class_id")
+            db.attendance.update_one(key, {"$set": attendance})
         
         # Fetch the document to return it
-        record = db.attendance.find_one({
-            "school_id": school_id,
-            "class_id": class_id,
-            "student_id": student_id,
-            "date": date
-        })
+        record = db.attendance.find_one(key)
         
         if record:
             record["id"] = str(record["_id"])
@@ -272,11 +272,15 @@ def execute_import_with_images(
     duplicate_action: str,
     db,
     school_id: str,
-    zip_path: Optional[str] = None
+    zip_path: Optional[str] = None,
+    loop: Optional[asyncio.AbstractEventLoop] = None
 ) -> Tuple[int, int, List[Dict]]:
     """
     Execute import with TRANSACTION support - ALL OR NOTHING.
     
+    `loop` is the caller's event loop when this runs in a worker thread;
+    post-import face enrollment is scheduled onto it.
+    
     If ANY student fails:
     - Rollback all students
     - Rollback all auto-created classes
@@ -429,7 +433,7 @@ def execute_import_with_images(
         logger.info(f"[BULK] Import completed: {len(created_student_ids)} created, {update_count} updated")
         
         # Trigger face enrollment for students with images (non-blocking)
-        _trigger_bulk_face_enrollment(db, created_student_ids, school_id)
+        _trigger_bulk_face_enrollment(db, created_student_ids, school_id, loop)
         
         return total_success, 0, []
         
@@ -580,10 +584,19 @@ def _get_friendly_error_message(error_msg: str, student_name: str, row: Dict) ->
     return f"Student \"{student_name}\" could not be imported. Please check the data and try again."
 
 
-def _trigger_bulk_face_enrollment(db, student_ids: List[str], school_id: str):
+def _trigger_bulk_face_enrollment(
+    db,
+    student_ids: List[str],
+    school_id: str,
+    loop: Optional[asyncio.AbstractEventLoop] = None
+):
     """
     Trigger face enrollment for all newly imported students with images.
     Runs asynchronously in background - does not block import process.
+    
+    The import itself runs in a worker thread, so enrollment is handed to the
+    application event loop (`loop`) as a single enroll_many batch. Local
+    embeddings for these students are left "pending" for the embedding job.
     """
     if not student_ids:
         return
@@ -603,64 +616,56 @@ def _trigger_bulk_face_enrollment(db, student_ids: List[str], school_id: str):
             "profile_image_type": 1
         }))
         
-        if not students_with_images:
+        persons = [
+            {
+                "person_id": student["student_id"],
+                "name": student.get("full_name", "Unknown"),
+                "role": "student",
+                "image_blob": student["profile_image_blob"],
+                "image_type": student.get("profile_image_type", "image/jpeg"),
+            }
+            for student in students_with_images
+            if student.get("student_id") and student.get("profile_image_blob")
+        ]
+        
+        if not persons:
             logger.info("[BULK] No students with images to enroll")
             return
         
-        logger.info(f"[BULK] Triggering face enrollment for {len(students_with_images)} students")
+        logger.info(f"[BULK] Triggering face enrollment for {len(persons)} students")
         
-        # Process each student in background
-        enrollment_service = FaceEnrollmentService()
-        success_count = 0
-        failed_count = 0
-        
-        for student in students_with_images:
+        if loop is not None and loop.is_running():
+            loop.call_soon_threadsafe(
+                FaceEnrollmentService.enroll_in_background, _enroll_and_log(persons, school_id)
+            )
+        else:
             try:
-                student_id = student.get("student_id")
-                full_name = student.get("full_name", "Unknown")
-                image_blob = student.get("profile_image_blob")
-                image_type = student.get("profile_image_type", "image/jpeg")
-                
-                if not student_id or not image_blob:
-                    continue
-                
-                # Enroll to external face recognition app
-                enrollment_service.enroll_person(
-                    person_id=student_id,
-                    name=full_name,
-                    role="student",
-                    image_blob=image_blob,
-                    image_type=image_type,
-                    school_id=school_id  # Pass school_id for unique ID
+                asyncio.get_running_loop()
+            except RuntimeError:
+                # No application loop to hand off to. The face app client and
+                # semaphore are bound to the app loop, so a temporary
+                # asyncio.run() loop would break them; skip enrollment instead.
+                logger.warning(
+                    f"[BULK] No event loop available, skipped face enrollment for {len(persons)} students"
                 )
-                
-                # Generate internal embedding
-                asyncio.create_task(
-                    enrollment_service.generate_embedding_for_person(
-                        person_id=student_id,
-                        name=full_name,
-                        role="student",
-                        image_base64=image_blob,
-                        image_type=image_type,
-                        db=db
-                    )
-                )
-                
-                success_count += 1
-                logger.info(f"[BULK] Face enrolled: {student_id} - {full_name}")
-                
-            except Exception as e:
-                failed_count += 1
-                logger.warning(f"[BULK] Face enrollment failed for {student.get('student_id')}: {str(e)}")
-                # Continue with other students - don't fail the entire batch
-        
-        logger.info(f"[BULK] Face enrollment completed: {success_count} success, {failed_count} failed")
+            else:
+                FaceEnrollmentService.enroll_in_background(_enroll_and_log(persons, school_id))
         
     except Exception as e:
         logger.exception(f"[BULK] Error during bulk face enrollment: {str(e)}")
         # Don't raise - this is background processing
 
 
+async def _enroll_and_log(persons: List[Dict], school_id: str):
+    """Run enroll_many and log the aggregate outcome."""
+    try:
+        results = await FaceEnrollmentService.enroll_many(persons, school_id=school_id)
+        success_count = sum(1 for r in results if r.get("success"))
+        logger.info(f"[BULK] Face enrollment completed: {success_count} success, {len(results) - success_count} failed")
+    except Exception as e:
+        logger.exception(f"[BULK] Error during bulk face enrollment: {str(e)}")
+
+
 # ---------------------------------------------------------------------------
 # Legacy function for compatibility
 # ---------------------------------------------------------------------------
@@ -669,10 +674,13 @@ def process_bulk_import_with_images(
     valid_rows: List[Dict],
     zip_path: Optional[str],
     school_id: str,
-    db
+    db,
+    loop: Optional[asyncio.AbstractEventLoop] = None
 ) -> Tuple[int, int, List[Dict], int, int]:
     """
     Legacy wrapper - redirects to new transaction-based import.
+    Pass the application event loop as `loop` when calling from a worker
+    thread; without one, face enrollment of the imported students is skipped.
     """
     success, fail, errors = execute_import_with_images(
         valid_rows,
@@ -680,6 +688,7 @@ def process_bulk_import_with_images(
         "skip",
         db,
         school_id,
-        zip_path
+        zip_path,
+        loop
     )
     return success, fail, errors, 0, 0
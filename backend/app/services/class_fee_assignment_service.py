@@ -4,6 +4,11 @@ from typing import Optional, List
 from bson.objectid import ObjectId
 from bson import ObjectId as BsonObjectId
 from app.services import chalan as chalan_service
+from app.services.fee_category_service import get_category_total
+from app.services.student_fee_summary_service import refresh_class_fee_summaries
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 def _normalize_doc(doc: dict) -> dict:
@@ -27,6 +32,13 @@ def _normalize_doc(doc: dict) -> dict:
 
     return normalized
 
+def _refresh_class_summaries_quietly(class_ids: List[str], school_id: Optional[str] = None) -> None:
+    """Recompute the fee summary rows of the classes' students; never fails the assignment write"""
+    try:
+        refresh_class_fee_summaries(class_ids, school_id)
+    except Exception as e:
+        logger.error(f"[FEE SUMMARY] Failed to refresh summaries for classes {class_ids}: {str(e)}")
+
 # ================= Class Fee Assignment Operations =================
 
 def assign_fee_category_to_class(
@@ -49,6 +61,8 @@ def assign_fee_category_to_class(
         "school_id": school_id,
         "class_id": class_id,
         "category_id": category_id,
+        # Denormalized category total; update_fee_category keeps it current
+        "expected_fee": get_category_total(category_id, school_id, db),
         "assigned_by": assigned_by,
         "assigned_at": datetime.utcnow(),
         "is_active": True,
@@ -70,7 +84,7 @@ def assign_fee_category_to_class(
                     "class_id": class_id, 
                     "school_id": school_id,
                     "status": {"$in": ["pending", "unpaid"]}
-                }))
+                }, {"_id": 1, "paid_amount": 1, "paid": 1}))
                 for ch in existing:
                     paid = ch.get("paid_amount", ch.get("paid", 0)) or 0
                     new_total = snapshot.get("total_amount", 0)
@@ -92,6 +106,7 @@ def assign_fee_category_to_class(
             # log and continue; assignment succeeded but applying to existing may have partial failures
             print("Error applying category to existing challans:", e)
 
+    _refresh_class_summaries_quietly([class_id], school_id)
     return _normalize_doc(assignment)
 
 def get_active_category_for_class(class_id: str) -> Optional[dict]:
@@ -142,18 +157,17 @@ def update_class_fee_assignment(assignment_id: str, category_id: str, assigned_b
     except:
         return None
     
-    assignment = db.class_fee_assignments.find_one({"_id": oid})
+    # Deactivate old assignment, reading its class in the same round trip
+    assignment = db.class_fee_assignments.find_one_and_update(
+        {"_id": oid},
+        {"$set": {"is_active": False, "deactivated_at": datetime.utcnow()}},
+        projection={"class_id": 1}
+    )
     if not assignment:
         return None
     
     class_id = assignment.get("class_id")
     
-    # Deactivate old assignment
-    db.class_fee_assignments.update_one(
-        {"_id": oid},
-        {"$set": {"is_active": False, "deactivated_at": datetime.utcnow()}}
-    )
-    
     # Create new assignment
     return assign_fee_category_to_class(class_id, category_id, assigned_by)
 
@@ -166,4 +180,6 @@ def remove_fee_category_from_class(class_id: str) -> bool:
         {"$set": {"is_active": False, "deactivated_at": datetime.utcnow()}}
     )
     
+    if result.modified_count > 0:
+        _refresh_class_summaries_quietly([class_id])
     return result.modified_count > 0
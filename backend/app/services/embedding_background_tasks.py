@@ -87,7 +87,7 @@ class EmbeddingBackgroundTask:
             
             # Generate embedding
             logger.info(f"🧠 [BG-EMBEDDING] Generating embedding for {reg_id}...")
-            embedding, status = EmbeddingGenerator.generate_embedding_from_image(pil_image)
+            embedding, status = await asyncio.to_thread(EmbeddingGenerator.generate_embedding_from_image, pil_image)
             
             if status == "generated" and embedding:
                 # Successfully generated embedding
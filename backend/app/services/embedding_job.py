@@ -107,7 +107,7 @@ class BackgroundEmbeddingService:
                         continue
                     
                     # Generate embedding
-                    embedding, status = EmbeddingGenerator.generate_embedding_from_image(pil_image)
+                    embedding, status = await asyncio.to_thread(EmbeddingGenerator.generate_embedding_from_image, pil_image)
                     
                     if status == "generated" and embedding:
                         # Update student with embedding
@@ -224,7 +224,7 @@ class BackgroundEmbeddingService:
                         continue
                     
                     # Generate embedding
-                    embedding, status = EmbeddingGenerator.generate_embedding_from_image(pil_image)
+                    embedding, status = await asyncio.to_thread(EmbeddingGenerator.generate_embedding_from_image, pil_image)
                     
                     if status == "generated" and embedding:
                         # Update student with embedding
@@ -383,7 +383,7 @@ class BackgroundEmbeddingService:
                 return False
             
             # Generate embedding
-            embedding, status = EmbeddingGenerator.generate_embedding_from_image(pil_image)
+            embedding, status = await asyncio.to_thread(EmbeddingGenerator.generate_embedding_from_image, pil_image)
             
             if status == "generated" and embedding:
                 # Update student with embedding
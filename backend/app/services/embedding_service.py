@@ -11,11 +11,12 @@ Optimized for deployment with <0.5GB RAM usage.
 """
 import numpy as np
 import logging
-from typing import Optional, Tuple, List
+from typing import Optional, Tuple, List, Union
 from PIL import Image
 import io
 import requests
 import os
+import threading
 
 logger = logging.getLogger(__name__)
 
@@ -101,6 +102,26 @@ def _download_model(url: str, path: str) -> bool:
                 return False
 
 
+def _session_options(ort, optimized: bool = False):
+    """
+    CPU session options: full graph fusion (Conv+BN+ReLU etc.), sequential
+    execution for this single-chain model, memory arena and pattern reuse.
+    Threads default to 2 for small dynos; override with ONNX_INTRA_OP_THREADS.
+    """
+    sess_options = ort.SessionOptions()
+    sess_options.intra_op_num_threads = int(os.getenv("ONNX_INTRA_OP_THREADS", "2"))
+    sess_options.inter_op_num_threads = 1
+    sess_options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    sess_options.enable_cpu_mem_arena = True
+    sess_options.enable_mem_pattern = True
+    # An already-optimized graph only needs loading, not re-fusing
+    sess_options.graph_optimization_level = (
+        ort.GraphOptimizationLevel.ORT_DISABLE_ALL if optimized
+        else ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    )
+    return sess_options
+
+
 def _init_arcface() -> bool:
     """
     Lazily initialize ArcFace ResNet100 ONNX model.
@@ -119,14 +140,9 @@ def _init_arcface() -> bool:
     try:
         import onnxruntime as ort
         
-        # Set ONNX Runtime options for CPU optimization
-        sess_options = ort.SessionOptions()
-        sess_options.intra_op_num_threads = 2  # Limit threads for Heroku
-        sess_options.inter_op_num_threads = 2
-        sess_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
-        
-        # Model path
+        # Model path (plus the graph-optimized copy ORT writes on first load)
         model_path = os.path.join(_MODEL_DIR, "arcface_resnet100.onnx")
+        optimized_path = os.path.join(_MODEL_DIR, "arcface_resnet100.opt.onnx")
         
         # Download model if not exists
         if not os.path.exists(model_path):
@@ -137,13 +153,27 @@ def _init_arcface() -> bool:
                     logger.error("Failed to download face model")
                     return False
         
-        # Load ONNX model
+        # Load ONNX model; reuse the pre-fused graph from a previous start if present
         logger.info(f"📦 Loading ArcFace ResNet100 ONNX model...")
-        _ONNX_SESSION = ort.InferenceSession(
-            model_path,
-            sess_options=sess_options,
-            providers=['CPUExecutionProvider']
-        )
+        _ONNX_SESSION = None
+        if os.path.exists(optimized_path) and os.path.getmtime(optimized_path) >= os.path.getmtime(model_path):
+            try:
+                _ONNX_SESSION = ort.InferenceSession(
+                    optimized_path,
+                    sess_options=_session_options(ort, optimized=True),
+                    providers=['CPUExecutionProvider']
+                )
+            except Exception as e:
+                logger.warning(f"Optimized ONNX model unusable, rebuilding: {e}")
+                os.remove(optimized_path)
+        if _ONNX_SESSION is None:
+            sess_options = _session_options(ort)
+            sess_options.optimized_model_filepath = optimized_path
+            _ONNX_SESSION = ort.InferenceSession(
+                model_path,
+                sess_options=sess_options,
+                providers=['CPUExecutionProvider']
+            )
         
         # Log model info
         input_info = _ONNX_SESSION.get_inputs()[0]
@@ -160,6 +190,36 @@ def _init_arcface() -> bool:
         return False
 
 
+# Per-thread IO binding: embeddings are generated from worker threads, so each
+# thread gets its own preallocated input buffer bound to the session
+_thread_io = threading.local()
+_INPUT_SHAPE = (1, 3, 112, 112)
+
+
+def _get_io_binding():
+    """Return this thread's (input_buffer, io_binding) for _ONNX_SESSION"""
+    state = getattr(_thread_io, "state", None)
+    if state is None:
+        input_buf = np.empty(_INPUT_SHAPE, dtype=np.float32)
+        io_binding = _ONNX_SESSION.io_binding()
+        io_binding.bind_input(
+            name=_ONNX_SESSION.get_inputs()[0].name,
+            device_type="cpu",
+            device_id=0,
+            element_type=np.float32,
+            shape=input_buf.shape,
+            buffer_ptr=input_buf.ctypes.data
+        )
+        io_binding.bind_output(_ONNX_SESSION.get_outputs()[0].name, device_type="cpu")
+        state = _thread_io.state = (input_buf, io_binding)
+    return state
+
+
+def _supports_batch() -> bool:
+    """True if the loaded model has a dynamic batch dimension"""
+    return not isinstance(_ONNX_SESSION.get_inputs()[0].shape[0], int)
+
+
 class FaceDetectionError(Exception):
     """Raised when face detection fails"""
     pass
@@ -253,19 +313,19 @@ class EmbeddingGenerator:
             return None
     
     @staticmethod
-    def detect_and_crop_face(pil_image: Image.Image) -> Optional[Image.Image]:
+    def detect_and_crop_face(pil_image: Union[Image.Image, np.ndarray]) -> Optional[Image.Image]:
         """
         Detect face in image and return cropped face.
         
         Args:
-            pil_image: PIL Image object
+            pil_image: PIL Image object, or an already-decoded RGB array
             
         Returns:
             Cropped face image or None if no face detected
         """
         try:
-            # Convert PIL to numpy array
-            image_array = np.array(pil_image)
+            # Convert PIL to numpy array (decoded arrays are used as-is)
+            image_array = pil_image if isinstance(pil_image, np.ndarray) else np.array(pil_image)
             
             # Ensure 3-channel RGB image
             if len(image_array.shape) == 2:  # Grayscale
@@ -291,6 +351,8 @@ class EmbeddingGenerator:
             
             # No face detected - use full image (let model handle it)
             logger.warning("No face detected, using full image")
+            if isinstance(pil_image, np.ndarray):
+                return Image.fromarray(image_array.astype("uint8"))
             return pil_image
             
         except Exception as e:
@@ -327,6 +389,18 @@ class EmbeddingGenerator:
         
         return img_array.astype(np.float32)
     
+    @staticmethod
+    def _preprocess_into(face_image: Image.Image, out: np.ndarray) -> None:
+        """Same as _preprocess_for_onnx, but writes NCHW pixels into `out` in place"""
+        if face_image.mode != 'RGB':
+            face_image = face_image.convert('RGB')
+        face_image = face_image.resize((112, 112), Image.Resampling.LANCZOS)
+        
+        # HWC uint8 -> CHW float32 in [-1, 1], no intermediate arrays
+        chw = np.asarray(face_image).transpose(2, 0, 1)
+        np.subtract(chw, 127.5, out=out[0])
+        out[0] *= 1.0 / 127.5
+    
     @staticmethod
     def generate_embedding(cropped_face: Image.Image) -> Optional[list]:
         """
@@ -343,17 +417,15 @@ class EmbeddingGenerator:
             return None
         
         try:
-            # Preprocess image for ONNX inference
-            input_tensor = EmbeddingGenerator._preprocess_for_onnx(cropped_face)
-            
-            # Get input name from model
-            input_name = _ONNX_SESSION.get_inputs()[0].name
+            # Preprocess straight into the bound input buffer (no input copy in ORT)
+            input_buf, io_binding = _get_io_binding()
+            EmbeddingGenerator._preprocess_into(cropped_face, input_buf)
             
             # Run ONNX inference
-            outputs = _ONNX_SESSION.run(None, {input_name: input_tensor})
+            _ONNX_SESSION.run_with_iobinding(io_binding)
             
             # Get embedding from output
-            embedding = outputs[0].flatten().astype(np.float32)
+            embedding = io_binding.copy_outputs_to_cpu()[0].flatten().astype(np.float32)
             
             # Normalize embedding
             return EmbeddingGenerator.normalize_embedding(embedding)
@@ -363,12 +435,52 @@ class EmbeddingGenerator:
             return None
     
     @staticmethod
-    def generate_embedding_from_image(pil_image: Image.Image) -> Tuple[Optional[list], str]:
+    def generate_embeddings_batch(cropped_faces: List[Image.Image]) -> List[Optional[np.ndarray]]:
+        """
+        Generate embeddings for several cropped faces with one ONNX run.
+        
+        Args:
+            cropped_faces: PIL Images of cropped faces
+            
+        Returns:
+            One normalized float32 embedding (or None) per input face, in order
+        """
+        if not cropped_faces:
+            return []
+        if not _init_arcface():
+            logger.error("ArcFace ResNet100 ONNX not available for embedding generation")
+            return [None] * len(cropped_faces)
+        
+        # Models exported with a fixed batch of 1 can only be run face by face
+        if len(cropped_faces) == 1 or not _supports_batch():
+            embeddings = [EmbeddingGenerator.generate_embedding(face) for face in cropped_faces]
+            return [None if e is None else np.asarray(e, dtype=np.float32) for e in embeddings]
+        
+        try:
+            batch = np.empty((len(cropped_faces),) + _INPUT_SHAPE[1:], dtype=np.float32)
+            for i, face in enumerate(cropped_faces):
+                EmbeddingGenerator._preprocess_into(face, batch[i:i + 1])
+            
+            output = _ONNX_SESSION.run(None, {_ONNX_SESSION.get_inputs()[0].name: batch})[0]
+            output = output.reshape(len(cropped_faces), -1).astype(np.float32)
+            
+            # Row-wise L2 normalization
+            norms = np.linalg.norm(output, axis=1, keepdims=True)
+            output /= np.maximum(norms, 1e-12)
+            return list(output)
+            
+        except Exception as e:
+            logger.error(f"Batch embedding generation error: {str(e)}")
+            return [None] * len(cropped_faces)
+    
+    @staticmethod
+    def generate_embedding_from_image(pil_image: Union[Image.Image, np.ndarray]) -> Tuple[Optional[list], str]:
         """
         Complete pipeline: detect face, crop, and generate embedding.
         
         Args:
-            pil_image: PIL Image object
+            pil_image: PIL Image object, or an RGB numpy array (e.g. from
+                ImageService.decode_for_embedding)
             
         Returns:
             Tuple of (embedding, status) where status is "generated" or "failed"
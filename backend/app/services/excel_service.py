@@ -9,23 +9,45 @@ Handles:
 - Formula stripping for security
 """
 
+import os
 import re
+import tempfile
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, islice
 from io import BytesIO
 from datetime import datetime
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, Tuple, Optional, Iterable, Iterator
 from app.utils.validators import is_valid_pk_phone
 
 import openpyxl
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, NamedStyle
+from openpyxl.utils import get_column_letter
 from app.utils.student_id_utils import generate_imported_student_id, validate_student_id_uniqueness
 from app.utils.validators import normalize_phone
 
+try:
+    from python_calamine import CalamineWorkbook
+    CALAMINE_AVAILABLE = True
+except ImportError:
+    CALAMINE_AVAILABLE = False
+
 # ---------------------------------------------------------------------------
 # Constants
 # ---------------------------------------------------------------------------
 
 MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB
+SPILL_TO_DISK_THRESHOLD = 2 * 1024 * 1024  # uploads above this are parsed from a temp file
+PARALLEL_VALIDATION_THRESHOLD = 5000  # data rows above this are validated in a process pool
+VALIDATION_CHUNK_SIZE = 5000
+VALIDATION_WORKERS = max(1, os.cpu_count() or 1)
 
 TEMPLATE_COLUMNS = [
     # Required columns (must appear first in template)
@@ -100,6 +122,9 @@ EXAMPLE_ROW = [
     "ali_ahmed.jpg",
 ]
 
+# (column letter, width) pairs, computed once at import time
+_TEMPLATE_WIDTHS = [(get_column_letter(i), max(len(n) + 4, 14)) for i, n in enumerate(TEMPLATE_COLUMNS, start=1)]
+
 GENDER_MAP: Dict[str, str] = {
     "m": "Male",
     "male": "Male",
@@ -116,16 +141,17 @@ GENDER_MAP: Dict[str, str] = {
 # ---------------------------------------------------------------------------
 
 _FORMULA_RE = re.compile(r"^[\s]*[=+\-@]")
+# BOM, zero-width chars, etc.
+_INVISIBLE_CHARS = dict.fromkeys(map(ord, "\u200b\ufeff\u200c\u200d"))
 
 
 def _sanitize_cell(value: Any) -> Any:
     """Strip leading formula characters to prevent CSV/Excel injection."""
-    if isinstance(value, str):
-        value = value.strip()
-        # Remove BOM, zero-width chars, etc.
-        value = value.replace("\u200b", "").replace("\ufeff", "").replace("\u200c", "").replace("\u200d", "")
-        if _FORMULA_RE.match(value):
-            value = "'" + value  # Excel will display without formula execution
+    if not value or not isinstance(value, str):
+        return value
+    value = value.strip().translate(_INVISIBLE_CHARS)
+    if _FORMULA_RE.match(value):
+        value = "'" + value  # Excel will display without formula execution
     return value
 
 
@@ -152,8 +178,9 @@ def generate_sample_template() -> bytes:
     ws.title = "TEMPLATE"
 
     for col_idx, col_name in enumerate(TEMPLATE_COLUMNS, start=1):
-        cell = ws.cell(row=1, column=col_idx, value=col_name)
-        ws.column_dimensions[cell.column_letter].width = max(len(col_name) + 4, 14)
+        ws.cell(row=1, column=col_idx, value=col_name)
+    for letter, width in _TEMPLATE_WIDTHS:
+        ws.column_dimensions[letter].width = width
 
     # Example row (simple, no styling). Dates shown in DD/MM/YYYY as requested.
     for col_idx, val in enumerate(EXAMPLE_ROW, start=1):
@@ -181,14 +208,15 @@ def generate_sample_template() -> bytes:
 # ---------------------------------------------------------------------------
 
 
-def _normalize_gender(raw: str) -> str:
-    """Normalize gender value; raise ValueError if invalid."""
+def _normalize_gender_safe(raw: str) -> Tuple[Optional[str], Optional[str]]:
+    """Normalize gender value. Returns (value, error_message); exactly one is None."""
     key = raw.strip().lower()
-    if key in GENDER_MAP:
-        return GENDER_MAP[key]
+    gender = GENDER_MAP.get(key)
+    if gender is not None:
+        return gender, None
     if not key:
-        return ""
-    raise ValueError(f"Invalid gender value: '{raw}'. Expected Male/Female/Other")
+        return "", None
+    return None, f"Invalid gender value: '{raw}'. Expected Male/Female/Other"
 
 
 def _validate_date(raw: str, col_name: str) -> str:
@@ -272,11 +300,263 @@ def parse_and_validate_rows(xlsx_bytes: bytes) -> Dict[str, Any]:
         "duplicate_ids": set,
     }
     No DB access here — pure data validation.
+
+    Uploads larger than SPILL_TO_DISK_THRESHOLD are written to a temp file
+    first so the reader works from disk rather than an in-memory BytesIO copy.
+    Rows are read with python-calamine when installed, otherwise openpyxl.
     """
-    wb = openpyxl.load_workbook(filename=BytesIO(xlsx_bytes), read_only=True, data_only=True)
-    ws = wb.active
+    spill_path: Optional[str] = None
+    if len(xlsx_bytes) > SPILL_TO_DISK_THRESHOLD:
+        with tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False) as tf:
+            tf.write(xlsx_bytes)
+            spill_path = tf.name
+
+    try:
+        if CALAMINE_AVAILABLE:
+            if spill_path:
+                cwb = CalamineWorkbook.from_path(spill_path)
+            else:
+                cwb = CalamineWorkbook.from_filelike(BytesIO(xlsx_bytes))
+            try:
+                sheet = cwb.get_sheet_by_index(0)
+                # Keep leading blank rows/columns so indices match openpyxl
+                return _validate_rows(_calamine_rows(sheet.to_python(skip_empty_area=False)))
+            finally:
+                cwb.close()
+
+        wb = openpyxl.load_workbook(filename=spill_path or BytesIO(xlsx_bytes), read_only=True, data_only=True)
+        try:
+            return _validate_rows(wb.active.iter_rows(values_only=True))
+        finally:
+            wb.close()
+    finally:
+        if spill_path:
+            try:
+                os.unlink(spill_path)
+            except OSError:
+                pass
+
+
+def _calamine_rows(rows: List[list]) -> Iterator[tuple]:
+    """Yield calamine rows as tuples shaped like openpyxl's values_only output.
+
+    Calamine reports every numeric cell as float and blanks as "", whereas
+    openpyxl yields int for whole numbers and None for blanks; roll and
+    registration numbers depend on the int form ("101", not "101.0").
+    """
+    for row in rows:
+        yield tuple(
+            None if c == "" else int(c) if isinstance(c, float) and c.is_integer() else c
+            for c in row
+        )
+
+
+def _cell(row_data: tuple, col_map: Dict[str, int], key: str) -> str:
+    idx = col_map.get(key)
+    if idx is None or idx >= len(row_data) or row_data[idx] is None:
+        return ""
+    return str(_sanitize_cell(row_data[idx])).strip()
+
+
+def _is_blank_row(row_data: tuple, required_idxs: Tuple[int, ...]) -> bool:
+    """True when none of the required columns hold a non-blank value."""
+    row_len = len(row_data)
+    return not any(
+        row_data[i] not in (None, "") and not (isinstance(row_data[i], str) and not row_data[i].strip())
+        for i in required_idxs if i < row_len
+    )
+
+
+def _is_duplicate_reg(
+    registration_number: str,
+    row_num: int,
+    seen_reg_numbers: Dict[str, int],
+    duplicate_rows: List[Dict[str, Any]],
+) -> bool:
+    """Record first occurrences; report repeats (ONLY Registration_Number must be unique)."""
+    if not registration_number:
+        return False
+    first_row = seen_reg_numbers.get(registration_number)
+    if first_row is not None:
+        duplicate_rows.append({
+            "row": row_num,
+            "column": "Registration_Number",
+            "value": registration_number,
+            "reason": f"This Registration Number appears more than once in your file (duplicate of row {first_row})",
+            "status": "skipped",
+        })
+        return True
+    seen_reg_numbers[registration_number] = row_num
+    return False
+
+
+def _validate_row(
+    row_data: tuple, row_num: int, col_map: Dict[str, int]
+) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Validate one non-blank row. Returns (row_errors, normalized_row or None)."""
+    row_errors: List[Dict[str, Any]] = []
+
+    # Get values using new column names
+    full_name = _cell(row_data, col_map, "name")
+    roll_number = _cell(row_data, col_map, "roll_number")
+    registration_number = _cell(row_data, col_map, "registration_number")
+    class_val = _cell(row_data, col_map, "class")
+    section = _cell(row_data, col_map, "section")  # Now optional
+    gender_raw = _cell(row_data, col_map, "gender")
+    dob_raw = _cell(row_data, col_map, "date_of_birth")
+    father_name = _cell(row_data, col_map, "father_name")
+    father_cnic = _cell(row_data, col_map, "father_cnic")
+    parent_contact = _cell(row_data, col_map, "parent_contact")
+    address = _cell(row_data, col_map, "address")
+    admission_date_raw = _cell(row_data, col_map, "admission_date")
+    image_name = _cell(row_data, col_map, "image_name")
+
+    # Required field checks (only 4 required now). A row missing any of them
+    # is rejected without running the gender/date validators.
+    missing = [
+        (column, reason)
+        for column, value, reason in (
+            ("Name", full_name, "Name is required"),
+            ("Roll_Number", roll_number, "Roll Number is required"),
+            ("Registration_Number", registration_number, "Registration Number is required"),
+            ("Class", class_val, "Class is required"),
+        )
+        if not value
+    ]
+    if missing:
+        return [
+            {"row": row_num, "column": column, "value": "", "reason": reason, "status": "skipped"}
+            for column, reason in missing
+        ], None
+
+    # Gender normalization
+    gender = ""
+    if gender_raw:
+        gender, gender_err = _normalize_gender_safe(gender_raw)
+        if gender_err:
+            row_errors.append({"row": row_num, "column": "Gender", "value": gender_raw, "reason": gender_err})
+
+    # Date validation
+    dob = ""
+    if dob_raw:
+        try:
+            dob = _validate_date(dob_raw, "Date_of_Birth")
+        except ValueError as e:
+            row_errors.append({"row": row_num, "column": "Date_of_Birth", "value": dob_raw, "reason": str(e)})
+
+    admission_date = ""
+    if admission_date_raw:
+        try:
+            admission_date = _validate_date(admission_date_raw, "Admission_Date")
+        except ValueError as e:
+            row_errors.append({"row": row_num, "column": "Admission_Date", "value": admission_date_raw, "reason": str(e)})
+
+    if row_errors:
+        return row_errors, None
+
+    # Validate phone / parent contact format if provided
+    if parent_contact:
+        if not is_valid_pk_phone(parent_contact):
+            row_errors.append({
+                "row": row_num,
+                "column": "Parent_Contact",
+                "value": parent_contact,
+                "reason": "Parent contact must be in format 92XXXXXXXXXX",
+                "status": "skipped",
+            })
+            return row_errors, None
+
+    # Build normalized row with all data (missing fields left blank)
+    return row_errors, {
+        "row_num": row_num,
+        "registration_number": registration_number,
+        "full_name": full_name,
+        "roll_number": roll_number,
+        "class_id": class_val,
+        "section": section or "",  # Optional now
+        "gender": gender or "",
+        "date_of_birth": dob or "",
+        "father_name": father_name or "",
+        "father_cnic": father_cnic or "",
+        "parent_contact": parent_contact or "",
+        "address": address or "",
+        "admission_date": admission_date or datetime.utcnow().strftime("%Y-%m-%d"),
+        "image_name": image_name,
+    }
+
+
+def _validate_chunk(
+    col_map: Dict[str, int], start_row: int, chunk: List[tuple]
+) -> List[Tuple[int, str, List[Dict[str, Any]], Optional[Dict[str, Any]]]]:
+    """Process-pool worker: validate a slice of rows, leaving duplicate checks to the merge."""
+    required_idxs = tuple(col_map[k] for k in REQUIRED_COLUMNS if k in col_map)
+    results = []
+    for row_num, row_data in enumerate(chunk, start=start_row):
+        if _is_blank_row(row_data, required_idxs):
+            continue
+        row_errors, valid_row = _validate_row(row_data, row_num, col_map)
+        results.append((row_num, _cell(row_data, col_map, "registration_number"), row_errors, valid_row))
+    return results
 
-    rows_iter = ws.iter_rows(values_only=True)
+
+def _chunked(iterable: Iterable[tuple], size: int) -> Iterator[List[tuple]]:
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+_validation_pool: Optional[ProcessPoolExecutor] = None
+_validation_pool_lock = threading.Lock()
+
+
+def _get_validation_pool() -> ProcessPoolExecutor:
+    """Shared row validation pool, created on first large upload"""
+    global _validation_pool
+    with _validation_pool_lock:
+        if _validation_pool is None:
+            # spawn, not fork: a forked child could inherit locks held by server threads
+            _validation_pool = ProcessPoolExecutor(
+                max_workers=VALIDATION_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _validation_pool
+
+
+def shutdown_validation_pool():
+    """Stop the row validation worker processes (app shutdown)"""
+    global _validation_pool
+    with _validation_pool_lock:
+        if _validation_pool is not None:
+            _validation_pool.shutdown(wait=False, cancel_futures=True)
+            _validation_pool = None
+
+
+def _validate_chunks_in_pool(col_map: Dict[str, int], rows: Iterable[tuple]) -> Iterator[list]:
+    """
+    Validate rows in VALIDATION_CHUNK_SIZE chunks on the shared pool, yielding
+    each chunk's results in file order. Chunks are submitted as they are read,
+    with at most two per worker in flight, so the sheet is never held whole.
+    """
+    pool = _get_validation_pool()
+    pending: deque = deque()
+    try:
+        for i, chunk in enumerate(_chunked(rows, VALIDATION_CHUNK_SIZE)):
+            pending.append(pool.submit(_validate_chunk, col_map, 2 + i * VALIDATION_CHUNK_SIZE, chunk))
+            if len(pending) >= 2 * VALIDATION_WORKERS:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _validate_rows(rows: Iterable[tuple]) -> Dict[str, Any]:
+    """Validate sheet rows (header first) as yielded by the xlsx reader."""
+    rows_iter = iter(rows)
     try:
         header_row = next(rows_iter)
     except StopIteration:
@@ -300,130 +580,49 @@ def parse_and_validate_rows(xlsx_bytes: bytes) -> Dict[str, Any]:
     valid_rows: List[Dict[str, Any]] = []
     error_rows: List[Dict[str, Any]] = []
     duplicate_rows: List[Dict[str, Any]] = []
-    seen_reg_numbers: set = set()
-
-    def _cell(row_data: tuple, key: str) -> str:
-        idx = col_map.get(key)
-        if idx is None or idx >= len(row_data) or row_data[idx] is None:
-            return ""
-        return str(_sanitize_cell(row_data[idx])).strip()
-
-    for row_num, row_data in enumerate(rows_iter, start=2):
-        # Skip completely empty rows
-        if all(c is None or str(c).strip() == "" for c in row_data):
-            continue
-
-        row_errors: List[Dict[str, Any]] = []
-
-        # Get values using new column names
-        full_name = _cell(row_data, "name")
-        roll_number = _cell(row_data, "roll_number")
-        registration_number = _cell(row_data, "registration_number")
-        class_val = _cell(row_data, "class")
-        section = _cell(row_data, "section")  # Now optional
-        gender_raw = _cell(row_data, "gender")
-        dob_raw = _cell(row_data, "date_of_birth")
-        father_name = _cell(row_data, "father_name")
-        father_cnic = _cell(row_data, "father_cnic")
-        parent_contact = _cell(row_data, "parent_contact")
-        address = _cell(row_data, "address")
-        admission_date_raw = _cell(row_data, "admission_date")
-        image_name = _cell(row_data, "image_name")
-
-        # Required field checks (only 4 required now)
-        if not full_name:
-            row_errors.append({"row": row_num, "column": "Name", "value": "", "reason": "Name is required", "status": "skipped"})
-        if not roll_number:
-            row_errors.append({"row": row_num, "column": "Roll_Number", "value": "", "reason": "Roll Number is required", "status": "skipped"})
-        if not registration_number:
-            row_errors.append({"row": row_num, "column": "Registration_Number", "value": "", "reason": "Registration Number is required", "status": "skipped"})
-        if not class_val:
-            row_errors.append({"row": row_num, "column": "Class", "value": "", "reason": "Class is required", "status": "skipped"})
-
-        # Gender normalization
-        gender = ""
-        if gender_raw:
-            try:
-                gender = _normalize_gender(gender_raw)
-            except ValueError as e:
-                row_errors.append({"row": row_num, "column": "Gender", "value": gender_raw, "reason": str(e)})
-
-        # Date validation
-        dob = ""
-        if dob_raw:
-            try:
-                dob = _validate_date(dob_raw, "Date_of_Birth")
-            except ValueError as e:
-                row_errors.append({"row": row_num, "column": "Date_of_Birth", "value": dob_raw, "reason": str(e)})
-
-        admission_date = ""
-        if admission_date_raw:
-            try:
-                admission_date = _validate_date(admission_date_raw, "Admission_Date")
-            except ValueError as e:
-                row_errors.append({"row": row_num, "column": "Admission_Date", "value": admission_date_raw, "reason": str(e)})
-
-        # In-file duplicate detection: ONLY Registration_Number is required to be unique
-        is_dup = False
-        if registration_number and registration_number in seen_reg_numbers:
-            duplicate_rows.append({
-                "row": row_num,
-                "column": "Registration_Number",
-                "value": registration_number,
-                "reason": "This Registration Number appears more than once in your file",
-                "status": "skipped",
-            })
-            is_dup = True
-
-        if registration_number:
-            seen_reg_numbers.add(registration_number)
-
-        if row_errors:
-            error_rows.extend(row_errors)
-            continue
-
-        # Validate phone / parent contact format if provided
-        if parent_contact:
-            if not is_valid_pk_phone(parent_contact):
-                row_errors.append({
-                    "row": row_num,
-                    "column": "Parent_Contact",
-                    "value": parent_contact,
-                    "reason": "Parent contact must be in format 92XXXXXXXXXX",
-                    "status": "skipped",
-                })
-                error_rows.extend(row_errors)
+    seen_reg_numbers: Dict[str, int] = {}  # registration_number -> first row_num
+
+    # Buffer up to PARALLEL_VALIDATION_THRESHOLD rows (plus one to tell if
+    # there are more); only uploads larger than that pay for a process pool.
+    head = list(islice(rows_iter, PARALLEL_VALIDATION_THRESHOLD + 1))
+    if len(head) <= PARALLEL_VALIDATION_THRESHOLD:
+        # Rows with no data in any required column are skipped outright;
+        # checking just these indices avoids str() coercion on blank cells.
+        required_idxs = tuple(col_map[k] for k in REQUIRED_COLUMNS if k in col_map)
+
+        for row_num, row_data in enumerate(head, start=2):
+            if _is_blank_row(row_data, required_idxs):
                 continue
 
-        if is_dup:
-            continue
-
-        # Build normalized row with all data (missing fields left blank)
-        valid_rows.append({
-            "row_num": row_num,
-            "registration_number": registration_number,
-            "full_name": full_name,
-            "roll_number": roll_number,
-            "class_id": class_val,
-            "section": section or "",  # Optional now
-            "gender": gender or "",
-            "date_of_birth": dob or "",
-            "father_name": father_name or "",
-            "father_cnic": father_cnic or "",
-            "parent_contact": parent_contact or "",
-            "address": address or "",
-            "admission_date": admission_date or datetime.utcnow().strftime("%Y-%m-%d"),
-            "image_name": image_name,
-        })
+            # In-file duplicate detection runs first so duplicate rows skip
+            # gender/date parsing entirely.
+            registration_number = _cell(row_data, col_map, "registration_number")
+            if _is_duplicate_reg(registration_number, row_num, seen_reg_numbers, duplicate_rows):
+                continue
 
-    wb.close()
+            row_errors, valid_row = _validate_row(row_data, row_num, col_map)
+            if valid_row is not None:
+                valid_rows.append(valid_row)
+            else:
+                error_rows.extend(row_errors)
+    else:
+        # Merge in file order so cross-chunk duplicates resolve exactly
+        # as they would in the serial path.
+        for chunk_results in _validate_chunks_in_pool(col_map, chain(head, rows_iter)):
+            for row_num, registration_number, row_errors, valid_row in chunk_results:
+                if _is_duplicate_reg(registration_number, row_num, seen_reg_numbers, duplicate_rows):
+                    continue
+                if valid_row is not None:
+                    valid_rows.append(valid_row)
+                else:
+                    error_rows.extend(row_errors)
 
     return {
         "total_rows": len(valid_rows) + len(error_rows) + len(duplicate_rows),
         "valid_rows": valid_rows,
         "error_rows": error_rows,
         "duplicate_rows": duplicate_rows,
-        "duplicate_ids": seen_reg_numbers,
+        "duplicate_ids": set(seen_reg_numbers),
     }
 
 
@@ -436,19 +635,30 @@ def check_db_duplicates(valid_rows: List[Dict], db, school_id: str = None) -> Tu
     db_dups: List[Dict] = []
     existing_for_update: List[Dict] = []
 
-    for row in valid_rows:
-        reg_number = row["registration_number"]
-        generated_student_id = generate_imported_student_id(reg_number)
-
-        # Check if registration_number already exists (with school_id isolation)
-        query = {"$or": [
-            {"student_id": generated_student_id},
-            {"registration_number": reg_number}
-        ]}
-        if school_id:
-            query["school_id"] = school_id
-        
-        existing_student = db.students.find_one(query)
+    if not valid_rows:
+        return clean, db_dups, existing_for_update
+
+    reg_numbers = [row["registration_number"] for row in valid_rows]
+    generated_ids = [generate_imported_student_id(r) for r in reg_numbers]
+
+    # Single round-trip for the whole batch (with school_id isolation);
+    # both fields are indexed, so each $or branch is an index scan.
+    query: Dict[str, Any] = {"$or": [
+        {"student_id": {"$in": generated_ids}},
+        {"registration_number": {"$in": reg_numbers}},
+    ]}
+    if school_id:
+        query["school_id"] = school_id
+
+    existing_by_key: Dict[str, Dict] = {}
+    for doc in db.students.find(query, {"_id": 1, "registration_number": 1, "student_id": 1}):
+        if doc.get("registration_number"):
+            existing_by_key.setdefault(doc["registration_number"], doc)
+        if doc.get("student_id"):
+            existing_by_key.setdefault(doc["student_id"], doc)
+
+    for row, reg_number, generated_student_id in zip(valid_rows, reg_numbers, generated_ids):
+        existing_student = existing_by_key.get(generated_student_id) or existing_by_key.get(reg_number)
 
         if existing_student:
             db_dups.append({
@@ -466,21 +676,29 @@ def check_db_duplicates(valid_rows: List[Dict], db, school_id: str = None) -> Tu
 
     return clean, db_dups, existing_for_update
 
-    return clean, db_dups, existing_for_update
-
 
 # ---------------------------------------------------------------------------
 # Import Execution (transactional)
 # ---------------------------------------------------------------------------
 
 
-def build_student_doc(row: Dict) -> Dict:
-    """Convert a validated row dict into the document shape expected by create_student."""
-    now = datetime.utcnow()
+# Optional fields whose absence marks an imported student as "incomplete"
+_REQUIRED_OPTIONAL = ("section", "father_name", "father_cnic", "gender", "date_of_birth", "parent_contact", "address")
+
+
+def build_student_doc(row: Dict, now: Optional[datetime] = None, academic_year: Optional[str] = None) -> Dict:
+    """Convert a validated row dict into the document shape expected by create_student.
+
+    Batch callers pass a shared `now` / `academic_year` so they are computed
+    once per import rather than once per row.
+    """
+    if now is None:
+        now = datetime.utcnow()
+    if academic_year is None:
+        academic_year = f"{now.year}-{now.year + 1}"
     
     # Determine data completeness status
-    required_optional_fields = ["section", "father_name", "father_cnic", "gender", "date_of_birth", "parent_contact", "address"]
-    missing_fields = [f for f in required_optional_fields if not row.get(f)]
+    missing_fields = [f for f in _REQUIRED_OPTIONAL if not row.get(f)]
     data_status = "complete" if not missing_fields else "incomplete"
     
     # Generate placeholder email to avoid unique constraint issues
@@ -515,7 +733,7 @@ def build_student_doc(row: Dict) -> Dict:
         "status": "active",  # CRITICAL: Ensure imported students are active
         "data_status": data_status,
         "missing_fields": missing_fields,
-        "academic_year": f"{now.year}-{now.year + 1}",
+        "academic_year": academic_year,
         "created_at": now,
         "updated_at": now,
     }
@@ -532,15 +750,20 @@ def execute_import_transaction(
     Returns (success_count, fail_count, errors).
     All-or-nothing: if any write fails, the entire batch is rolled back.
     """
-    docs_to_insert = [build_student_doc(r) for r in rows_to_insert]
+    now = datetime.utcnow()
+    academic_year = f"{now.year}-{now.year + 1}"
+    docs_to_insert = [build_student_doc(r, now, academic_year) for r in rows_to_insert]
 
     update_docs = []
     if duplicate_action == "update":
         for r in rows_to_update:
-            doc = build_student_doc(r)
+            doc = build_student_doc(r, now, academic_year)
             doc.pop("created_at", None)
             update_docs.append((r["_existing_id"], doc))
 
+    # One batched write command for all updates instead of a round-trip per row
+    update_ops = [UpdateOne({"_id": ObjectId(eid)}, {"$set": doc}) for eid, doc in update_docs]
+
     success = 0
     errors: List[Dict] = []
 
@@ -553,33 +776,38 @@ def execute_import_transaction(
                     db.students.insert_many(docs_to_insert, session=session)
                     success += len(docs_to_insert)
 
-                for eid, doc in update_docs:
-                    from bson.objectid import ObjectId
-                    db.students.update_one(
-                        {"_id": ObjectId(eid)},
-                        {"$set": doc},
-                        session=session,
-                    )
-                    success += 1
+                if update_ops:
+                    db.students.bulk_write(update_ops, ordered=True, session=session)
+                    success += len(update_ops)
     except Exception:
-        # Standalone MongoDB — no transaction support; fall back to ordered bulk
+        # Standalone MongoDB — no transaction support; fall back to bulk writes.
+        # Duplicates were pre-filtered by check_db_duplicates, so the insert can
+        # run unordered and let the server apply writes in parallel.
         success = 0
         errors = []
+        inserted_ids: List[Any] = []
         try:
             if docs_to_insert:
-                db.students.insert_many(docs_to_insert, ordered=True)
+                try:
+                    result = db.students.insert_many(
+                        docs_to_insert, ordered=False, bypass_document_validation=True
+                    )
+                    inserted_ids = list(result.inserted_ids)
+                except BulkWriteError as bwe:
+                    # Unordered: every doc not listed in writeErrors was inserted
+                    failed = {e["index"] for e in bwe.details.get("writeErrors", [])}
+                    inserted_ids = [d["_id"] for i, d in enumerate(docs_to_insert) if i not in failed and "_id" in d]
+                    raise
                 success += len(docs_to_insert)
 
-            for eid, doc in update_docs:
-                from bson.objectid import ObjectId
-                db.students.update_one({"_id": ObjectId(eid)}, {"$set": doc})
-                success += 1
+            if update_ops:
+                db.students.bulk_write(update_ops, ordered=True)
+                success += len(update_ops)
         except Exception as exc:
-            # If bulk insert partially fails, we can't easily roll back in standalone.
-            # Delete any docs just inserted in this batch to honour all-or-nothing.
-            inserted_ids = [d["student_id"] for d in docs_to_insert]
+            # No rollback in standalone: delete exactly the docs this batch
+            # inserted (by _id) to honour all-or-nothing.
             if inserted_ids:
-                db.students.delete_many({"student_id": {"$in": inserted_ids}})
+                db.students.delete_many({"_id": {"$in": inserted_ids}})
             return 0, len(docs_to_insert) + len(update_docs), [{"row": 0, "column": "-", "value": "-", "reason": f"Transaction failed: {str(exc)}"}]
 
     return success, 0, errors
@@ -592,6 +820,9 @@ def execute_import_transaction(
 # Export columns include all template columns plus a Status column
 EXPORT_COLUMNS = TEMPLATE_COLUMNS + ["Data_Status"]
 
+# (column letter, width) pairs, computed once at import time
+_EXPORT_WIDTHS = [(get_column_letter(i), max(len(n) + 6, 16)) for i, n in enumerate(EXPORT_COLUMNS, start=1)]
+
 
 def export_students_xlsx(students: List[Dict]) -> bytes:
     """Export students list to xlsx bytes with all columns plus data status."""
@@ -620,12 +851,15 @@ def export_students_xlsx(students: List[Dict]) -> bytes:
             cell.fill = header_fill_optional
         cell.alignment = Alignment(horizontal="center")
         cell.border = thin_border
-        ws.column_dimensions[cell.column_letter].width = max(len(col_name) + 6, 16)
+    for letter, width in _EXPORT_WIDTHS:
+        ws.column_dimensions[letter].width = width
 
     # Status cell styling
     complete_fill = PatternFill(start_color="C8E6C9", end_color="C8E6C9", fill_type="solid")
     incomplete_fill = PatternFill(start_color="FFCDD2", end_color="FFCDD2", fill_type="solid")
 
+    _san = _sanitize_cell  # local alias; called for every text cell
+
     for row_idx, s in enumerate(students, start=2):
         guardian = s.get("guardian_info") or {}
         contact = s.get("contact_info") or {}
@@ -648,19 +882,19 @@ def export_students_xlsx(students: List[Dict]) -> bytes:
             data_status = "Complete" if data_status == "complete" else "Incomplete"
         
         row_data = [
-            _sanitize_cell(s.get("full_name", "")),
-            _sanitize_cell(s.get("roll_number", "")),
-            _sanitize_cell(s.get("registration_number", "") or s.get("student_id", "")),
-            _sanitize_cell(s.get("class_id", "") or s.get("class", "")),
-            _sanitize_cell(s.get("section", "")),
-            _sanitize_cell(guardian.get("father_name", "")),
-            _sanitize_cell(guardian.get("parent_cnic", "")),
-            _sanitize_cell(s.get("gender", "")),
-            _sanitize_cell(s.get("date_of_birth", "")),
-            _sanitize_cell(guardian.get("guardian_contact", "") or contact.get("phone", "")),
-            _sanitize_cell(guardian.get("address", "") or s.get("address", "")),
-            _sanitize_cell(s.get("admission_date", "")),
-            _sanitize_cell(s.get("image_name", "") or ""),
+            _san(s.get("full_name", "")),
+            _san(s.get("roll_number", "")),
+            _san(s.get("registration_number", "") or s.get("student_id", "")),
+            _san(s.get("class_id", "") or s.get("class", "")),
+            _san(s.get("section", "")),
+            _san(guardian.get("father_name", "")),
+            _san(guardian.get("parent_cnic", "")),
+            _san(s.get("gender", "")),
+            _san(s.get("date_of_birth", "")),
+            _san(guardian.get("guardian_contact", "") or contact.get("phone", "")),
+            _san(guardian.get("address", "") or s.get("address", "")),
+            _san(s.get("admission_date", "")),
+            _san(s.get("image_name", "") or ""),
             data_status,
         ]
         for col_idx, val in enumerate(row_data, start=1):
@@ -682,32 +916,46 @@ def export_students_xlsx(students: List[Dict]) -> bytes:
 
 
 def generate_error_report(errors: List[Dict]) -> bytes:
-    """Generate students_import_errors.xlsx from error list."""
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Import Errors"
+    """Generate students_import_errors.xlsx from error list.
+
+    Uses a write-only workbook so rows are streamed straight to the archive
+    instead of being held in memory; all cells share two named styles.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Import Errors")
 
-    header_font = Font(bold=True, color="FFFFFF", size=11)
-    header_fill = PatternFill(start_color="C00000", end_color="C00000", fill_type="solid")
     thin_border = Border(
         left=Side(style="thin"), right=Side(style="thin"),
         top=Side(style="thin"), bottom=Side(style="thin"),
     )
+    wb.add_named_style(NamedStyle(
+        name="err_hdr",
+        font=Font(bold=True, color="FFFFFF", size=11),
+        fill=PatternFill(start_color="C00000", end_color="C00000", fill_type="solid"),
+        alignment=Alignment(horizontal="center"),
+        border=thin_border,
+    ))
+    wb.add_named_style(NamedStyle(name="err_body", border=thin_border))
 
     headers = ["Row", "Column", "Provided Value", "Error Reason"]
-    for col_idx, h in enumerate(headers, start=1):
-        cell = ws.cell(row=1, column=col_idx, value=h)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = Alignment(horizontal="center")
-        cell.border = thin_border
-        ws.column_dimensions[cell.column_letter].width = 25
-
-    for row_idx, err in enumerate(errors, start=2):
-        ws.cell(row=row_idx, column=1, value=err.get("row", "")).border = thin_border
-        ws.cell(row=row_idx, column=2, value=err.get("column", "")).border = thin_border
-        ws.cell(row=row_idx, column=3, value=_sanitize_cell(err.get("value", ""))).border = thin_border
-        ws.cell(row=row_idx, column=4, value=err.get("reason", "")).border = thin_border
+    # Column widths must be set before the first append in write-only mode
+    for col_idx in range(1, len(headers) + 1):
+        ws.column_dimensions[get_column_letter(col_idx)].width = 25
+
+    def _styled(value: Any, style: str) -> WriteOnlyCell:
+        cell = WriteOnlyCell(ws, value=value)
+        cell.style = style
+        return cell
+
+    ws.append([_styled(h, "err_hdr") for h in headers])
+
+    for err in errors:
+        ws.append([
+            _styled(err.get("row", ""), "err_body"),
+            _styled(err.get("column", ""), "err_body"),
+            _styled(_sanitize_cell(err.get("value", "")), "err_body"),
+            _styled(err.get("reason", ""), "err_body"),
+        ])
 
     bio = BytesIO()
     wb.save(bio)
@@ -4,19 +4,239 @@ Face Enrollment Service - Integration with external face-recognition-app
 This service handles automatic enrollment of students/teachers to the external
 face-recognition-app when they upload profile images.
 """
+import asyncio
 import logging
-import requests
+import random
+import httpx
 import io
-from typing import Optional, Dict, Any, Tuple
+from typing import Optional, Dict, Any, Awaitable, List, Set, Tuple
 from PIL import Image
-import base64
+try:
+    import pybase64 as base64  # SIMD-accelerated, drop-in for the stdlib module
+except ImportError:
+    import base64
 
 from app.config import settings
-from app.services.image_service import ImageService
+from app.middleware.database_routing import get_current_school_id
+from app.services.image_service import ImageService, has_image_signature, image_digest
 from app.services.embedding_service import EmbeddingGenerator, FaceDetectionError
+from app.utils.circuit_breaker import get_circuit_breaker, HALF_OPEN
+from app.utils.cache import LRUCache
 
 logger = logging.getLogger(__name__)
 
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 on the shared client)
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+# Shared keep-alive client for the external face-recognition-app; created on
+# first use and closed from the application shutdown hook.
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            base_url=settings.face_recognition_url,
+            headers={"x-api-key": settings.face_recognition_api_key} if settings.face_recognition_api_key else {},
+            http2=_HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(10.0, connect=3.0),
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+        )
+    return _client
+
+
+_RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+
+# Keyed by image content hash: re-uploads of the same photo reuse the
+# embedding, and (person, image) pairs already enrolled skip the POST.
+_embedding_by_digest = LRUCache(maxsize=2048, ttl_seconds=24 * 3600)
+_enrolled_digests = LRUCache(maxsize=8192, ttl_seconds=24 * 3600)
+
+
+def _forget_enrollment(unique_person_id: str) -> None:
+    """Drop cached (person, image) enrollments so the next enroll really POSTs"""
+    _enrolled_digests.invalidate_matching(lambda key: key[0] == unique_person_id)
+
+
+class FaceServiceUnavailable(Exception):
+    """The face app call was not attempted (fast-fail)"""
+
+
+class CircuitOpenError(FaceServiceUnavailable):
+    """Raised instead of calling the face app while its circuit is open"""
+
+
+class BulkheadFullError(FaceServiceUnavailable):
+    """Raised when no concurrency slot frees up within BULKHEAD_WAIT_SECONDS"""
+
+
+# Bulkhead: caps in-flight calls so bulk imports cannot flood the face app
+BULKHEAD_WAIT_SECONDS = 2.0
+BULKHEAD_SLOTS = settings.face_recognition_max_concurrency or 8
+_face_app_sem = asyncio.Semaphore(BULKHEAD_SLOTS)
+
+
+def _breaker():
+    return get_circuit_breaker(settings.face_recognition_url, failure_threshold=5, recovery_time=30.0)
+
+
+# End-to-end budget for one service call, covering bulkhead wait, every
+# attempt and the backoff sleeps between them
+FACE_APP_DEADLINE_SECONDS = 15.0
+_ATTEMPT_TIMEOUT = 10.0
+_CONNECT_TIMEOUT = 3.0
+
+
+def _new_deadline() -> float:
+    return asyncio.get_running_loop().time() + FACE_APP_DEADLINE_SECONDS
+
+
+async def _request_with_retry(
+    method: str,
+    url: str,
+    *,
+    deadline: Optional[float] = None,
+    max_attempts: int = 4,
+    base: float = 0.5,
+    cap: float = 8.0,
+    **kwargs: Any,
+) -> httpx.Response:
+    """Send a request, retrying transient failures with full-jitter backoff.
+
+    Only timeouts, connection errors and 429/5xx responses are retried;
+    anything else (including 400/401/403) is returned to the caller at once.
+    The last transient exception is re-raised when attempts run out.
+
+    `deadline` (event-loop time) bounds the whole call: each attempt's
+    timeout and each backoff sleep are clipped to the remaining budget, and
+    httpx.TimeoutException is raised once it is spent.
+
+    Outcomes feed the per-URL circuit breaker; while it is open the call
+    fails fast with CircuitOpenError instead of waiting on timeouts. Calls
+    also hold a bulkhead slot and raise BulkheadFullError if none frees up
+    within BULKHEAD_WAIT_SECONDS.
+    """
+    loop = asyncio.get_running_loop()
+    if deadline is None:
+        deadline = _new_deadline()
+    try:
+        wait = min(BULKHEAD_WAIT_SECONDS, max(deadline - loop.time(), 0.0))
+        await asyncio.wait_for(_face_app_sem.acquire(), timeout=wait)
+    except asyncio.TimeoutError:
+        raise BulkheadFullError("Face recognition service busy (too many concurrent calls)")
+    try:
+        return await _send_with_retry(method, url, deadline, max_attempts, base, cap, **kwargs)
+    finally:
+        _face_app_sem.release()
+
+
+async def _send_with_retry(
+    method: str, url: str, deadline: float, max_attempts: int, base: float, cap: float, **kwargs: Any
+) -> httpx.Response:
+    loop = asyncio.get_running_loop()
+    breaker = _breaker()
+    if not breaker.allow_request():
+        raise CircuitOpenError("External face service unavailable (circuit open)")
+    is_probe = breaker.state == HALF_OPEN
+
+    try:
+        for attempt in range(max_attempts):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                breaker.record_failure()
+                raise httpx.TimeoutException(f"Deadline exceeded for {method} {url}")
+            timeout = httpx.Timeout(min(remaining, _ATTEMPT_TIMEOUT), connect=min(remaining, _CONNECT_TIMEOUT))
+            try:
+                response = await _get_client().request(method, url, timeout=timeout, **kwargs)
+                if response.status_code not in _RETRYABLE_STATUS:
+                    breaker.record_success()
+                    return response
+                if attempt == max_attempts - 1:
+                    breaker.record_failure()
+                    return response
+                logger.warning("[FACE-EXT] %s %s returned HTTP %s, retrying", method, url, response.status_code)
+            except (httpx.TimeoutException, httpx.ConnectError) as e:
+                if attempt == max_attempts - 1:
+                    breaker.record_failure()
+                    raise
+                logger.warning("[FACE-EXT] %s %s failed (%s), retrying", method, url, type(e).__name__)
+            except Exception:
+                breaker.record_failure()
+                raise
+            delay = random.uniform(0, min(cap, base * 2 ** attempt))
+            await asyncio.sleep(min(delay, max(deadline - loop.time(), 0.0)))
+    except asyncio.CancelledError:
+        # Cancelled mid-call (client disconnect, shutdown): no outcome to
+        # record, but a half-open probe must not stay claimed
+        if is_probe:
+            breaker.release_probe()
+        raise
+    raise RuntimeError("unreachable")
+
+
+# Uploads are downscaled to this longest side; the face app only needs a
+# face-sized input, not a full phone photo
+UPLOAD_MAX_DIMENSION = 640
+UPLOAD_JPEG_QUALITY = 85
+
+
+def _prepare_upload_bytes(image_bytes: bytes) -> bytes:
+    """
+    Return image bytes to send to the face app: the original when it is
+    already small, otherwise a downscaled RGB JPEG. Image.open only parses
+    the header, so small images are never fully decoded here.
+    """
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        if max(img.size) <= UPLOAD_MAX_DIMENSION:
+            return image_bytes
+        img.draft("RGB", (UPLOAD_MAX_DIMENSION, UPLOAD_MAX_DIMENSION))  # JPEG: decode at reduced scale
+        img = img.convert("RGB")
+        img.thumbnail((UPLOAD_MAX_DIMENSION, UPLOAD_MAX_DIMENSION), Image.Resampling.LANCZOS)
+        buf = io.BytesIO()
+        img.save(buf, format="JPEG", quality=UPLOAD_JPEG_QUALITY)
+        return buf.getvalue()
+    except Exception as e:
+        logger.warning("[FACE-EXT] Could not downscale upload image, sending original: %s", e)
+        return image_bytes
+
+
+def _parse_json_body(response: httpx.Response) -> Optional[Any]:
+    """Parse a JSON response body once (orjson when available); None if not JSON."""
+    content = response.content
+    if not content or not response.headers.get("content-type", "").startswith("application/json"):
+        return None
+    try:
+        return _json_loads(content)
+    except ValueError:
+        return None
+
+
+_background_tasks: Set["asyncio.Task"] = set()
+
+
+def _on_background_done(task: "asyncio.Task") -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("🔴 [FACE-EXT] Background enrollment failed: %s", task.exception())
+
+
+async def close_face_client() -> None:
+    """Close the shared face-recognition HTTP client (app shutdown)."""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
 
 class FaceEnrollmentService:
     """Service for enrolling persons in the external face recognition system"""
@@ -54,17 +274,17 @@ class FaceEnrollmentService:
         If not provided, attempts to get from middleware context.
         """
         if not FaceEnrollmentService.is_enabled():
-            logger.info(f"[FACE] Face recognition disabled, skipping enrollment for {person_id}")
+            logger.info("[FACE] Face recognition disabled, skipping enrollment for %s", person_id)
             return {
                 "success": False,
                 "skipped": True,
                 "message": "Face recognition integration is disabled"
             }
         
+        deadline = _new_deadline()
         try:
             # SECURITY: Get school_id from middleware context if not provided
             if not school_id:
-                from app.middleware.database_routing import get_current_school_id
                 school_id = get_current_school_id()
             
             # CRITICAL: Prefix person_id with school_id to prevent collisions
@@ -72,19 +292,30 @@ class FaceEnrollmentService:
             unique_person_id = f"{school_id}_{person_id}" if school_id else person_id
             
             if not school_id:
-                logger.warning(f"⚠️ [FACE] No school_id for {person_id} - collision risk exists!")
+                logger.warning("⚠️ [FACE] No school_id for %s - collision risk exists!", person_id)
             
-            logger.info(f"[FACE] Enrolling {role} {person_id} ({name}) as {unique_person_id} to face recognition app")
+            logger.info("[FACE] Enrolling %s %s (%s) as %s to face recognition app", role, person_id, name, unique_person_id)
             
             # Convert base64 blob to bytes
             image_bytes = base64.b64decode(image_blob)
+            if not has_image_signature(image_bytes):
+                logger.warning("⚠️ [FACE] Rejected non-image upload for %s", person_id)
+                return {"success": False, "error": "Invalid image data"}
+            digest = image_digest(image_bytes)
+            if (unique_person_id, digest) in _enrolled_digests:
+                logger.info("[FACE] %s already enrolled with this image, skipping", unique_person_id)
+                return {
+                    "success": True,
+                    "message": "Already enrolled with this image",
+                    "cached": True
+                }
             
-            # Prepare multipart form data
-            url = f"{settings.face_recognition_url}/enroll"
+            # Downscale large photos before upload (off the event loop)
+            upload_bytes = await asyncio.to_thread(_prepare_upload_bytes, image_bytes)
             
-            # Create file-like object
+            # Prepare multipart form data
             files = {
-                'file': (f'{unique_person_id}.jpg', io.BytesIO(image_bytes), 'image/jpeg')
+                'file': (f'{unique_person_id}.jpg', upload_bytes, 'image/jpeg')
             }
             
             data = {
@@ -93,82 +324,140 @@ class FaceEnrollmentService:
                 'role': role
             }
             
-            headers = {}
-            if settings.face_recognition_api_key:
-                headers['x-api-key'] = settings.face_recognition_api_key
-            
-            # Call external API with timeout
-            response = requests.post(
-                url,
+            # Call external API (retries and the update fallback share one deadline)
+            response = await _request_with_retry(
+                "POST",
+                "/enroll",
+                deadline=deadline,
                 files=files,
                 data=data,
-                headers=headers,
-                timeout=10  # 10 second timeout
             )
             
+            body = _parse_json_body(response)
             if response.status_code == 200:
-                result = response.json()
-                logger.info(f"✅ [FACE] Successfully enrolled {person_id} to face recognition app")
+                result = body
+                _enrolled_digests.set((unique_person_id, digest), True)
+                logger.info("✅ [FACE] Successfully enrolled %s to face recognition app", person_id)
                 return {
                     "success": True,
                     "message": "Enrolled to face recognition system",
                     "details": result
                 }
             elif response.status_code == 400:
-                error_msg = response.json().get('error', 'Unknown error')
+                error_msg = body.get('error', 'Unknown error') if isinstance(body, dict) else 'Unknown error'
+                error_msg = str(error_msg)
                 if 'already exists' in error_msg.lower():
-                    logger.warning(f"⚠️ [FACE] {unique_person_id} already enrolled in face recognition app")
+                    logger.warning("⚠️ [FACE] %s already enrolled in face recognition app", unique_person_id)
                     # Try to update instead
                     return await FaceEnrollmentService._update_person(
-                        unique_person_id, name, role, image_bytes
+                        unique_person_id, name, role, upload_bytes, deadline=deadline
                     )
                 else:
-                    logger.error(f"🔴 [FACE] Enrollment failed for {person_id}: {error_msg}")
+                    logger.error("🔴 [FACE] Enrollment failed for %s: %s", person_id, error_msg)
                     return {
                         "success": False,
                         "error": error_msg
                     }
             else:
-                logger.error(f"🔴 [FACE] Enrollment failed for {person_id}: HTTP {response.status_code}")
+                logger.error("🔴 [FACE] Enrollment failed for %s: HTTP %s", person_id, response.status_code)
                 return {
                     "success": False,
-                    "error": f"HTTP {response.status_code}: {response.text}"
+                    "error": f"HTTP {response.status_code}: {response.content[:512].decode('utf-8', 'replace')}"
                 }
                 
-        except requests.Timeout:
-            logger.warning(f"⚠️ [FACE-EXT] External enrollment timeout for {person_id} (non-critical)")
+        except FaceServiceUnavailable as e:
+            logger.info("[FACE-EXT] Skipping external enrollment for %s: %s", person_id, e)
+            return {
+                "success": False,
+                "skipped_external": True,
+                "error": str(e)
+            }
+        except httpx.TimeoutException:
+            logger.warning("⚠️ [FACE-EXT] External enrollment timeout for %s (non-critical)", person_id)
             return {
                 "success": False,
                 "skipped_external": True,
                 "error": "External face recognition service timeout (optional feature)"
             }
-        except requests.ConnectionError:
-            logger.warning(f"⚠️ [FACE-EXT] External face service unavailable (non-critical) - embeddings will still be generated locally")
+        except httpx.ConnectError:
+            logger.warning("⚠️ [FACE-EXT] External face service unavailable (non-critical) - embeddings will still be generated locally")
             return {
                 "success": False,
                 "skipped_external": True,
                 "error": "External face service unavailable (optional)"
             }
         except Exception as e:
-            logger.error(f"🔴 [FACE-EXT] Enrollment error for {person_id}: {str(e)}")
+            logger.error("🔴 [FACE-EXT] Enrollment error for %s: %s", person_id, e)
             return {
                 "success": False,
                 "error": str(e)
             }
     
+    @staticmethod
+    def enroll_in_background(coro: Awaitable[Any]) -> "asyncio.Task":
+        """
+        Run an enrollment coroutine (enroll_person / enroll_many / ...) as a
+        fire-and-forget task on the current event loop, so callers can
+        respond without waiting on the external face app.
+        
+        A strong reference is kept until the task finishes (the loop only
+        holds weak ones), and any exception is logged rather than lost.
+        """
+        task = asyncio.get_running_loop().create_task(coro)
+        _background_tasks.add(task)
+        task.add_done_callback(_on_background_done)
+        return task
+    
+    @staticmethod
+    async def enroll_many(
+        persons: List[Dict[str, Any]],
+        school_id: Optional[str] = None,
+        batch_size: int = BULKHEAD_SLOTS
+    ) -> List[Dict[str, Any]]:
+        """
+        Enroll many persons concurrently (e.g. after a bulk import)
+        
+        Args:
+            persons: Dicts with enroll_person kwargs (person_id, name, role,
+                image_blob, image_type)
+            school_id: School ID applied to every person
+            batch_size: Persons fanned out per asyncio.gather round (at most
+                BULKHEAD_SLOTS)
+            
+        Returns:
+            One result dict per person, in input order
+            
+        Bulkhead waiters give up after BULKHEAD_WAIT_SECONDS, so a round never
+        gathers more calls than there are slots; otherwise most of a round
+        would be skipped whenever the face app is slow.
+        """
+        batch_size = max(1, min(batch_size, BULKHEAD_SLOTS))
+        results: List[Dict[str, Any]] = []
+        for start in range(0, len(persons), batch_size):
+            chunk = persons[start:start + batch_size]
+            outcomes = await asyncio.gather(
+                *(FaceEnrollmentService.enroll_person(school_id=school_id, **p) for p in chunk),
+                return_exceptions=True
+            )
+            for person, outcome in zip(chunk, outcomes):
+                if isinstance(outcome, BaseException):
+                    logger.warning("[FACE] Enrollment failed for %s: %s", person.get('person_id'), outcome)
+                    outcome = {"success": False, "error": str(outcome)}
+                results.append(outcome)
+        return results
+    
     @staticmethod
     async def _update_person(
         person_id: str,
         name: str,
         role: str,
-        image_bytes: bytes
+        image_bytes: bytes,
+        deadline: Optional[float] = None
     ) -> Dict[str, Any]:
-        """Update existing person in face recognition app"""
+        """Update existing person in face recognition app (within the caller's deadline, if given)"""
         try:
-            url = f"{settings.face_recognition_url}/persons/{person_id}"
-            
             files = {
-                'file': (f'{person_id}.jpg', io.BytesIO(image_bytes), 'image/jpeg')
+                'file': (f'{person_id}.jpg', image_bytes, 'image/jpeg')
             }
             
             data = {
@@ -176,34 +465,39 @@ class FaceEnrollmentService:
                 'role': role
             }
             
-            headers = {}
-            if settings.face_recognition_api_key:
-                headers['x-api-key'] = settings.face_recognition_api_key
-            
-            response = requests.put(
-                url,
+            response = await _request_with_retry(
+                "PUT",
+                f"/persons/{person_id}",
+                deadline=deadline,
                 files=files,
                 data=data,
-                headers=headers,
-                timeout=10
             )
             
             if response.status_code == 200:
-                logger.info(f"✅ [FACE] Updated {person_id} in face recognition app")
+                logger.info("✅ [FACE] Updated %s in face recognition app", person_id)
                 return {
                     "success": True,
                     "message": "Updated in face recognition system",
                     "updated": True
                 }
             else:
-                logger.error(f"🔴 [FACE] Update failed for {person_id}: HTTP {response.status_code}")
+                logger.error("🔴 [FACE] Update failed for %s: HTTP %s", person_id, response.status_code)
+                _forget_enrollment(person_id)
                 return {
                     "success": False,
                     "error": f"Update failed: HTTP {response.status_code}"
                 }
                 
+        except FaceServiceUnavailable as e:
+            _forget_enrollment(person_id)
+            return {
+                "success": False,
+                "skipped_external": True,
+                "error": str(e)
+            }
         except Exception as e:
-            logger.error(f"🔴 [FACE] Update error for {person_id}: {str(e)}")
+            logger.error("🔴 [FACE] Update error for %s: %s", person_id, e)
+            _forget_enrollment(person_id)
             return {
                 "success": False,
                 "error": str(e)
@@ -228,32 +522,49 @@ class FaceEnrollmentService:
             status can be: 'generated', 'no_face', 'failed'
         """
         try:
-            logger.info(f"[EMBEDDING] Generating embedding for {person_type} {person_id}")
+            logger.info("[EMBEDDING] Generating embedding for %s %s", person_type, person_id)
             
-            # Convert base64 to PIL Image
-            pil_image = ImageService.get_pil_image_from_base64(image_blob)
-            if not pil_image:
-                logger.error(f"🔴 [EMBEDDING] Failed to load image for {person_id}")
+            image_bytes = ImageService.extract_for_embedding(image_blob)
+            if not image_bytes:
+                logger.error("🔴 [EMBEDDING] Failed to load image for %s", person_id)
+                return None, "failed"
+            if not has_image_signature(image_bytes):
+                logger.error("🔴 [EMBEDDING] Blob for %s is not a JPEG/PNG/WEBP image", person_id)
+                return None, "failed"
+            digest = image_digest(image_bytes)
+            
+            # Same photo seen recently: skip the CNN entirely
+            cached = _embedding_by_digest.get(digest)
+            if cached is not None:
+                logger.info("✅ [EMBEDDING] Reused cached embedding for %s", person_id)
+                return cached, "generated"
+            
+            # Decode (turbo-JPEG fast path, Pillow otherwise)
+            try:
+                image = await asyncio.to_thread(ImageService.decode_for_embedding, image_bytes)
+            except Exception as e:
+                logger.error("🔴 [EMBEDDING] Failed to load image for %s: %s", person_id, e)
                 return None, "failed"
             
-            # Generate embedding
-            embedding, status = EmbeddingGenerator.generate_embedding_from_image(pil_image)
+            # Generate embedding (detection + ONNX off the event loop)
+            embedding, status = await asyncio.to_thread(EmbeddingGenerator.generate_embedding_from_image, image)
             
             if status == "generated" and embedding:
-                logger.info(f"✅ [EMBEDDING] Generated embedding for {person_id}")
+                _embedding_by_digest.set(digest, embedding)
+                logger.info("✅ [EMBEDDING] Generated embedding for %s", person_id)
                 return embedding, "generated"
             elif status == "no_face":
-                logger.warning(f"⚠️ [EMBEDDING] No face detected for {person_id}")
+                logger.warning("⚠️ [EMBEDDING] No face detected for %s", person_id)
                 return None, "no_face"
             else:
-                logger.error(f"🔴 [EMBEDDING] Embedding generation failed for {person_id}")
+                logger.error("🔴 [EMBEDDING] Embedding generation failed for %s", person_id)
                 return None, "failed"
                 
         except FaceDetectionError as e:
-            logger.warning(f"⚠️ [EMBEDDING] No face detected for {person_id}: {str(e)}")
+            logger.warning("⚠️ [EMBEDDING] No face detected for %s: %s", person_id, e)
             return None, "no_face"
         except Exception as e:
-            logger.error(f"🔴 [EMBEDDING] Embedding error for {person_id}: {str(e)}")
+            logger.error("🔴 [EMBEDDING] Embedding error for %s: %s", person_id, e)
             return None, "failed"
     
     @staticmethod
@@ -278,47 +589,48 @@ class FaceEnrollmentService:
         try:
             # Get school_id from context if not provided
             if not school_id:
-                from app.middleware.database_routing import get_current_school_id
                 school_id = get_current_school_id()
             
             # Use prefixed ID for deletion (same as enrollment)
             unique_person_id = f"{school_id}_{person_id}" if school_id else person_id
             
-            logger.info(f"[FACE] Deleting {person_id} (unique: {unique_person_id}) from face recognition app")
-            
-            url = f"{settings.face_recognition_url}/persons/{unique_person_id}"
-            
-            headers = {}
-            if settings.face_recognition_api_key:
-                headers['x-api-key'] = settings.face_recognition_api_key
+            logger.info("[FACE] Deleting %s (unique: %s) from face recognition app", person_id, unique_person_id)
+            # Whatever the outcome, a later re-enroll must not be answered from cache
+            _forget_enrollment(unique_person_id)
             
-            response = requests.delete(
-                url,
-                headers=headers,
-                timeout=10
+            response = await _request_with_retry(
+                "DELETE",
+                f"/persons/{unique_person_id}",
             )
             
             if response.status_code == 200:
-                logger.info(f"✅ [FACE] Deleted {person_id} from face recognition app")
+                logger.info("✅ [FACE] Deleted %s from face recognition app", person_id)
                 return {
                     "success": True,
                     "message": "Deleted from face recognition system"
                 }
             elif response.status_code == 404:
-                logger.warning(f"⚠️ [FACE] {person_id} not found in face recognition app")
+                logger.warning("⚠️ [FACE] %s not found in face recognition app", person_id)
                 return {
                     "success": True,
                     "message": "Person not found (already deleted)"
                 }
             else:
-                logger.error(f"🔴 [FACE] Delete failed for {person_id}: HTTP {response.status_code}")
+                logger.error("🔴 [FACE] Delete failed for %s: HTTP %s", person_id, response.status_code)
                 return {
                     "success": False,
                     "error": f"HTTP {response.status_code}"
                 }
                 
+        except FaceServiceUnavailable as e:
+            logger.info("[FACE-EXT] Skipping external delete for %s: %s", person_id, e)
+            return {
+                "success": False,
+                "skipped_external": True,
+                "error": str(e)
+            }
         except Exception as e:
-            logger.error(f"🔴 [FACE] Delete error for {person_id}: {str(e)}")
+            logger.error("🔴 [FACE] Delete error for %s: %s", person_id, e)
             return {
                 "success": False,
                 "error": str(e)
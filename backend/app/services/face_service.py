@@ -5,20 +5,48 @@ Integrated with existing CMS attendance collections.
 
 Now uses ONNX Runtime + ArcFace ResNet100 (~170MB) instead of PyTorch (~400MB).
 """
+import asyncio
 import logging
+import threading
 import time
 try:
     import psutil
 except Exception:
     psutil = None
-import io
+import hashlib
 import numpy as np
 import json
 import os
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date
-from typing import Optional, List, Dict, Any, Tuple
+from typing import Optional, List, Dict, Any, Set, Tuple, NamedTuple
 from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from app.utils.embeddings import EMBEDDING_DTYPE, pack_embedding, unpack_embedding
+try:
+    import simsimd  # SIMD cosine kernels (AVX2/AVX-512/NEON)
+    SIMSIMD_AVAILABLE = True
+except ImportError:
+    simsimd = None
+    SIMSIMD_AVAILABLE = False
+try:
+    import orjson  # faster (de)serialization of the disk cache metadata
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+try:
+    import faiss  # inner-product index over the SoA matrix for large caches
+    FAISS_AVAILABLE = True
+except ImportError:
+    faiss = None
+    FAISS_AVAILABLE = False
 
 # Setup logging
 logger = logging.getLogger('face')
@@ -30,15 +58,50 @@ if not logger.handlers:
 
 # Lazy loading flags for ML libraries
 _ml_libs_initialized = False
-USE_FACENET = False  # Using FaceNet PyTorch, not ONNX
+USE_FACENET = False  # ArcFace ONNX model ready (flag name kept for main.py / routers)
 _FACENET_MODEL = None
+_embed_fn = None  # EmbeddingGenerator.generate_embedding_from_image, bound on successful init
 Image = None
 CV2_AVAILABLE = False
 cv2 = None
+_norm_flatten_u8 = None  # numba-compiled fallback kernel, set in _init_ml_libs
+_dot_rows_512 = None  # numba-compiled similarity kernel, set in _init_ml_libs
+EMBEDDING_DIM = 512  # ArcFace output size; a compile-time constant for the kernel
+
+
+def _norm_flatten_u8_impl(small: np.ndarray) -> np.ndarray:
+    """Cast + flatten + L2-normalize a uint8 image in one fused loop (numba source)"""
+    flat = small.ravel()
+    n = flat.size
+    out = np.empty(n, dtype=np.float32)
+    ss = 0.0
+    for i in range(n):
+        v = np.float32(flat[i])
+        out[i] = v
+        ss += v * v
+    inv = 1.0 / max(np.sqrt(ss), 1e-12)
+    for i in range(n):
+        out[i] *= inv
+    return out
+
+
+def _dot_rows_512_impl(mat: np.ndarray, q: np.ndarray, out: np.ndarray) -> None:
+    """out[i] = mat[i] . q for 512-D rows; fixed trip count lets the JIT unroll/FMA.
+    Serial on purpose: several recognitions call it at once, and numba's default
+    workqueue threading layer aborts the process on concurrent parallel entry.
+    """
+    for i in range(mat.shape[0]):
+        acc = np.float32(0.0)
+        for k in range(EMBEDDING_DIM):
+            acc += mat[i, k] * q[k]
+        out[i] = acc
 
 # Track which schools have loaded embeddings to avoid reloading
 _school_embeddings_loaded: set = set()
 
+# Embedding generation runs in worker threads; the first callers may race here
+_ml_init_lock = threading.Lock()
+
 def _init_ml_libs():
     """Lazily initialize ML libraries (FaceNet PyTorch, OpenCV).
     
@@ -48,12 +111,24 @@ def _init_ml_libs():
     FaceNet loads on-demand from model file (~280MB); not loaded until
     user clicks 'Start Integration' button or first recognition request.
     """
-    global _ml_libs_initialized, USE_FACENET, _FACENET_MODEL, Image, CV2_AVAILABLE, cv2
+    global _ml_libs_initialized
     
     if _ml_libs_initialized:
         return
     
-    _ml_libs_initialized = True
+    with _ml_init_lock:
+        if _ml_libs_initialized:
+            return
+        try:
+            _load_ml_libs()
+        finally:
+            _ml_libs_initialized = True
+
+
+def _load_ml_libs():
+    global USE_FACENET, _FACENET_MODEL, Image, CV2_AVAILABLE, cv2, _norm_flatten_u8, _embed_fn
+    global _dot_rows_512
+    
     logger.info("📦 Initializing ML libraries for face recognition...")
 
     def _mem_info():
@@ -84,11 +159,17 @@ def _init_ml_libs():
         from PIL import Image as _Image
         Image = _Image
         
-        # Import FaceNet embedding generator
-        from .embedding_service import EmbeddingGenerator, _init_facenet
-        # Initialize the FaceNet model
-        if _init_facenet():
+        # Import the ONNX embedding generator
+        from .embedding_service import EmbeddingGenerator, _init_arcface
+        # Initialize the ArcFace model
+        if _init_arcface():
             USE_FACENET = True
+            _embed_fn = EmbeddingGenerator.generate_embedding_from_image
+            # Pre-warm: the first ORT run pays allocation/kernel selection cost
+            try:
+                EmbeddingGenerator.generate_embedding(_Image.new("RGB", (112, 112)))
+            except Exception as e:
+                logger.warning(f"Model warm-up failed (non-critical): {e}")
             t1 = time.time()
             logger.info(f"✅ FaceNet PyTorch loaded (took {t1 - t0:.2f}s). Memory after load: {_mem_info()}")
         else:
@@ -110,11 +191,35 @@ def _init_ml_libs():
         CV2_AVAILABLE = False
         logger.warning("OpenCV not available for face detection")
 
+    # Optional: numba for the grayscale fallback and similarity kernels
+    try:
+        from numba import njit
+        _norm_flatten_u8 = njit(cache=True, fastmath=True)(_norm_flatten_u8_impl)
+        kernel = njit(fastmath=True, cache=True)(_dot_rows_512_impl)
+        # Compile now (1-row warm-up) rather than on the first recognition
+        kernel(
+            np.zeros((1, EMBEDDING_DIM), dtype=np.float32),
+            np.zeros(EMBEDDING_DIM, dtype=np.float32),
+            np.empty(1, dtype=np.float32)
+        )
+        _dot_rows_512 = kernel
+        logger.info("✅ numba available, fallback and similarity kernels JIT-compiled")
+    except ImportError:
+        _norm_flatten_u8 = None
+        _dot_rows_512 = None
+    except Exception as e:
+        logger.warning(f"numba similarity kernel unavailable: {e}")
+        _dot_rows_512 = None
+
 def _get_embedding_version():
     """Get embedding version based on available libraries."""
     # Don't auto-init; FaceNet loads on-demand
     return "facenet_pytorch_v1" if USE_FACENET else "fallback_v1"
 
+def _source_hash(image_url: str) -> str:
+    """Fingerprint of the image an embedding was generated from"""
+    return hashlib.blake2b(image_url.encode(), digest_size=8).hexdigest()
+
 # In-memory embedding cache
 _embedding_cache: Dict[str, Dict[str, Any]] = {
     "students": {},  # {person_id: {"embedding": np.array, "name": str, ...}}
@@ -122,6 +227,288 @@ _embedding_cache: Dict[str, Dict[str, Any]] = {
 }
 _cache_loaded = False
 
+# Structure-of-arrays view of _embedding_cache used by compare_embedding:
+# one C-contiguous (N, D) float32 matrix of unit-normalized rows per category
+# plus the person ids in row order. Rebuilt on first use after a mutation.
+_embedding_matrix: Dict[str, np.ndarray] = {
+    "students": np.empty((0, 0), dtype=np.float32),
+    "employees": np.empty((0, 0), dtype=np.float32)
+}
+_embedding_ids: Dict[str, List[str]] = {"students": [], "employees": []}
+_matrix_dirty: Dict[str, bool] = {"students": True, "employees": True}
+
+# Both categories stacked into one matrix so a query is a single matvec.
+# types[i] indexes _CACHE_KEYS / _PERSON_TYPES for row i.
+_CACHE_KEYS = ("students", "employees")
+_PERSON_TYPES = ("student", "employee")
+
+
+class _MatrixSnapshot(NamedTuple):
+    """Immutable search view over both categories, published as one object"""
+    matrix: np.ndarray
+    ids: List[str]
+    types: np.ndarray
+    matrix_i8: Optional[np.ndarray]  # int8 copy for the SIMD kernels (simsimd only)
+    index: Any  # faiss index over matrix (large caches only)
+
+
+_EMPTY_SNAPSHOT = _MatrixSnapshot(
+    np.empty((0, 0), dtype=np.float32), [], np.empty(0, dtype=np.int8), None, None
+)
+_all_snapshot = _EMPTY_SNAPSHOT
+_all_dirty = True
+# Bumped on every mutation; a rebuild only clears _all_dirty if nothing
+# changed while it ran. Recognition runs in worker threads while cache
+# updates happen on the event loop, so both sides take _matrix_lock.
+_all_generation = 0
+_matrix_lock = threading.RLock()
+
+# Below FAISS_MIN_ROWS a plain matvec beats the index; at FAISS_HNSW_ROWS and
+# above, switch from exact (flat) search to approximate HNSW graph search
+FAISS_MIN_ROWS = 2048
+FAISS_HNSW_ROWS = 50000
+
+
+def _mark_all_dirty():
+    """Flag the combined snapshot stale (caller holds _matrix_lock)"""
+    global _all_dirty, _all_generation
+    _all_dirty = True
+    _all_generation += 1
+
+
+def _invalidate_matrix(key: Optional[str] = None):
+    """Mark the SoA matrix stale after _embedding_cache changes"""
+    with _matrix_lock:
+        for k in ((key,) if key else _matrix_dirty):
+            _matrix_dirty[k] = True
+        _mark_all_dirty()
+
+
+def _normalize_rows(mat: np.ndarray) -> np.ndarray:
+    """L2-normalize the rows of a float32 matrix in place"""
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    # Clamp instead of masking zero rows: one in-place op, no boolean temp
+    np.maximum(norms, 1e-12, out=norms)
+    mat /= norms
+    return mat
+
+
+def _quantize_rows(mat: np.ndarray) -> np.ndarray:
+    """Symmetric per-row int8 quantization.
+    Cosine similarity is scale-invariant, so the per-row scales are not kept.
+    """
+    max_abs = np.max(np.abs(mat), axis=1, keepdims=True)
+    np.maximum(max_abs, 1e-12, out=max_abs)
+    return np.round(mat * (127.0 / max_abs)).astype(np.int8)
+
+
+def _upsert_matrix_row(key: str, person_id: str, embedding) -> None:
+    """Apply a single-entry cache update to the SoA matrix (call before the dict write,
+    holding _matrix_lock). Existing rows are overwritten in place; new people are appended.
+    """
+    if _matrix_dirty[key]:
+        return  # full rebuild pending anyway
+    try:
+        row = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+    except (TypeError, ValueError):
+        _invalidate_matrix(key)
+        return
+    ids = _embedding_ids[key]
+    mat = _embedding_matrix[key]
+    if ids and row.shape[1] != mat.shape[1]:
+        _invalidate_matrix(key)
+        return
+    row = _normalize_rows(row.copy())
+    if person_id in _embedding_cache[key]:
+        mat[ids.index(person_id)] = row[0]
+    else:
+        _embedding_matrix[key] = np.vstack([mat, row]) if ids else row
+        ids.append(person_id)
+    _mark_all_dirty()
+
+
+def _remove_matrix_row(key: str, person_id: str) -> None:
+    """Drop a person's row from the SoA matrix (call after the dict delete, holding _matrix_lock)"""
+    if _matrix_dirty[key]:
+        return
+    ids = _embedding_ids[key]
+    try:
+        idx = ids.index(person_id)
+    except ValueError:
+        _invalidate_matrix(key)
+        return
+    ids.pop(idx)
+    _embedding_matrix[key] = np.delete(_embedding_matrix[key], idx, axis=0)
+    _mark_all_dirty()
+
+
+def _get_embedding_matrix(key: str) -> Tuple[np.ndarray, List[str]]:
+    """Return (normalized matrix, ids) for a category, rebuilding if stale (holding _matrix_lock)"""
+    if _matrix_dirty[key]:
+        entries = list(_embedding_cache[key].items())
+        ids = [pid for pid, _ in entries]
+        if ids:
+            mat = _normalize_rows(np.stack([np.asarray(entry["embedding"], dtype=np.float32) for _, entry in entries]))
+        else:
+            mat = np.empty((0, 0), dtype=np.float32)
+        _embedding_matrix[key] = mat
+        _embedding_ids[key] = ids
+        _matrix_dirty[key] = False
+    return _embedding_matrix[key], _embedding_ids[key]
+
+
+def _build_index(matrix: np.ndarray):
+    """Inner-product faiss index over normalized rows (inner product == cosine)"""
+    dim = matrix.shape[1]
+    if len(matrix) >= FAISS_HNSW_ROWS:
+        index = faiss.IndexHNSWFlat(dim, 32, faiss.METRIC_INNER_PRODUCT)
+    else:
+        index = faiss.IndexFlatIP(dim)
+    index.add(matrix)
+    return index
+
+
+def _get_all_matrix() -> _MatrixSnapshot:
+    """Current search snapshot across both categories, rebuilt if stale.
+    Readers must use the fields of one snapshot together, never the globals.
+    """
+    global _all_snapshot, _all_dirty
+    with _matrix_lock:
+        if not _all_dirty:
+            return _all_snapshot
+        generation = _all_generation
+        parts = []
+        for type_idx, key in enumerate(_CACHE_KEYS):
+            mat, ids = _get_embedding_matrix(key)
+            if ids:
+                parts.append((type_idx, mat, ids))
+        if parts:
+            # concatenate copies, so later in-place row updates can't reach the snapshot
+            matrix = np.concatenate([mat for _, mat, _ in parts])
+            ids = [pid for _, _, part_ids in parts for pid in part_ids]
+            types = np.concatenate([np.full(len(part_ids), t, dtype=np.int8) for t, _, part_ids in parts])
+        else:
+            matrix, ids, types = _EMPTY_SNAPSHOT.matrix, [], _EMPTY_SNAPSHOT.types
+
+    # Quantizing and index building are the slow part; do them unlocked so
+    # cache updates on the event loop don't wait
+    matrix_i8 = _quantize_rows(matrix) if SIMSIMD_AVAILABLE and ids else None
+    index = _build_index(matrix) if FAISS_AVAILABLE and len(ids) >= FAISS_MIN_ROWS else None
+    snapshot = _MatrixSnapshot(matrix, ids, types, matrix_i8, index)
+
+    with _matrix_lock:
+        if _all_generation == generation:
+            _all_snapshot = snapshot
+            _all_dirty = False
+        # else: changed meanwhile; stay dirty so the next reader rebuilds
+    return snapshot
+
+
+def _similarities(
+    matrix: np.ndarray,
+    query: np.ndarray,
+    matrix_i8: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Cosine similarity of every matrix row against `query` (both unit-normalized).
+    With an int8 matrix the scores are approximate (~1e-3); rescore the winner.
+    """
+    if SIMSIMD_AVAILABLE:
+        if matrix_i8 is not None:
+            lhs, rhs = _quantize_rows(query.reshape(1, -1)), matrix_i8
+        else:
+            lhs, rhs = query.reshape(1, -1), matrix
+        distances = simsimd.cdist(lhs, rhs, metric="cosine")
+        return 1.0 - np.asarray(distances, dtype=np.float32).ravel()
+    if _dot_rows_512 is not None and matrix.shape[1] == EMBEDDING_DIM:
+        # Per-call output: recognition runs on several worker threads at once
+        out = np.empty(len(matrix), dtype=np.float32)
+        _dot_rows_512(matrix, query, out)
+        return out
+    return matrix @ query
+
+
+_LOAD_BATCH_SIZE = 1000
+
+# Disk cache layout: v2 stores float16 embeddings and wraps the meta list as
+# {"format_version": 2, "entries": [...]}; v1 (a bare list, float32) still loads
+_FORMAT_VERSION = 2
+
+# Fields needed to build cache entries; the image blob itself is never fetched,
+# only whether it exists (aggregation expression in projection, MongoDB 4.4+)
+_STUDENT_CACHE_FIELDS = {
+    "face_embedding": 1, "full_name": 1, "student_id": 1,
+    "class_id": 1, "section": 1, "roll_number": 1
+}
+_TEACHER_CACHE_FIELDS = {"face_embedding": 1, "name": 1, "teacher_id": 1, "email": 1}
+# Fields read by EmbeddingGenerationService._process_one
+_EMBEDDING_SOURCE_FIELDS = {
+    "profile_image_url": 1, "student_id": 1, "teacher_id": 1, "full_name": 1,
+    "name": 1, "class_id": 1, "section": 1, "roll_number": 1, "email": 1
+}
+# Shape of get_today_activity rows, built server-side
+# Fields regenerate_all_embeddings needs to tell whether an embedding is current
+_SOURCE_CHECK_FIELDS = {
+    "profile_image_url": 1, "embedding_source_hash": 1,
+    "embedding_status": 1, "embedding_version": 1
+}
+_ACTIVITY_PROJECTION = {
+    "_id": 0,
+    "id": {"$toString": "$_id"},
+    "person_type": 1, "person_name": 1, "action": 1, "confidence": 1,
+    "class_id": {"$ifNull": ["$class_id", None]},
+    "section": {"$ifNull": ["$section", None]},
+    "time": {"$dateToString": {"format": "%H:%M", "date": "$timestamp"}}
+}
+_HAS_IMAGE_PROJECTION = {
+    "has_image": {"$ne": [{"$ifNull": ["$profile_image_blob", None]}, None]}
+}
+
+
+def _iter_batches(cursor, size: int):
+    """Yield lists of up to `size` documents from a cursor"""
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _cache_embedding_batch(cache_key: str, docs: List[Dict[str, Any]], build_entry, id_field: str) -> int:
+    """Parse a batch of DB embeddings into one float32 block and cache a row view per person"""
+    try:
+        block = np.stack([unpack_embedding(doc["face_embedding"]) for doc in docs])
+    except (ValueError, TypeError):
+        block = None  # ragged batch: fall back to per-document parsing
+    
+    count = 0
+    for i, doc in enumerate(docs):
+        try:
+            embedding = block[i] if block is not None else unpack_embedding(doc["face_embedding"])
+            _embedding_cache[cache_key][str(doc["_id"])] = build_entry(doc, embedding)
+            count += 1
+        except Exception as e:
+            logger.error(f"Failed to load embedding for {id_field} {doc.get(id_field)}: {e}")
+    return count
+
+
+def _top_k(snapshot: _MatrixSnapshot, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Indices and scores of the k best snapshot rows, best first"""
+    if snapshot.index is not None:
+        scores, indices = snapshot.index.search(query.reshape(1, -1), k)
+        keep = indices[0] >= 0
+        return indices[0][keep], scores[0][keep]
+    similarities = _similarities(snapshot.matrix, query, snapshot.matrix_i8)
+    if len(similarities) > k:
+        # O(N) selection instead of sorting every score
+        indices = np.argpartition(similarities, -k)[-k:]
+    else:
+        indices = np.arange(len(similarities))
+    indices = indices[np.argsort(similarities[indices])[::-1]]
+    return indices, similarities[indices]
+
 
 def load_cache_from_disk(cache_dir: str = "model_cache") -> Dict[str, int]:
     """Load cached embeddings from disk into in-memory cache.
@@ -141,21 +528,41 @@ def load_cache_from_disk(cache_dir: str = "model_cache") -> Dict[str, int]:
         meta_file = path / f"{key}_meta.json"
         if emb_file.exists() and meta_file.exists():
             try:
-                arr = np.load(str(emb_file))
-                with open(meta_file, "r", encoding="utf-8") as f:
-                    meta = json.load(f)
-
-                for i, item in enumerate(meta):
-                    person_id = item.get("person_id")
-                    if person_id is None:
+                # Map the file and copy it exactly once into the normalized
+                # SoA matrix; cache entries hold row views of that copy
+                arr = np.load(str(emb_file), mmap_mode='r')
+                mat = _normalize_rows(np.array(arr, dtype=np.float32))
+                del arr
+                with open(meta_file, "rb") as f:
+                    meta = _json_loads(f.read())
+                if isinstance(meta, dict):
+                    if meta.get("format_version") != _FORMAT_VERSION:
+                        logger.warning(f"Unknown {key} cache format {meta.get('format_version')}, ignoring disk cache")
                         continue
-                    emb = arr[i].astype(np.float32)
-                    # merge embedding and meta
-                    entry = {k: v for k, v in item.items() if k != "person_id"}
-                    entry["embedding"] = emb
-                    _embedding_cache[key][person_id] = entry
+                    meta = meta.get("entries", [])
+
+                with _matrix_lock:
+                    was_empty = not _embedding_cache[key]
+                    ids = []
+                    for i, item in enumerate(meta):
+                        person_id = item.get("person_id")
+                        if person_id is None:
+                            continue
+                        # merge embedding and meta
+                        entry = {k: v for k, v in item.items() if k != "person_id"}
+                        entry["embedding"] = mat[i]
+                        _embedding_cache[key][person_id] = entry
+                        ids.append(person_id)
 
-                counts[key] = len(meta)
+                    counts[key] = len(meta)
+                    if was_empty and len(ids) == len(mat) and len(_embedding_cache[key]) == len(ids):
+                        # Rows already line up with the cache: adopt the matrix as-is
+                        _embedding_matrix[key] = mat
+                        _embedding_ids[key] = ids
+                        _matrix_dirty[key] = False
+                        _mark_all_dirty()
+                    else:
+                        _invalidate_matrix(key)
                 logger.info(f"Loaded {counts[key]} {key} from disk cache")
             except Exception as e:
                 logger.error(f"Failed to load {key} cache from disk: {e}")
@@ -192,10 +599,11 @@ def dump_cache_to_disk(cache_dir: str = "model_cache") -> Dict[str, int]:
             arrs.append(np.array(data["embedding"], dtype=np.float32))
 
         try:
-            emb_array = np.stack(arrs, axis=0)
+            # Unit-norm embeddings fit float16 with ~1e-3 cosine error at half the size
+            emb_array = np.stack(arrs, axis=0).astype(np.float16)
             np.save(str(path / f"{key}_embeddings.npy"), emb_array)
-            with open(path / f"{key}_meta.json", "w", encoding="utf-8") as f:
-                json.dump(metas, f, ensure_ascii=False)
+            with open(path / f"{key}_meta.json", "wb") as f:
+                f.write(_json_dumps({"format_version": _FORMAT_VERSION, "entries": metas}))
             counts[key] = len(metas)
             logger.info(f"Saved {counts[key]} {key} to disk cache")
         except Exception as e:
@@ -204,6 +612,66 @@ def dump_cache_to_disk(cache_dir: str = "model_cache") -> Dict[str, int]:
     return counts
 
 
+def _upsert_attendance(collection, key: Dict[str, Any], doc: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Insert `key`+`doc` unless a record matching `key` exists.
+    Returns the pre-existing record, or None if this call inserted it.
+    """
+    update = {"$setOnInsert": doc}
+    try:
+        return collection.find_one_and_update(
+            key, update, upsert=True, return_document=ReturnDocument.BEFORE
+        )
+    except DuplicateKeyError:
+        # Lost an upsert race on the unique (school, person, date) index;
+        # the winner's record now exists, so this attempt just reads it back
+        return collection.find_one_and_update(
+            key, update, upsert=True, return_document=ReturnDocument.BEFORE
+        )
+
+
+# Telemetry writes scheduled off the request path; strong refs keep the tasks alive
+_background_tasks: Set["asyncio.Task"] = set()
+
+
+def _on_background_done(task: "asyncio.Task") -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Background face activity write failed: {task.exception()}")
+
+
+def _spawn_background(coro) -> "asyncio.Task":
+    """Run `coro` without awaiting it, logging (not raising) any failure"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_on_background_done)
+    return task
+
+
+# Shared keep-alive client for profile-image downloads, so bulk generation
+# reuses connections instead of a TLS handshake per image; created on first
+# use and closed from the application shutdown hook.
+_download_client = None
+
+
+def _get_download_client():
+    """Return the shared httpx.AsyncClient (raises ImportError without httpx)"""
+    global _download_client
+    if _download_client is None or _download_client.is_closed:
+        import httpx
+        _download_client = httpx.AsyncClient(
+            timeout=30.0,
+            limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+        )
+    return _download_client
+
+
+async def close_download_client():
+    global _download_client
+    if _download_client is not None:
+        await _download_client.aclose()
+        _download_client = None
+
+
 class FaceRecognitionService:
     """Main service for face recognition operations"""
     
@@ -222,52 +690,55 @@ class FaceRecognitionService:
         logger.info("=" * 60)
         
         # Load student embeddings
-        cursor = self.db.students.find({
-            "school_id": school_id,
-            "embedding_status": "generated",
-            "face_embedding": {"$ne": None}
-        })
+        cursor = self.db.students.find(
+            {
+                "school_id": school_id,
+                "embedding_status": "generated",
+                "face_embedding": {"$ne": None}
+            },
+            projection={**_STUDENT_CACHE_FIELDS, **_HAS_IMAGE_PROJECTION}
+        ).batch_size(_LOAD_BATCH_SIZE)
         
-        for student in cursor:
-            try:
-                embedding = np.array(student["face_embedding"], dtype=np.float32)
-                _embedding_cache["students"][str(student["_id"])] = {
-                    "embedding": embedding,
-                    "name": student.get("full_name", "Unknown"),
-                    "has_image": student.get("profile_image_blob") is not None,
-                    "student_id": student.get("student_id"),
-                    "class_id": student.get("class_id"),
-                    "section": student.get("section"),
-                    "roll_number": student.get("roll_number"),
-                    "school_id": school_id
-                }
-                student_count += 1
-            except Exception as e:
-                logger.error(f"Failed to load embedding for student {student.get('student_id')}: {e}")
+        def _student_entry(student: Dict[str, Any], embedding: np.ndarray) -> Dict[str, Any]:
+            return {
+                "embedding": embedding,
+                "name": student.get("full_name", "Unknown"),
+                "has_image": bool(student.get("has_image")),
+                "student_id": student.get("student_id"),
+                "class_id": student.get("class_id"),
+                "section": student.get("section"),
+                "roll_number": student.get("roll_number"),
+                "school_id": school_id
+            }
+        
+        for batch in _iter_batches(cursor, _LOAD_BATCH_SIZE):
+            student_count += _cache_embedding_batch("students", batch, _student_entry, "student_id")
         
         # Load employee/teacher embeddings
-        cursor = self.db.teachers.find({
-            "school_id": school_id,
-            "embedding_status": "generated",
-            "face_embedding": {"$ne": None}
-        })
+        cursor = self.db.teachers.find(
+            {
+                "school_id": school_id,
+                "embedding_status": "generated",
+                "face_embedding": {"$ne": None}
+            },
+            projection={**_TEACHER_CACHE_FIELDS, **_HAS_IMAGE_PROJECTION}
+        ).batch_size(_LOAD_BATCH_SIZE)
         
-        for teacher in cursor:
-            try:
-                embedding = np.array(teacher["face_embedding"], dtype=np.float32)
-                _embedding_cache["employees"][str(teacher["_id"])] = {
-                    "embedding": embedding,
-                    "name": teacher.get("name", "Unknown"),
-                    "has_image": teacher.get("profile_image_blob") is not None,
-                    "teacher_id": teacher.get("teacher_id"),
-                    "email": teacher.get("email"),
-                    "school_id": school_id
-                }
-                employee_count += 1
-            except Exception as e:
-                logger.error(f"Failed to load embedding for teacher {teacher.get('teacher_id')}: {e}")
+        def _teacher_entry(teacher: Dict[str, Any], embedding: np.ndarray) -> Dict[str, Any]:
+            return {
+                "embedding": embedding,
+                "name": teacher.get("name", "Unknown"),
+                "has_image": bool(teacher.get("has_image")),
+                "teacher_id": teacher.get("teacher_id"),
+                "email": teacher.get("email"),
+                "school_id": school_id
+            }
+        
+        for batch in _iter_batches(cursor, _LOAD_BATCH_SIZE):
+            employee_count += _cache_embedding_batch("employees", batch, _teacher_entry, "teacher_id")
         
         _cache_loaded = True
+        _invalidate_matrix()
         
         logger.info("=" * 60)
         logger.info(f"✅ EMBEDDINGS LOADED SUCCESSFULLY!")
@@ -306,10 +777,11 @@ class FaceRecognitionService:
         """Update a single entry in cache"""
         global _embedding_cache
         
-        if person_type == "student":
-            _embedding_cache["students"][person_id] = data
-        elif person_type == "employee":
-            _embedding_cache["employees"][person_id] = data
+        if person_type in ("student", "employee"):
+            cache_key = "students" if person_type == "student" else "employees"
+            with _matrix_lock:
+                _upsert_matrix_row(cache_key, person_id, data.get("embedding"))
+                _embedding_cache[cache_key][person_id] = data
         
         logger.info(f"Cache updated for {person_type}: {person_id}")
     
@@ -318,44 +790,105 @@ class FaceRecognitionService:
         global _embedding_cache
         
         cache_key = "students" if person_type == "student" else "employees"
-        if person_id in _embedding_cache[cache_key]:
-            del _embedding_cache[cache_key][person_id]
+        with _matrix_lock:
+            removed = _embedding_cache[cache_key].pop(person_id, None) is not None
+            if removed:
+                _remove_matrix_row(cache_key, person_id)
+        if removed:
             logger.info(f"Removed from cache: {person_type} {person_id}")
     
-    async def generate_embedding_from_url(self, image_url: str) -> Tuple[Optional[List[float]], Optional[str]]:
+    async def download_image(self, image_url: str) -> Tuple[Optional[bytes], Optional[str]]:
         """
-        Download image from URL and generate embedding.
-        DEPRECATED: Use generate_embedding_from_blob instead.
-        Returns (embedding_list, error_message)
+        Download an image over the shared keep-alive client.
+        Returns (image_bytes, error_message)
         """
+        # httpx is imported lazily so a missing optional dependency doesn't crash startup
+        try:
+            client = _get_download_client()
+        except Exception as e:
+            logger.error(f"httpx not available for downloading images: {e}")
+            return None, "httpx_missing"
+        
+        try:
+            response = await client.get(image_url)
+        except Exception as e:
+            logger.error(f"Image download failed: {e}")
+            return None, str(e)
+        
+        if response.status_code != 200:
+            return None, f"Failed to download image: HTTP {response.status_code}"
+        
+        logger.info(f"Downloaded image: {len(response.content)} bytes")
+        return response.content, None
+    
+    def _embed_image_array(self, image_data: bytes) -> Tuple[Optional[np.ndarray], Optional[str]]:
+        """Decode + embed downloaded image bytes. Returns (embedding, error_message)"""
         try:
-            # Lazy import httpx so missing optional dependency doesn't crash startup
-            try:
-                import httpx
-            except Exception as e:
-                logger.error(f"httpx not available for downloading images: {e}")
-                return None, "httpx_missing"
-
-            # Download image
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.get(image_url)
-                if response.status_code != 200:
-                    return None, f"Failed to download image: HTTP {response.status_code}"
-                image_data = response.content
-            
-            logger.info(f"Downloaded image: {len(image_data)} bytes")
-            
-            # Generate embedding
             embedding = self._image_bytes_to_embedding(image_data)
-            
-            if embedding is None:
-                return None, "No face detected in image"
-            
-            return embedding.tolist(), None
-            
         except Exception as e:
             logger.error(f"Embedding generation failed: {e}")
             return None, str(e)
+        
+        if embedding is None:
+            return None, "No face detected in image"
+        
+        return embedding, None
+    
+    def embed_image_bytes(self, image_data: bytes) -> Tuple[Optional[List[float]], Optional[str]]:
+        """
+        Decode + embed downloaded image bytes. Blocking; call from a worker thread.
+        Returns (embedding_list, error_message)
+        """
+        embedding, error = self._embed_image_array(image_data)
+        return (None if embedding is None else embedding.tolist()), error
+    
+    def generate_embeddings_batch(self, images: List[bytes]) -> List[Tuple[Optional[np.ndarray], Optional[str]]]:
+        """
+        Decode + embed several downloaded images, running the model once for
+        the whole group. Blocking; call from a worker thread.
+        Returns one (float32 embedding, error_message) per image, in order
+        """
+        _init_ml_libs()
+        if not USE_FACENET or Image is None:
+            return [self._embed_image_array(data) for data in images]
+        
+        from .embedding_service import EmbeddingGenerator
+        from .image_service import ImageService
+        
+        results: List[Tuple[Optional[np.ndarray], Optional[str]]] = [(None, None)] * len(images)
+        faces, face_slots = [], []
+        for i, data in enumerate(images):
+            try:
+                img = ImageService.decode_for_embedding(data)
+                if not isinstance(img, np.ndarray):
+                    img = img.convert('RGB')
+                face = EmbeddingGenerator.detect_and_crop_face(img)
+            except Exception as e:
+                logger.error(f"Embedding generation failed: {e}")
+                results[i] = (None, str(e))
+                continue
+            if face is None:
+                results[i] = (None, "No face detected in image")
+                continue
+            faces.append(face)
+            face_slots.append(i)
+        
+        for i, embedding in zip(face_slots, EmbeddingGenerator.generate_embeddings_batch(faces)):
+            results[i] = (embedding, None) if embedding is not None else (None, "No face detected in image")
+        return results
+    
+    async def generate_embedding_from_url(self, image_url: str) -> Tuple[Optional[List[float]], Optional[str]]:
+        """
+        Download image from URL and generate embedding.
+        DEPRECATED: Use generate_embedding_from_blob instead.
+        Returns (embedding_list, error_message)
+        """
+        image_data, error = await self.download_image(image_url)
+        if image_data is None:
+            return None, error
+        
+        # Decode + inference release the GIL; keep them off the event loop
+        return await asyncio.to_thread(self.embed_image_bytes, image_data)
     
     async def generate_embedding_from_blob(self, base64_blob: str) -> Tuple[Optional[List[float]], Optional[str]]:
         """
@@ -376,7 +909,8 @@ class FaceRecognitionService:
             logger.info(f"Decoded image blob: {len(image_data)} bytes")
             
             # Generate embedding
-            embedding = self._image_bytes_to_embedding(image_data)
+            # Decode + inference release the GIL; keep them off the event loop
+            embedding = await asyncio.to_thread(self._image_bytes_to_embedding, image_data)
             
             if embedding is None:
                 return None, "No face detected in image"
@@ -392,15 +926,17 @@ class FaceRecognitionService:
         # Lazily initialize ML libraries when first needed
         _init_ml_libs()
         
-        if USE_ONNX and Image is not None:
+        if _embed_fn is not None and Image is not None:
             try:
-                # Use EmbeddingGenerator from embedding_service for ONNX inference
-                from .embedding_service import EmbeddingGenerator
-                
-                img = Image.open(io.BytesIO(data)).convert('RGB')
+                # JPEGs decode via simplejpeg (SIMD IDCT) to an RGB array;
+                # everything else, or no simplejpeg, goes through Pillow
+                from .image_service import ImageService
+                img = ImageService.decode_for_embedding(data)
+                if not isinstance(img, np.ndarray):
+                    img = img.convert('RGB')
                 
                 # Use EmbeddingGenerator's face detection and embedding pipeline
-                embedding_list, status = EmbeddingGenerator.generate_embedding_from_image(img)
+                embedding_list, status = _embed_fn(img)
                 
                 if embedding_list is not None:
                     return np.array(embedding_list, dtype=np.float32)
@@ -420,20 +956,64 @@ class FaceRecognitionService:
                 if img is None:
                     return None
                 
-                gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-                small = cv2.resize(gray, (64, 64))
-                vec = small.astype(np.float32).flatten()
-                norm = np.linalg.norm(vec)
-                return vec / (norm if norm != 0 else 1.0)
+                return self._fallback_embedding(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY))
             except Exception as e:
                 logger.error(f"Fallback embedding failed: {e}")
                 return None
         
         return None
     
-    def _generate_embedding_from_bytes(self, data: bytes) -> Tuple[Optional[np.ndarray], Optional[str]]:
-        """Generate embedding from raw image bytes (for live recognition)"""
-        embedding = self._image_bytes_to_embedding(data)
+    def _fallback_embedding(self, gray: np.ndarray) -> np.ndarray:
+        """Grayscale 64x64 fallback vector (no ML required)"""
+        small = cv2.resize(gray, (64, 64))
+        if _norm_flatten_u8 is not None:
+            return _norm_flatten_u8(small)
+        vec = small.astype(np.float32).flatten()
+        return vec * (1.0 / max(float(np.linalg.norm(vec)), 1e-12))
+    
+    def _raw_rgb_to_embedding(self, rgb_bytes: bytes, width: int, height: int) -> Optional[np.ndarray]:
+        """Embedding from undecoded RGB24 pixels (row-major, width*height*3 bytes).
+        Skips image decoding entirely; the buffer is wrapped without copying.
+        """
+        _init_ml_libs()
+        
+        if width <= 0 or height <= 0 or len(rgb_bytes) != width * height * 3:
+            logger.warning(f"Raw RGB frame size mismatch: {len(rgb_bytes)} bytes for {width}x{height}")
+            return None
+        rgb = np.frombuffer(rgb_bytes, dtype=np.uint8).reshape(height, width, 3)
+        
+        if _embed_fn is not None:
+            try:
+                embedding_list, status = _embed_fn(rgb)
+                if embedding_list is not None:
+                    return np.array(embedding_list, dtype=np.float32)
+                logger.warning(f"Embedding generation failed: {status}")
+                return None
+            except Exception as e:
+                logger.error(f"ONNX embedding failed: {e}")
+                return None
+        
+        if CV2_AVAILABLE:
+            try:
+                return self._fallback_embedding(cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY))
+            except Exception as e:
+                logger.error(f"Fallback embedding failed: {e}")
+                return None
+        
+        return None
+    
+    def _generate_embedding_from_bytes(
+        self,
+        data: bytes,
+        raw_size: Optional[Tuple[int, int]] = None
+    ) -> Tuple[Optional[np.ndarray], Optional[str]]:
+        """Generate embedding from image bytes (for live recognition).
+        With raw_size=(width, height), `data` is raw RGB24 pixels instead of an encoded image.
+        """
+        if raw_size is not None:
+            embedding = self._raw_rgb_to_embedding(data, *raw_size)
+        else:
+            embedding = self._image_bytes_to_embedding(data)
         if embedding is None:
             return None, "no_face"
         return embedding, None
@@ -460,72 +1040,39 @@ class FaceRecognitionService:
         if query_norm == 0:
             logger.error("[COMPARE] Query embedding has zero norm!")
             return None
-        query_normalized = query_embedding / query_norm
-        
-        # Vectorized search for students
-        if _embedding_cache["students"]:
-            student_ids = list(_embedding_cache["students"].keys())
-            logger.info(f"[COMPARE] Comparing against {len(student_ids)} students")
-            student_embeddings = np.array([
-                _embedding_cache["students"][pid]["embedding"] 
-                for pid in student_ids
-            ], dtype=np.float32)
-            
-            # Batch normalize all student embeddings
-            norms = np.linalg.norm(student_embeddings, axis=1, keepdims=True)
-            norms = np.where(norms == 0, 1, norms)  # Avoid division by zero
-            student_embeddings_normalized = student_embeddings / norms
-            
-            # Vectorized cosine similarity (dot product of normalized vectors)
-            similarities = np.dot(student_embeddings_normalized, query_normalized)
-            
-            # Log top 3 student matches
-            top_3_indices = np.argsort(similarities)[-3:][::-1]
-            for idx in top_3_indices:
-                student_name = _embedding_cache["students"][student_ids[idx]].get("name", "Unknown")
-                logger.info(f"[COMPARE] Student: {student_name} -> {similarities[idx]:.4f}")
-            
-            # Find best match among students
-            best_student_idx = np.argmax(similarities)
-            if similarities[best_student_idx] > best_confidence:
-                best_confidence = similarities[best_student_idx]
-                best_person_id = student_ids[best_student_idx]
-                best_person_type = "student"
-        
-        # Vectorized search for employees
-        if _embedding_cache["employees"]:
-            employee_ids = list(_embedding_cache["employees"].keys())
-            logger.info(f"[COMPARE] Comparing against {len(employee_ids)} employees")
-            employee_embeddings = np.array([
-                _embedding_cache["employees"][pid]["embedding"] 
-                for pid in employee_ids
-            ], dtype=np.float32)
-            
-            # Batch normalize all employee embeddings
-            norms = np.linalg.norm(employee_embeddings, axis=1, keepdims=True)
-            norms = np.where(norms == 0, 1, norms)
-            employee_embeddings_normalized = employee_embeddings / norms
+        query_normalized = (query_embedding / query_norm).astype(np.float32, copy=False)
+        
+        # Vectorized search: one matvec over students and employees together
+        snapshot = _get_all_matrix()
+        matrix, ids, types = snapshot.matrix, snapshot.ids, snapshot.types
+        if ids:
+            logger.info(f"[COMPARE] Comparing against {len(ids)} cached embeddings")
             
-            # Vectorized cosine similarity
-            similarities = np.dot(employee_embeddings_normalized, query_normalized)
+            # Cosine similarity (dot product of normalized vectors), top 3 only
+            top_3_indices, top_3_scores = _top_k(snapshot, query_normalized, 3)
             
-            # Log top 3 employee matches
-            top_3_indices = np.argsort(similarities)[-3:][::-1]
-            for idx in top_3_indices:
-                employee_name = _embedding_cache["employees"][employee_ids[idx]].get("name", "Unknown")
-                logger.info(f"[COMPARE] Employee: {employee_name} -> {similarities[idx]:.4f}")
+            # Log top 3 matches
+            for idx, score in zip(top_3_indices, top_3_scores):
+                cache_key = _CACHE_KEYS[types[idx]]
+                name = _embedding_cache[cache_key].get(ids[idx], {}).get("name", "Unknown")
+                logger.info(f"[COMPARE] {_PERSON_TYPES[types[idx]].title()}: {name} -> {score:.4f}")
             
-            # Check if any employee beats current best
-            best_employee_idx = np.argmax(similarities)
-            if similarities[best_employee_idx] > best_confidence:
-                best_confidence = similarities[best_employee_idx]
-                best_person_id = employee_ids[best_employee_idx]
-                best_person_type = "employee"
+            best_idx = int(top_3_indices[0])
+            # Exact float32 score for the winner so thresholds see no quantization error
+            best_score = float(matrix[best_idx] @ query_normalized)
+            if best_score > best_confidence:
+                best_confidence = best_score
+                best_person_id = ids[best_idx]
+                best_person_type = _PERSON_TYPES[types[best_idx]]
         
         # Build match result if above threshold
         if best_person_id and best_confidence >= threshold:
             cache_key = "students" if best_person_type == "student" else "employees"
-            data = _embedding_cache[cache_key][best_person_id]
+            # The snapshot can outlive a removal from the cache
+            data = _embedding_cache[cache_key].get(best_person_id)
+            if data is None:
+                logger.info(f"[RETRY] ❌ Best match {best_person_id} was removed from the cache")
+                return None
             best_match = {
                 "person_type": best_person_type,
                 "person_id": best_person_id,
@@ -537,13 +1084,56 @@ class FaceRecognitionService:
         
         if best_person_id:
             cache_key = "students" if best_person_type == "student" else "employees"
-            name = _embedding_cache[cache_key][best_person_id].get("name", "Unknown")
+            name = _embedding_cache[cache_key].get(best_person_id, {}).get("name", "Unknown")
             logger.info(f"[RETRY] ❌ Low confidence: {best_confidence:.4f} for {name} (threshold: {threshold})")
         else:
             logger.info("[RETRY] ❌ No match found in cache")
         
         return None
     
+    def compare_embeddings_batch(
+        self,
+        query_matrix: np.ndarray,
+        threshold: float = 0.85
+    ) -> List[Optional[Dict[str, Any]]]:
+        """
+        Match several query embeddings (e.g. every face in one camera frame)
+        with a single matrix-matrix product instead of one matvec per face.
+        Returns one entry per query row: the match dict, or None below threshold.
+        """
+        queries = _normalize_rows(np.array(query_matrix, dtype=np.float32, ndmin=2))
+        snapshot = _get_all_matrix()
+        matrix, ids, types = snapshot.matrix, snapshot.ids, snapshot.types
+        if not ids or len(queries) == 0:
+            return [None] * len(queries)
+        
+        if snapshot.index is not None:
+            scores, indices = snapshot.index.search(queries, 1)
+            best_indices, best_scores = indices[:, 0], scores[:, 0]
+        else:
+            sims = queries @ matrix.T  # (Q, N) in one GEMM
+            best_indices = sims.argmax(axis=1)
+            best_scores = sims[np.arange(len(queries)), best_indices]
+        
+        results: List[Optional[Dict[str, Any]]] = []
+        for idx, score in zip(best_indices, best_scores):
+            if idx < 0 or score < threshold:
+                results.append(None)
+                continue
+            cache_key = _CACHE_KEYS[types[idx]]
+            data = _embedding_cache[cache_key].get(ids[idx])
+            if data is None:  # removed since the snapshot was built
+                results.append(None)
+                continue
+            results.append({
+                "person_type": _PERSON_TYPES[types[idx]],
+                "person_id": ids[idx],
+                "confidence": float(score),
+                **{k: v for k, v in data.items() if k != "embedding"}
+            })
+        logger.info(f"[COMPARE] Batch of {len(queries)}: {sum(r is not None for r in results)} matched")
+        return results
+    
     def _cosine_similarity(self, a: np.ndarray, b: np.ndarray) -> float:
         """Calculate cosine similarity between two vectors (kept for compatibility)"""
         dot = np.dot(a, b)
@@ -557,16 +1147,20 @@ class FaceRecognitionService:
         self,
         image_data: bytes,
         school_id: str,
-        settings: Dict[str, Any]
+        settings: Dict[str, Any],
+        raw_size: Optional[Tuple[int, int]] = None
     ) -> Dict[str, Any]:
         """
         Process a face recognition request.
         Returns match result or retry instruction.
+        
+        raw_size=(width, height) marks image_data as raw RGB24 pixels
+        (no JPEG/PNG decode); otherwise it is an encoded image.
         """
         threshold = settings.get("confidence_threshold", 0.85)
         
         # Generate embedding from captured image
-        embedding, error = self._generate_embedding_from_bytes(image_data)
+        embedding, error = await asyncio.to_thread(self._generate_embedding_from_bytes, image_data, raw_size)
         
         if error == "no_face":
             logger.info("[RETRY] No face detected")
@@ -584,8 +1178,8 @@ class FaceRecognitionService:
                 "message": "Recognition failed. Please try again."
             }
         
-        # Compare against cache
-        match = self.compare_embedding(embedding, threshold)
+        # Compare against cache (a matvec over every enrolled face; keep it off the loop)
+        match = await asyncio.to_thread(self.compare_embedding, embedding, threshold)
         
         if not match:
             return {
@@ -637,12 +1231,29 @@ class FaceRecognitionService:
         class_id = match.get("class_id")
         late_time = settings.get("late_after_time", "08:30")
         
-        # Check if already marked today
-        existing = self.db.attendance.find_one({
-            "school_id": school_id,
-            "student_id": student_id,
-            "date": today
-        })
+        # Status if this scan turns out to be the first one today (check-in)
+        status = "present" if current_time <= late_time else "late"
+        now = datetime.utcnow()
+        attendance_doc = {
+            "class_id": class_id,
+            "status": status,
+            "source": "face",
+            "check_in_time": current_time,
+            "check_out_time": None,
+            "confidence": confidence,
+            "scan_time": current_time,  # Backward compatibility
+            "notes": f"Face recognition check-in at {current_time}",
+            "created_at": now,
+            "updated_at": now
+        }
+        
+        # One atomic round trip: insert today's record if missing, otherwise
+        # hand back the existing one (None means we just checked in)
+        existing = _upsert_attendance(
+            self.db.attendance,
+            {"school_id": school_id, "student_id": student_id, "date": today},
+            attendance_doc
+        )
         
         if existing:
             # If check_out_time already set, student already left
@@ -659,9 +1270,9 @@ class FaceRecognitionService:
                     "confidence": confidence
                 }
             
-            # Update with check-out time
+            # Update with check-out time (only if no concurrent scan beat us to it)
             update_result = self.db.attendance.update_one(
-                {"_id": existing["_id"]},
+                {"_id": existing["_id"], "check_out_time": None},
                 {
                     "$set": {
                         "check_out_time": current_time,
@@ -669,10 +1280,26 @@ class FaceRecognitionService:
                     }
                 }
             )
+            if update_result.modified_count == 0:
+                # A concurrent scan recorded the check-out first
+                winner = self.db.attendance.find_one(
+                    {"_id": existing["_id"]}, {"check_out_time": 1}
+                ) or {}
+                logger.info(f"[FACE] Student {student_id} already checked out today")
+                return {
+                    "action": "already_checked_out",
+                    "name": match.get("name"),
+                    "student_id": student_id,
+                    "class_id": class_id,
+                    "section": match.get("section"),
+                    "check_in_time": existing.get("check_in_time"),
+                    "check_out_time": winner.get("check_out_time"),
+                    "confidence": confidence
+                }
             logger.info(f"[FACE][SUCCESS] Recorded check-out for student: {student_id} at {current_time}")
             
             # Log activity
-            self._log_activity(
+            _spawn_background(self._log_activity(
                 school_id=school_id,
                 person_type="student",
                 person_id=str(match["person_id"]),
@@ -681,7 +1308,7 @@ class FaceRecognitionService:
                 confidence=confidence,
                 class_id=class_id,
                 section=match.get("section")
-            )
+            ))
             
             return {
                 "action": "check_out",
@@ -696,31 +1323,10 @@ class FaceRecognitionService:
                 "confidence": confidence
             }
         
-        # Determine status for first scan (check-in)
-        status = "present" if current_time <= late_time else "late"
-        
-        # Insert attendance record with check-in
-        attendance_doc = {
-            "school_id": school_id,
-            "class_id": class_id,
-            "student_id": student_id,
-            "date": today,
-            "status": status,
-            "source": "face",
-            "check_in_time": current_time,
-            "check_out_time": None,
-            "confidence": confidence,
-            "scan_time": current_time,  # Backward compatibility
-            "notes": f"Face recognition check-in at {current_time}",
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
-        }
-        
-        result = self.db.attendance.insert_one(attendance_doc)
         logger.info(f"[FACE][SUCCESS] Recorded check-in ({status}) for student: {student_id} at {current_time}")
         
         # Log activity
-        self._log_activity(
+        _spawn_background(self._log_activity(
             school_id=school_id,
             person_type="student",
             person_id=str(match["person_id"]),
@@ -729,7 +1335,7 @@ class FaceRecognitionService:
             confidence=confidence,
             class_id=class_id,
             section=match.get("section")
-        )
+        ))
         
         return {
             "action": "check_in",
@@ -757,12 +1363,23 @@ class FaceRecognitionService:
         teacher_id = match.get("teacher_id")
         late_time = settings.get("employee_late_after", "08:30")
         
-        # Check existing record for today
-        existing = self.db.employee_attendance.find_one({
-            "school_id": school_id,
-            "teacher_id": teacher_id,
-            "date": today
-        })
+        status = "present" if current_time <= late_time else "late"
+        now = datetime.utcnow()
+        attendance_doc = {
+            "status": status,
+            "check_in_time": current_time,
+            "check_in_confidence": confidence,
+            "source": "face",
+            "created_at": now,
+            "updated_at": now
+        }
+        
+        # Insert-or-fetch today's record in one round trip
+        existing = _upsert_attendance(
+            self.db.employee_attendance,
+            {"school_id": school_id, "teacher_id": teacher_id, "date": today},
+            attendance_doc
+        )
         
         if existing:
             if existing.get("check_out_time"):
@@ -776,9 +1393,9 @@ class FaceRecognitionService:
                     "confidence": confidence
                 }
             
-            # Record check-out
-            self.db.employee_attendance.update_one(
-                {"_id": existing["_id"]},
+            # Record check-out (only if no concurrent scan beat us to it)
+            update_result = self.db.employee_attendance.update_one(
+                {"_id": existing["_id"], "check_out_time": None},
                 {
                     "$set": {
                         "check_out_time": current_time,
@@ -787,16 +1404,29 @@ class FaceRecognitionService:
                     }
                 }
             )
+            if update_result.modified_count == 0:
+                winner = self.db.employee_attendance.find_one(
+                    {"_id": existing["_id"]}, {"check_out_time": 1}
+                ) or {}
+                logger.info(f"[FACE] Employee {teacher_id} already checked out")
+                return {
+                    "action": "already_checked_out",
+                    "name": match.get("name"),
+                    "teacher_id": teacher_id,
+                    "check_in_time": existing.get("check_in_time"),
+                    "check_out_time": winner.get("check_out_time"),
+                    "confidence": confidence
+                }
             logger.info(f"[FACE][SUCCESS] Check-out recorded for employee: {teacher_id}")
             
-            self._log_activity(
+            _spawn_background(self._log_activity(
                 school_id=school_id,
                 person_type="employee",
                 person_id=str(match["person_id"]),
                 person_name=match.get("name", "Unknown"),
                 action="check_out",
                 confidence=confidence
-            )
+            ))
             
             return {
                 "action": "check_out",
@@ -807,32 +1437,16 @@ class FaceRecognitionService:
                 "confidence": confidence
             }
         
-        # Record check-in
-        status = "present" if current_time <= late_time else "late"
-        
-        attendance_doc = {
-            "school_id": school_id,
-            "teacher_id": teacher_id,
-            "date": today,
-            "status": status,
-            "check_in_time": current_time,
-            "check_in_confidence": confidence,
-            "source": "face",
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow()
-        }
-        
-        self.db.employee_attendance.insert_one(attendance_doc)
         logger.info(f"[FACE][SUCCESS] Check-in recorded for employee: {teacher_id} ({status})")
         
-        self._log_activity(
+        _spawn_background(self._log_activity(
             school_id=school_id,
             person_type="employee",
             person_id=str(match["person_id"]),
             person_name=match.get("name", "Unknown"),
             action="check_in" if status == "present" else "late",
             confidence=confidence
-        )
+        ))
         
         return {
             "action": "check_in",
@@ -856,7 +1470,7 @@ class FaceRecognitionService:
         section: Optional[str] = None
     ):
         """Log face activity for dashboard"""
-        self.db.face_activity_logs.insert_one({
+        await asyncio.to_thread(self.db.face_activity_logs.insert_one, {
             "school_id": school_id,
             "person_type": person_type,
             "person_id": person_id,
@@ -870,29 +1484,42 @@ class FaceRecognitionService:
     
     async def get_dashboard_stats(self, school_id: str) -> Dict[str, Any]:
         """Get face recognition dashboard statistics"""
-        # Get class-wise stats
+        counters = {
+            "total": {"$sum": 1},
+            "face_ready": {
+                "$sum": {"$cond": [{"$eq": ["$embedding_status", "generated"]}, 1, 0]}
+            },
+            "pending": {
+                "$sum": {"$cond": [
+                    {"$or": [
+                        {"$eq": ["$embedding_status", "pending"]},
+                        {"$eq": ["$embedding_status", None]}
+                    ]},
+                    1, 0
+                ]}
+            }
+        }
+        
+        # Class-wise student stats and the employee totals in one round trip:
+        # teachers are appended via $unionWith and grouped under _id "employees"
         pipeline = [
             {"$match": {"school_id": school_id, "status": "active"}},
-            {"$group": {
-                "_id": {"class_id": "$class_id", "section": "$section"},
-                "total": {"$sum": 1},
-                "face_ready": {
-                    "$sum": {"$cond": [{"$eq": ["$embedding_status", "generated"]}, 1, 0]}
-                },
-                "pending": {
-                    "$sum": {"$cond": [
-                        {"$or": [
-                            {"$eq": ["$embedding_status", "pending"]},
-                            {"$eq": ["$embedding_status", None]}
-                        ]},
-                        1, 0
-                    ]}
-                }
+            {"$group": {"_id": {"class_id": "$class_id", "section": "$section"}, **counters}},
+            {"$unionWith": {
+                "coll": "teachers",
+                "pipeline": [
+                    {"$match": {"school_id": school_id}},
+                    {"$group": {"_id": "employees", **counters}}
+                ]
             }}
         ]
         
         class_stats = []
+        emp_stat = {"total": 0, "face_ready": 0, "pending": 0}
         for stat in self.db.students.aggregate(pipeline):
+            if stat["_id"] == "employees":
+                emp_stat = stat
+                continue
             class_stats.append({
                 "class_id": stat["_id"]["class_id"],
                 "section": stat["_id"]["section"],
@@ -901,29 +1528,6 @@ class FaceRecognitionService:
                 "pending": stat["pending"]
             })
         
-        # Get employee stats
-        employee_stats = list(self.db.teachers.aggregate([
-            {"$match": {"school_id": school_id}},
-            {"$group": {
-                "_id": None,
-                "total": {"$sum": 1},
-                "face_ready": {
-                    "$sum": {"$cond": [{"$eq": ["$embedding_status", "generated"]}, 1, 0]}
-                },
-                "pending": {
-                    "$sum": {"$cond": [
-                        {"$or": [
-                            {"$eq": ["$embedding_status", "pending"]},
-                            {"$eq": ["$embedding_status", None]}
-                        ]},
-                        1, 0
-                    ]}
-                }
-            }}
-        ]))
-        
-        emp_stat = employee_stats[0] if employee_stats else {"total": 0, "face_ready": 0, "pending": 0}
-        
         return {
             "classes": class_stats,
             "employees": {
@@ -937,25 +1541,14 @@ class FaceRecognitionService:
         """Get today's face recognition activity"""
         today_start = datetime.combine(date.today(), datetime.min.time())
         
-        cursor = self.db.face_activity_logs.find({
-            "school_id": school_id,
-            "timestamp": {"$gte": today_start}
-        }).sort("timestamp", -1).limit(limit)
-        
-        activities = []
-        for log in cursor:
-            activities.append({
-                "id": str(log["_id"]),
-                "person_type": log["person_type"],
-                "person_name": log["person_name"],
-                "action": log["action"],
-                "confidence": log["confidence"],
-                "class_id": log.get("class_id"),
-                "section": log.get("section"),
-                "time": log["timestamp"].strftime("%H:%M")
-            })
-        
-        return activities
+        # Rows come back already formatted; sort + limit use the
+        # (school_id, timestamp) index
+        return list(self.db.face_activity_logs.aggregate([
+            {"$match": {"school_id": school_id, "timestamp": {"$gte": today_start}}},
+            {"$sort": {"timestamp": -1}},
+            {"$limit": limit},
+            {"$project": _ACTIVITY_PROJECTION}
+        ], batchSize=limit))
     
     async def get_today_summary(self, school_id: str) -> Dict[str, Any]:
         """Get today's check-in/check-out summary statistics"""
@@ -1333,52 +1926,52 @@ class FaceRecognitionService:
         if error:
             return []
         
-        rankings = []
-        
         # Normalize query embedding once
         query_norm = np.linalg.norm(embedding)
         if query_norm == 0:
             return []
-        query_normalized = embedding / query_norm
+        query_normalized = (embedding / query_norm).astype(np.float32)
+        
+        # This runs in a worker thread while the event loop may update the
+        # cache; iterate over snapshots (list() copies the items under the GIL)
+        students = list(_embedding_cache["students"].items())
+        employees = list(_embedding_cache["employees"].items())
+        
+        def _scores(entries):
+            """Score a snapshot in one matrix pass (numba/SIMD via _similarities).
+            Returns [(person_id, data, similarity)], skipping zero and mismatched vectors."""
+            rows = [(pid, data) for pid, data in entries if np.size(data["embedding"]) == query_normalized.size]
+            if not rows:
+                return []
+            mat = np.stack([np.asarray(data["embedding"], dtype=np.float32).ravel() for _, data in rows])
+            nonzero = np.linalg.norm(mat, axis=1) > 0
+            sims = _similarities(_normalize_rows(mat), query_normalized)
+            return [(pid, data, float(sim)) for (pid, data), sim, ok in zip(rows, sims, nonzero) if ok]
+        
+        rankings = []
         
         # Compare against all students
-        for student_id, data in _embedding_cache["students"].items():
-            student_embedding = data["embedding"]
-            
-            # Normalize and calculate similarity
-            norm = np.linalg.norm(student_embedding)
-            if norm > 0:
-                normalized = student_embedding / norm
-                similarity = float(np.dot(normalized, query_normalized))
-                
-                rankings.append({
-                    "person_type": "student",
-                    "person_id": student_id,
-                    "name": data.get("name", "Unknown"),
-                    "student_id": data.get("student_id", "N/A"),
-                    "class_id": data.get("class_id", "N/A"),
-                    "section": data.get("section", "N/A"),
-                    "confidence": similarity
-                })
+        for student_id, data, similarity in _scores(students):
+            rankings.append({
+                "person_type": "student",
+                "person_id": student_id,
+                "name": data.get("name", "Unknown"),
+                "student_id": data.get("student_id", "N/A"),
+                "class_id": data.get("class_id", "N/A"),
+                "section": data.get("section", "N/A"),
+                "confidence": similarity
+            })
         
         # Compare against all teachers
-        for teacher_id, data in _embedding_cache["employees"].items():
-            teacher_embedding = data["embedding"]
-            
-            # Normalize and calculate similarity
-            norm = np.linalg.norm(teacher_embedding)
-            if norm > 0:
-                normalized = teacher_embedding / norm
-                similarity = float(np.dot(normalized, query_normalized))
-                
-                rankings.append({
-                    "person_type": "teacher",
-                    "person_id": teacher_id,
-                    "name": data.get("name", "Unknown"),
-                    "teacher_id": data.get("teacher_id", "N/A"),
-                    "email": data.get("email", "N/A"),
-                    "confidence": similarity
-                })
+        for teacher_id, data, similarity in _scores(employees):
+            rankings.append({
+                "person_type": "teacher",
+                "person_id": teacher_id,
+                "name": data.get("name", "Unknown"),
+                "teacher_id": data.get("teacher_id", "N/A"),
+                "email": data.get("email", "N/A"),
+                "confidence": similarity
+            })
         
         # Sort by confidence descending
         rankings.sort(key=lambda x: x["confidence"], reverse=True)
@@ -1415,6 +2008,29 @@ class FaceRecognitionService:
         }
 
 
+# Bulk generation is a pipeline: EMBEDDING_DOWNLOAD_WORKERS tasks fetch images
+# concurrently and hand them over a bounded queue to one inference task per
+# thread in the shared inference pool, so network and ONNX time overlap.
+EMBEDDING_DOWNLOAD_WORKERS = 8
+EMBEDDING_INFER_WORKERS = os.cpu_count() or 2
+EMBEDDING_QUEUE_SIZE = 32
+# Images already waiting on the queue are embedded together, up to this many per ONNX run
+EMBEDDING_INFER_BATCH = 16
+# Result writes are flushed as one unordered bulk_write per this many records
+EMBEDDING_WRITE_BATCH = 500
+
+
+_infer_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _get_infer_pool() -> ThreadPoolExecutor:
+    """Shared across requests; EmbeddingGenerationService is built per call"""
+    global _infer_pool
+    if _infer_pool is None:
+        _infer_pool = ThreadPoolExecutor(max_workers=EMBEDDING_INFER_WORKERS, thread_name_prefix="embed")
+    return _infer_pool
+
+
 class EmbeddingGenerationService:
     """Service for bulk embedding generation"""
     
@@ -1446,86 +2062,201 @@ class EmbeddingGenerationService:
         else:
             query["profile_image_url"] = {"$ne": None}
         
-        cursor = collection.find(query)
+        cursor = collection.find(query, projection=_EMBEDDING_SOURCE_FIELDS).batch_size(500)
         
-        success_count = 0
-        failed_count = 0
-        total = 0
+        outcomes: List[str] = []
+        ops: List[UpdateOne] = []
+        cache_updates: List[Tuple[str, str, Dict[str, Any]]] = []
+        pool = _get_infer_pool()
+        record_q: asyncio.Queue = asyncio.Queue(EMBEDDING_QUEUE_SIZE)
+        image_q: asyncio.Queue = asyncio.Queue(EMBEDDING_QUEUE_SIZE)
         
-        async for record in cursor:
-            total += 1
-            record_id = str(record["_id"])
-            image_url = record.get("profile_image_url")
-            identifier = record.get("student_id") if person_type == "student" else record.get("teacher_id")
-            
-            if not image_url:
-                logger.info(f"[FACE] Skipping {identifier}: No image")
-                continue
-            
-            logger.info(f"[FACE][INFO] Generating embedding for {person_type}: {identifier}")
-            
-            embedding, error = await self.face_service.generate_embedding_from_url(image_url)
-            
-            if embedding:
-                collection.update_one(
-                    {"_id": record["_id"]},
-                    {
-                        "$set": {
-                            "face_embedding": embedding,
-                            "embedding_status": "generated",
-                            "embedding_generated_at": datetime.utcnow(),
-                            "embedding_model": "arcface_resnet100_onnx" if USE_ONNX else "fallback",
-                            "embedding_version": _get_embedding_version()
-                        }
-                    }
-                )
-                logger.info(f"[FACE][SUCCESS] Embedding stored for {person_type}: {identifier}")
-                
-                # Update cache
-                cache_data = {
-                    "embedding": np.array(embedding, dtype=np.float32),
-                    "name": record.get("full_name") if person_type == "student" else record.get("name"),
-                    "profile_image_url": record.get("profile_image_url"),
-                    "school_id": school_id
-                }
-                if person_type == "student":
-                    cache_data.update({
-                        "student_id": identifier,
-                        "class_id": record.get("class_id"),
-                        "section": record.get("section"),
-                        "roll_number": record.get("roll_number")
-                    })
-                else:
-                    cache_data.update({
-                        "teacher_id": identifier,
-                        "email": record.get("email")
-                    })
+        async def feed():
+            # The cursor is synchronous pymongo: pull each batch off the event loop
+            batches = _iter_batches(cursor, EMBEDDING_QUEUE_SIZE)
+            try:
+                while True:
+                    batch = await asyncio.to_thread(next, batches, None)
+                    if batch is None:
+                        break
+                    for record in batch:
+                        await record_q.put(record)
+            finally:
+                # Always release the downloaders, even if the cursor failed
+                for _ in range(EMBEDDING_DOWNLOAD_WORKERS):
+                    await record_q.put(None)
+        
+        async def download():
+            while True:
+                record = await record_q.get()
+                if record is None:
+                    return
+                image_url = record.get("profile_image_url")
+                if not image_url:
+                    identifier = record.get("student_id") if person_type == "student" else record.get("teacher_id")
+                    logger.info(f"[FACE] Skipping {identifier}: No image")
+                    outcomes.append("skipped")
+                    continue
+                image_data, error = await self.face_service.download_image(image_url)
+                await image_q.put((record, image_data, error))
+        
+        def record_result(record, embedding, error):
+            outcome, op, cache_update = self._build_result(
+                record, person_type, school_id, embedding, error
+            )
+            outcomes.append(outcome)
+            ops.append(op)
+            if cache_update is not None:
+                cache_updates.append(cache_update)
+        
+        async def infer():
+            loop = asyncio.get_running_loop()
+            done = False
+            while not done:
+                # Block for one image, then take whatever else is already queued
+                # (stopping at a sentinel so every consumer still receives one)
+                items = [await image_q.get()]
+                while items[-1] is not None and len(items) < EMBEDDING_INFER_BATCH and not image_q.empty():
+                    items.append(image_q.get_nowait())
+                if items[-1] is None:
+                    done = True
+                    items.pop()
                 
-                self.face_service.refresh_cache_entry(
-                    "student" if person_type == "student" else "employee",
-                    record_id,
-                    cache_data
-                )
-                success_count += 1
-            else:
-                collection.update_one(
-                    {"_id": record["_id"]},
-                    {
-                        "$set": {
-                            "embedding_status": "failed",
-                            "embedding_error": error
-                        }
-                    }
-                )
-                logger.error(f"[FACE][ERROR] Embedding failed for {person_type}: {identifier} - {error}")
-                failed_count += 1
+                # A failing batch is recorded and the consumer keeps draining:
+                # if every consumer died, the downloaders would block forever
+                # on the full image_q
+                batch = []
+                for record, image_data, error in items:
+                    if image_data is None:
+                        record_result(record, None, error)
+                    else:
+                        batch.append((record, image_data))
+                if batch:
+                    try:
+                        results = await loop.run_in_executor(
+                            pool, self.face_service.generate_embeddings_batch, [data for _, data in batch]
+                        )
+                    except Exception as e:
+                        logger.error(f"[FACE][ERROR] Embedding batch of {len(batch)} failed: {e}")
+                        results = [(None, f"Inference failed: {e}")] * len(batch)
+                    for (record, _), (embedding, error) in zip(batch, results):
+                        record_result(record, embedding, error)
+                if len(ops) >= EMBEDDING_WRITE_BATCH:
+                    self._flush_results_safely(collection, ops, cache_updates)
+        
+        consumers = [asyncio.create_task(infer()) for _ in range(EMBEDDING_INFER_WORKERS)]
+        try:
+            await asyncio.gather(feed(), *(download() for _ in range(EMBEDDING_DOWNLOAD_WORKERS)))
+            for _ in range(EMBEDDING_INFER_WORKERS):
+                await image_q.put(None)
+            await asyncio.gather(*consumers)
+        finally:
+            for task in consumers:
+                task.cancel()
+        self._flush_results_safely(collection, ops, cache_updates)
         
         return {
-            "total": total,
-            "success": success_count,
-            "failed": failed_count
+            "total": len(outcomes),
+            "success": outcomes.count("success"),
+            "failed": outcomes.count("failed")
         }
     
+    def _flush_results(
+        self,
+        collection,
+        ops: List[UpdateOne],
+        cache_updates: List[Tuple[str, str, Dict[str, Any]]]
+    ):
+        """Write buffered success/failure updates in one round trip, then refresh the cache"""
+        if ops:
+            collection.bulk_write(ops, ordered=False, bypass_document_validation=True)
+        for person_type, record_id, cache_data in cache_updates:
+            self.face_service.refresh_cache_entry(person_type, record_id, cache_data)
+        ops.clear()
+        cache_updates.clear()
+    
+    def _flush_results_safely(
+        self,
+        collection,
+        ops: List[UpdateOne],
+        cache_updates: List[Tuple[str, str, Dict[str, Any]]]
+    ):
+        """_flush_results that logs and drops the buffer on a write error instead of raising"""
+        try:
+            self._flush_results(collection, ops, cache_updates)
+        except PyMongoError as e:
+            logger.error(f"[FACE][ERROR] Failed to write {len(ops)} embedding results: {e}")
+            ops.clear()
+            cache_updates.clear()
+    
+    def _build_result(
+        self,
+        record: Dict[str, Any],
+        person_type: str,
+        school_id: str,
+        embedding: Optional[np.ndarray],
+        error: Optional[str]
+    ) -> Tuple[str, UpdateOne, Optional[Tuple[str, str, Dict[str, Any]]]]:
+        """
+        Turn one record's embedding result into (outcome, db update, cache update).
+        Writes are left to the caller so they can be batched.
+        """
+        record_id = str(record["_id"])
+        identifier = record.get("student_id") if person_type == "student" else record.get("teacher_id")
+        
+        if embedding is not None:
+            packed = pack_embedding(embedding)
+            op = UpdateOne(
+                {"_id": record["_id"]},
+                {
+                    "$set": {
+                        "face_embedding": packed,
+                        "embedding_dtype": EMBEDDING_DTYPE,
+                        "embedding_source_hash": _source_hash(record["profile_image_url"]),
+                        "embedding_status": "generated",
+                        "embedding_generated_at": datetime.utcnow(),
+                        "embedding_model": "arcface_resnet100_onnx" if USE_FACENET else "fallback",
+                        "embedding_version": _get_embedding_version()
+                    }
+                }
+            )
+            logger.info(f"[FACE][SUCCESS] Embedding generated for {person_type}: {identifier}")
+        
+            # Cache the stored (float16-rounded) vector so it matches a later reload
+            cache_data = {
+                "embedding": unpack_embedding(packed),
+                "name": record.get("full_name") if person_type == "student" else record.get("name"),
+                "profile_image_url": record.get("profile_image_url"),
+                "school_id": school_id
+            }
+            if person_type == "student":
+                cache_data.update({
+                    "student_id": identifier,
+                    "class_id": record.get("class_id"),
+                    "section": record.get("section"),
+                    "roll_number": record.get("roll_number")
+                })
+            else:
+                cache_data.update({
+                    "teacher_id": identifier,
+                    "email": record.get("email")
+                })
+        
+            cache_update = ("student" if person_type == "student" else "employee", record_id, cache_data)
+            return "success", op, cache_update
+        else:
+            op = UpdateOne(
+                {"_id": record["_id"]},
+                {
+                    "$set": {
+                        "embedding_status": "failed",
+                        "embedding_error": error
+                    }
+                }
+            )
+            logger.error(f"[FACE][ERROR] Embedding failed for {person_type}: {identifier} - {error}")
+            return "failed", op, None
+    
     async def regenerate_all_embeddings(
         self,
         school_id: str,
@@ -1542,27 +2273,55 @@ class EmbeddingGenerationService:
         if person_type == "student" and class_id:
             query["class_id"] = class_id
         
-        # Clear existing embeddings first
-        collection.update_many(
-            query,
-            {
-                "$set": {
-                    "embedding_status": "pending",
-                    "face_embedding": None
+        # Only records whose image or model changed since their embedding was
+        # generated need regenerating; the rest keep their embedding and cache entry
+        version = _get_embedding_version()
+        scanned = 0
+        stale_ids = []
+        for doc in collection.find(query, projection=_SOURCE_CHECK_FIELDS).batch_size(1000):
+            scanned += 1
+            unchanged = (
+                doc.get("embedding_status") == "generated"
+                and doc.get("embedding_version") == version
+                and doc.get("embedding_source_hash") == _source_hash(doc["profile_image_url"])
+            )
+            if not unchanged:
+                stale_ids.append(doc["_id"])
+        
+        # Clear stale embeddings, skipping docs that are already cleared
+        for ids in _iter_batches(stale_ids, 1000):
+            collection.update_many(
+                {
+                    "_id": {"$in": ids},
+                    "$or": [
+                        {"embedding_status": {"$ne": "pending"}},
+                        {"face_embedding": {"$ne": None}}
+                    ]
+                },
+                {
+                    "$set": {
+                        "embedding_status": "pending",
+                        "face_embedding": None
+                    }
                 }
-            }
-        )
+            )
         
-        # Clear cache for this school
+        # Drop the stale entries from the cache: build the filtered dict, then swap
+        # it in with one assignment so readers never see a half-purged mapping
         global _embedding_cache
         cache_key = "students" if person_type == "student" else "employees"
-        _embedding_cache[cache_key] = {
-            k: v for k, v in _embedding_cache[cache_key].items()
-            if v.get("school_id") != school_id
-        }
+        stale = {str(oid) for oid in stale_ids}
+        with _matrix_lock:
+            _embedding_cache[cache_key] = {
+                k: v for k, v in _embedding_cache[cache_key].items()
+                if k not in stale
+            }
+            _invalidate_matrix(cache_key)
         
         # Generate new embeddings
-        return await self.generate_missing_embeddings(school_id, person_type, class_id)
+        result = await self.generate_missing_embeddings(school_id, person_type, class_id)
+        result["unchanged"] = scanned - len(stale_ids)
+        return result
     
     async def regenerate_single_embedding(
         self,
@@ -1573,7 +2332,12 @@ class EmbeddingGenerationService:
         """Regenerate embedding for a single person"""
         collection = self.db.students if person_type == "student" else self.db.teachers
         
-        record = collection.find_one({"_id": ObjectId(person_id), "school_id": school_id})
+        try:
+            oid = ObjectId(person_id)
+        except (InvalidId, TypeError):
+            return {"success": False, "error": "Invalid id"}
+        
+        record = collection.find_one({"_id": oid, "school_id": school_id})
         
         if not record:
             return {"success": False, "error": "Record not found"}
@@ -1585,62 +2349,19 @@ class EmbeddingGenerationService:
         identifier = record.get("student_id") if person_type == "student" else record.get("teacher_id")
         logger.info(f"[FACE][INFO] Regenerating embedding for {person_type}: {identifier}")
         
-        embedding, error = await self.face_service.generate_embedding_from_url(image_url)
-        
-        if embedding:
-            collection.update_one(
-                {"_id": ObjectId(person_id)},
-                {
-                    "$set": {
-                        "face_embedding": embedding,
-                        "embedding_status": "generated",
-                        "embedding_generated_at": datetime.utcnow(),
-                        "embedding_model": "arcface_resnet100_onnx" if USE_ONNX else "fallback",
-                        "embedding_version": _get_embedding_version()
-                    }
-                }
+        image_data, error = await self.face_service.download_image(image_url)
+        embedding = None
+        if image_data is not None:
+            (embedding, error), = await asyncio.to_thread(
+                self.face_service.generate_embeddings_batch, [image_data]
             )
-            logger.info(f"[FACE][SUCCESS] Embedding regenerated for {person_type}: {identifier}")
-            
-            # Update cache
-            cache_data = {
-                "embedding": np.array(embedding, dtype=np.float32),
-                "name": record.get("full_name") if person_type == "student" else record.get("name"),
-                "profile_image_url": record.get("profile_image_url"),
-                "school_id": school_id
-            }
-            if person_type == "student":
-                cache_data.update({
-                    "student_id": identifier,
-                    "class_id": record.get("class_id"),
-                    "section": record.get("section"),
-                    "roll_number": record.get("roll_number")
-                })
-            else:
-                cache_data.update({
-                    "teacher_id": identifier,
-                    "email": record.get("email")
-                })
-            
-            self.face_service.refresh_cache_entry(
-                "student" if person_type == "student" else "employee",
-                person_id,
-                cache_data
-            )
-            
+        
+        outcome, op, cache_update = self._build_result(record, person_type, school_id, embedding, error)
+        self._flush_results(collection, [op], [cache_update] if cache_update else [])
+        
+        if outcome == "success":
             return {"success": True}
-        else:
-            collection.update_one(
-                {"_id": ObjectId(person_id)},
-                {
-                    "$set": {
-                        "embedding_status": "failed",
-                        "embedding_error": error
-                    }
-                }
-            )
-            logger.error(f"[FACE][ERROR] Regeneration failed for {person_type}: {identifier} - {error}")
-            return {"success": False, "error": error}
+        return {"success": False, "error": error}
 
 
 # Settings service
@@ -2,10 +2,17 @@ from app.database import get_db
 from datetime import datetime
 from typing import Optional
 from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import PyMongoError
 import logging
 
 logger = logging.getLogger(__name__)
 
+def _with_str_id(doc: dict) -> dict:
+    """Swap the ObjectId `_id` for a string `id` in place"""
+    doc["id"] = str(doc.pop("_id"))
+    return doc
+
 # ================= Fee Operations =================
 
 def create_fee(fee_data: dict, school_id: str = None) -> Optional[dict]:
@@ -31,9 +38,7 @@ def get_all_fees(filters: dict = None, school_id: str = None) -> list:
     if school_id:
         query["school_id"] = school_id
         logger.info(f"[SCHOOL:{school_id}] Fetching fees")
-    fees = list(db.fees.find(query))
-    for fee in fees:
-        fee["id"] = str(fee["_id"])
+    fees = [_with_str_id(fee) for fee in db.fees.find(query).batch_size(500)]
     if school_id:
         logger.info(f"[SCHOOL:{school_id}] ✅ Retrieved {len(fees)} fees")
     return fees
@@ -49,7 +54,7 @@ def get_fee_by_id(fee_id: str, school_id: str = None) -> Optional[dict]:
         if fee:
             fee["id"] = str(fee["_id"])
         return fee
-    except:
+    except (InvalidId, PyMongoError):
         return None
 
 def update_fee(fee_id: str, school_id: str = None, **kwargs) -> Optional[dict]:
@@ -87,7 +92,7 @@ def delete_fee(fee_id: str, school_id: str = None) -> bool:
         if school_id and result.deleted_count > 0:
             logger.info(f"[SCHOOL:{school_id}] ✅ Fee {fee_id} deleted")
         return result.deleted_count > 0
-    except:
+    except (InvalidId, PyMongoError):
         return False
 
 def get_fees_by_student(student_id: str, school_id: str = None) -> list:
@@ -96,7 +101,4 @@ def get_fees_by_student(student_id: str, school_id: str = None) -> list:
     query = {"student_id": student_id}
     if school_id:
         query["school_id"] = school_id
-    fees = list(db.fees.find(query))
-    for fee in fees:
-        fee["id"] = str(fee["_id"])
-    return fees
\ No newline at end of file
+    return [_with_str_id(fee) for fee in db.fees.find(query).batch_size(500)]
\ No newline at end of file
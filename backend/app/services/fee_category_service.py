@@ -2,6 +2,10 @@ from app.database import get_db
 from datetime import datetime
 from typing import Optional, List
 from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from pymongo.errors import PyMongoError
+from app.services.student_fee_summary_service import refresh_class_fee_summaries
+import numpy as np
 import logging
 
 logger = logging.getLogger(__name__)
@@ -16,15 +20,18 @@ def create_fee_category(data: dict, school_id: str = None) -> Optional[dict]:
     
     db = get_db()
     
+    components = data.get("components", [])
+    now = datetime.utcnow()
     category = {
         "school_id": school_id,
         "name": data.get("name"),
         "description": data.get("description"),
-        "components": data.get("components", []),
+        "components": components,
+        "total_amount": calculate_category_total(components),
         "is_archived": False,
         "created_by": data.get("created_by"),
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow(),
+        "created_at": now,
+        "updated_at": now,
     }
     
     result = db.fee_categories.insert_one(category)
@@ -43,10 +50,9 @@ def get_all_fee_categories(include_archived: bool = False, school_id: str = None
     if not include_archived:
         query["is_archived"] = False
     
-    categories = list(db.fee_categories.find(query).sort("created_at", -1))
-    
+    categories = list(db.fee_categories.find(query).sort("created_at", -1).batch_size(500))
     for cat in categories:
-        cat["id"] = str(cat["_id"])
+        cat["id"] = str(cat.pop("_id"))
     
     logger.info(f"[SCHOOL:{school_id}] ✅ Retrieved {len(categories)} fee categories")
     return categories
@@ -79,7 +85,7 @@ def update_fee_category(category_id: str, data: dict, school_id: str = None) ->
     db = get_db()
     try:
         oid = ObjectId(category_id)
-    except:
+    except InvalidId:
         logger.error(f"[SCHOOL:{school_id}] ❌ Invalid category ID: {category_id}")
         return None
     
@@ -90,6 +96,8 @@ def update_fee_category(category_id: str, data: dict, school_id: str = None) ->
         update["description"] = data["description"]
     if "components" in data:
         update["components"] = data["components"]
+        # Memoized so snapshots don't re-sum the components
+        update["total_amount"] = calculate_category_total(data["components"])
     if "is_archived" in data:
         update["is_archived"] = data["is_archived"]
     
@@ -103,6 +111,20 @@ def update_fee_category(category_id: str, data: dict, school_id: str = None) ->
     
     if result:
         result["id"] = str(result["_id"])
+        if "total_amount" in update:
+            # Assignments carry the category total as expected_fee; keep them in step
+            db.class_fee_assignments.update_many(
+                {"category_id": category_id, "school_id": school_id},
+                {"$set": {"expected_fee": update["total_amount"]}}
+            )
+            # ...and the summary rows of the students in those classes
+            class_ids = db.class_fee_assignments.distinct(
+                "class_id", {"category_id": category_id, "school_id": school_id, "is_active": True}
+            )
+            try:
+                refresh_class_fee_summaries(class_ids, school_id, db)
+            except PyMongoError as e:
+                logger.error(f"[SCHOOL:{school_id}] ❌ Failed to refresh fee summaries for category {category_id}: {str(e)}")
         logger.info(f"[SCHOOL:{school_id}] ✅ Updated fee category {category_id}")
     else:
         logger.warning(f"[SCHOOL:{school_id}] Fee category {category_id} not found")
@@ -134,6 +156,25 @@ def archive_fee_category(category_id: str, school_id: str = None) -> bool:
     """Archive a fee category"""
     return delete_fee_category(category_id, school_id=school_id)
 
+def _find_category_fields(db, category_id: str, school_id: str, projection: dict) -> Optional[dict]:
+    """Fetch only `projection` fields of a school's category; None if missing or the id is invalid"""
+    try:
+        return db.fee_categories.find_one({"_id": ObjectId(category_id), "school_id": school_id}, projection)
+    except (InvalidId, PyMongoError) as e:
+        logger.error(f"[SCHOOL:{school_id}] ❌ Error fetching fee category: {str(e)}")
+        return None
+
+def get_category_total(category_id: str, school_id: str, db=None) -> float:
+    """A category's total_amount (summing components for older categories); 0 if missing"""
+    db = db if db is not None else get_db()
+    category = _find_category_fields(db, category_id, school_id, {"_id": 0, "components": 1, "total_amount": 1})
+    if not category:
+        return 0
+    total_amount = category.get("total_amount")
+    if total_amount is None:
+        total_amount = calculate_category_total(category.get("components", []))
+    return total_amount
+
 def duplicate_fee_category(category_id: str, new_name: str, created_by: str, school_id: str = None) -> Optional[dict]:
     """Duplicate a fee category (school-scoped)"""
     if not school_id:
@@ -142,20 +183,24 @@ def duplicate_fee_category(category_id: str, new_name: str, created_by: str, sch
     
     db = get_db()
     
-    original = get_fee_category_by_id(category_id, school_id=school_id)
+    original = _find_category_fields(
+        db, category_id, school_id, {"_id": 0, "description": 1, "components": 1, "total_amount": 1}
+    )
     if not original:
         logger.warning(f"[SCHOOL:{school_id}] Cannot duplicate - category {category_id} not found")
         return None
     
+    now = datetime.utcnow()
     new_category = {
         "school_id": school_id,
         "name": new_name,
         "description": original.get("description"),
         "components": original.get("components", []),
+        "total_amount": original.get("total_amount", calculate_category_total(original.get("components", []))),
         "is_archived": False,
         "created_by": created_by,
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow(),
+        "created_at": now,
+        "updated_at": now,
     }
     
     result = db.fee_categories.insert_one(new_category)
@@ -173,21 +218,26 @@ def create_category_snapshot(category_id: str, school_id: str = None) -> Optiona
     
     db = get_db()
     
-    category = get_fee_category_by_id(category_id, school_id=school_id)
+    category = _find_category_fields(
+        db, category_id, school_id, {"_id": 0, "name": 1, "components": 1, "total_amount": 1}
+    )
     if not category:
         logger.warning(f"[SCHOOL:{school_id}] Cannot snapshot - category {category_id} not found")
         return None
     
-    total_amount = sum(comp.get("amount", 0) for comp in category.get("components", []))
+    total_amount = category.get("total_amount")
+    if total_amount is None:  # categories saved before total_amount was stored
+        total_amount = calculate_category_total(category.get("components", []))
     
+    now = datetime.utcnow()
     snapshot = {
         "school_id": school_id,
         "category_id": category_id,
         "category_name": category.get("name"),
         "components": category.get("components", []),
         "total_amount": total_amount,
-        "snapshot_date": datetime.utcnow(),
-        "created_at": datetime.utcnow(),
+        "snapshot_date": now,
+        "created_at": now,
     }
     
     result = db.category_snapshots.insert_one(snapshot)
@@ -216,4 +266,8 @@ def get_category_snapshot(snapshot_id: str, school_id: str = None) -> Optional[d
 
 def calculate_category_total(components: List[dict]) -> float:
     """Calculate total amount from components"""
-    return sum(comp.get("amount", 0) for comp in components)
+    return float(np.fromiter(
+        (comp.get("amount", 0) for comp in components),
+        dtype=np.float64,
+        count=len(components)
+    ).sum())
@@ -1,15 +1,35 @@
 from app.database import get_db
 from datetime import datetime
 from typing import Optional, List, Dict
+from collections import defaultdict
 from bson.objectid import ObjectId
+from pymongo.errors import PyMongoError
 from app.services.accountant_service import update_accountant_balance
 from app.services.payment_method_service import create_or_get_payment_method
+from app.services.fee_statistics_service import invalidate_payment_stats
+from app.services.student_fee_summary_service import (
+    apply_payment_delta,
+    apply_payment_deltas,
+    ensure_student_fee_summaries,
+    get_student_fee_summary,
+    refresh_student_fee_summary,
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Page size for payment listings when the caller doesn't pass one
+DEFAULT_PAGE_LIMIT = 500
+
 # ================= Fee Payment Operations =================
 
+def _ensure_summaries_quietly(student_ids) -> None:
+    """Create missing fee summary rows before a payment insert; never fails the payment"""
+    try:
+        ensure_student_fee_summaries(student_ids)
+    except Exception as e:
+        logger.error(f"[FEE SUMMARY] Failed to create summary rows: {str(e)}")
+
 def record_fee_payment(data: dict) -> Optional[dict]:
     """Record a fee payment for a student"""
     db = get_db()
@@ -27,8 +47,15 @@ def record_fee_payment(data: dict) -> Optional[dict]:
         "created_at": datetime.utcnow(),
     }
     
+    _ensure_summaries_quietly([payment["student_id"]])
     result = db.fee_payments.insert_one(payment)
     payment["id"] = str(result.inserted_id)
+    invalidate_payment_stats(payment["school_id"])
+    
+    try:
+        apply_payment_delta(payment["student_id"], payment["amount_paid"] or 0)
+    except Exception as e:
+        logger.error(f"[FEE SUMMARY] Failed to update summary for {payment['student_id']}: {str(e)}")
     
     # Update accountant balance (legacy system)
     received_by = data.get("received_by")
@@ -73,39 +100,136 @@ def record_fee_payment(data: dict) -> Optional[dict]:
 
     return payment
 
-def get_fee_payment_by_id(payment_id: str) -> Optional[dict]:
-    """Get fee payment by ID"""
-    db = get_db()
-    try:
-        payment = db.fee_payments.find_one({"_id": ObjectId(payment_id)})
-        if payment:
-            payment["id"] = str(payment["_id"])
-        return payment
-    except:
-        return None
-
-def get_fee_payments_for_student(student_id: str) -> List[dict]:
-    """Get all fee payments for a specific student"""
+def record_fee_payments_bulk(items: List[dict]) -> List[str]:
+    """
+    Record many fee payments at once (e.g. a class's dues) and return their ids.
+    One insert_many for the payments, one balance update per accountant, and one
+    cash session lookup per accountant instead of per payment.
+    """
+    if not items:
+        return []
     db = get_db()
     
-    payments = list(db.fee_payments.find({"student_id": student_id}).sort("paid_at", -1))
+    now = datetime.utcnow()
+    payments = [
+        {
+            "school_id": data.get("school_id"),
+            "student_id": data.get("student_id"),
+            "class_id": data.get("class_id"),
+            "amount_paid": data.get("amount_paid"),
+            "payment_method": data.get("payment_method"),
+            "transaction_reference": data.get("transaction_reference"),
+            "remarks": data.get("remarks"),
+            "received_by": data.get("received_by"),
+            "paid_at": now,
+            "created_at": now,
+        }
+        for data in items
+    ]
+    
+    _ensure_summaries_quietly(payment["student_id"] for payment in payments)
+    result = db.fee_payments.insert_many(payments, ordered=False)
+    payment_ids = [str(oid) for oid in result.inserted_ids]
+    for school_id in {payment["school_id"] for payment in payments}:
+        invalidate_payment_stats(school_id)
+    
+    paid_by_student = defaultdict(float)
     for payment in payments:
-        payment["id"] = str(payment["_id"])
-    return payments
-
-def get_fee_payments_for_class(class_id: str) -> List[dict]:
-    """Get all fee payments for a specific class"""
-    db = get_db()
+        paid_by_student[payment["student_id"]] += payment["amount_paid"] or 0
+    try:
+        apply_payment_deltas(paid_by_student)
+    except Exception as e:
+        logger.error(f"[FEE SUMMARY] Failed to update summaries for bulk payment: {str(e)}")
     
-    payments = list(db.fee_payments.find({"class_id": class_id}).sort("paid_at", -1))
+    # Update accountant balance (legacy system), summed per accountant
+    collected_by = defaultdict(float)
     for payment in payments:
-        payment["id"] = str(payment["_id"])
-    return payments
+        amount = payment["amount_paid"] or 0
+        if payment["received_by"] and amount > 0:
+            collected_by[payment["received_by"]] += amount
+    for received_by, amount in collected_by.items():
+        update_accountant_balance(
+            user_id=received_by,
+            amount=amount,
+            type_="collection",
+            description=f"Fee payments from {len(paid_by_student)} students",
+            recorded_by=received_by
+        )
+    
+    # Record transactions in each accountant's active cash session
+    try:
+        from app.services.cash_session_service import get_or_create_session, record_transaction
+        sessions = {}
+        for payment_id, payment in zip(payment_ids, payments):
+            received_by = payment["received_by"]
+            school_id = payment["school_id"]
+            if not (received_by and school_id):
+                continue
+            key = (received_by, school_id)
+            if key not in sessions:
+                sessions[key] = get_or_create_session(received_by, school_id)
+            record_transaction(
+                session_id=sessions[key]["id"],
+                user_id=received_by,
+                school_id=school_id,
+                payment_id=payment_id,
+                student_id=payment["student_id"],
+                amount=payment["amount_paid"],
+                payment_method=payment["payment_method"],
+                transaction_reference=payment["transaction_reference"]
+            )
+        logger.info(f"[CASH SESSION] Recorded {len(payment_ids)} bulk transactions in {len(sessions)} sessions")
+    except Exception as e:
+        logger.error(f"[CASH SESSION] Failed to record bulk transactions: {str(e)}")
+    
+    # Persist non-cash payment method names for reuse (non-critical)
+    for pm in {p["payment_method"] for p in payments if p["payment_method"]}:
+        if pm.lower() != 'cash':
+            try:
+                create_or_get_payment_method(pm)
+            except Exception:
+                pass
+    
+    return payment_ids
 
-def get_all_fee_payments(filters: Dict = None) -> List[dict]:
-    """Get all fee payments with optional filters"""
+# Payment documents as returned by the API: string "id" in place of "_id"
+_PAYMENT_OUTPUT_STAGES = [
+    {"$addFields": {"id": {"$toString": "$_id"}}},
+    {"$project": {"_id": 0}}
+]
+
+def _find_payments(query: dict, skip: int = 0, limit: int = DEFAULT_PAGE_LIMIT) -> List[dict]:
+    """Payments matching `query`, newest first, shaped for the API server-side"""
     db = get_db()
-    
+    pipeline = [
+        {"$match": query},
+        {"$sort": {"paid_at": -1}},
+        {"$skip": skip},
+        {"$limit": limit},
+    ] + _PAYMENT_OUTPUT_STAGES
+    return list(db.fee_payments.aggregate(pipeline))
+
+def get_fee_payment_by_id(payment_id: str) -> Optional[dict]:
+    """Get fee payment by ID"""
+    if not ObjectId.is_valid(payment_id):
+        return None
+    try:
+        payments = _find_payments({"_id": ObjectId(payment_id)}, limit=1)
+    except PyMongoError as e:
+        logger.error(f"[FEE PAYMENT] Error fetching payment {payment_id}: {str(e)}")
+        return None
+    return payments[0] if payments else None
+
+def get_fee_payments_for_student(student_id: str, skip: int = 0, limit: int = DEFAULT_PAGE_LIMIT) -> List[dict]:
+    """Get fee payments for a specific student, newest first (one page)"""
+    return _find_payments({"student_id": student_id}, skip, limit)
+
+def get_fee_payments_for_class(class_id: str, skip: int = 0, limit: int = DEFAULT_PAGE_LIMIT) -> List[dict]:
+    """Get fee payments for a specific class, newest first (one page)"""
+    return _find_payments({"class_id": class_id}, skip, limit)
+
+def get_all_fee_payments(filters: Dict = None, skip: int = 0, limit: int = DEFAULT_PAGE_LIMIT) -> List[dict]:
+    """Get fee payments with optional filters, newest first (one page)"""
     query = {}
     if filters:
         if "student_id" in filters:
@@ -115,13 +239,21 @@ def get_all_fee_payments(filters: Dict = None) -> List[dict]:
         if "payment_method" in filters:
             query["payment_method"] = filters["payment_method"]
     
-    payments = list(db.fee_payments.find(query).sort("paid_at", -1))
-    for payment in payments:
-        payment["id"] = str(payment["_id"])
-    return payments
+    return _find_payments(query, skip, limit)
+
+def _refresh_summary_quietly(student_id: Optional[str]) -> None:
+    """Recompute a student's fee summary row; never fails the payment write"""
+    if not student_id:
+        return
+    try:
+        refresh_student_fee_summary(student_id)
+    except Exception as e:
+        logger.error(f"[FEE SUMMARY] Failed to refresh summary for {student_id}: {str(e)}")
 
 def update_fee_payment(payment_id: str, update_data: dict) -> Optional[dict]:
     """Update a fee payment"""
+    if not ObjectId.is_valid(payment_id):
+        return None
     db = get_db()
     
     update_dict = {"updated_at": datetime.utcnow()}
@@ -130,32 +262,64 @@ def update_fee_payment(payment_id: str, update_data: dict) -> Optional[dict]:
             update_dict[key] = update_data[key]
     
     try:
-        result = db.fee_payments.update_one(
+        payment = db.fee_payments.find_one_and_update(
             {"_id": ObjectId(payment_id)},
-            {"$set": update_dict}
+            {"$set": update_dict},
+            return_document=True
         )
-        if result.modified_count > 0:
-            return get_fee_payment_by_id(payment_id)
-        return None
-    except:
+    except PyMongoError as e:
+        logger.error(f"[FEE PAYMENT] Error updating payment {payment_id}: {str(e)}")
         return None
+    if payment:
+        payment["id"] = str(payment.pop("_id"))
+        invalidate_payment_stats(payment.get("school_id"))
+        if "amount_paid" in update_dict:
+            _refresh_summary_quietly(payment.get("student_id"))
+    return payment
 
 def delete_fee_payment(payment_id: str) -> bool:
     """Delete a fee payment"""
+    if not ObjectId.is_valid(payment_id):
+        return False
     db = get_db()
     
     try:
-        result = db.fee_payments.delete_one({"_id": ObjectId(payment_id)})
-        return result.deleted_count > 0
-    except:
+        deleted = db.fee_payments.find_one_and_delete(
+            {"_id": ObjectId(payment_id)},
+            projection={"student_id": 1, "school_id": 1}
+        )
+    except PyMongoError as e:
+        logger.error(f"[FEE PAYMENT] Error deleting payment {payment_id}: {str(e)}")
         return False
+    if deleted is None:
+        return False
+    invalidate_payment_stats(deleted.get("school_id"))
+    _refresh_summary_quietly(deleted.get("student_id"))
+    return True
 
 def get_fee_payment_summary_for_student(student_id: str) -> Dict:
     """Get payment summary for a student"""
+    summary = get_student_fee_summary(student_id)
+    if summary:
+        if not summary.get("class_id"):
+            return {"total_fee": 0, "paid_amount": 0, "remaining_amount": 0, "status": "no_class"}
+        total_fee = summary.get("expected_fee", 0)
+        paid_amount = summary.get("paid_amount", 0)
+        return {
+            "total_fee": total_fee,
+            "paid_amount": paid_amount,
+            "remaining_amount": max(0, total_fee - paid_amount),
+            "status": summary.get("status", "unpaid")
+        }
+    return _compute_fee_payment_summary(student_id)
+
+
+def _compute_fee_payment_summary(student_id: str) -> Dict:
+    """Payment summary computed live from students / assignments / payments"""
     db = get_db()
     
     # Get assigned fee category for student's class
-    student = db.students.find_one({"_id": ObjectId(student_id)})
+    student = db.students.find_one({"_id": ObjectId(student_id)}, {"_id": 0, "class_id": 1})
     if not student:
         return {"total_fee": 0, "paid_amount": 0, "remaining_amount": 0, "status": "unknown"}
     
@@ -167,11 +331,15 @@ def get_fee_payment_summary_for_student(student_id: str) -> Dict:
     assignment = db.class_fee_assignments.find_one({
         "class_id": class_id,
         "is_active": True
-    })
+    }, {"_id": 0, "category_id": 1, "expected_fee": 1})
     
     total_fee = 0
-    if assignment:
-        category = db.fee_categories.find_one({"_id": ObjectId(assignment["category_id"])})
+    if assignment and assignment.get("expected_fee") is not None:
+        total_fee = assignment["expected_fee"]
+    elif assignment:
+        category = db.fee_categories.find_one(
+            {"_id": ObjectId(assignment["category_id"])}, {"total_amount": 1, "components": 1}
+        )
         if category:
             # fee categories may store components; compute total if needed
             if "total_amount" in category and isinstance(category.get("total_amount"), (int, float)):
@@ -180,7 +348,7 @@ def get_fee_payment_summary_for_student(student_id: str) -> Dict:
                 total_fee = sum((comp.get("amount", 0) for comp in category.get("components", [])))
             else:
                 # fallback to category snapshots if any
-                snapshot = db.category_snapshots.find_one({"category_id": str(category.get("_id"))}, sort=[("snapshot_date", -1)])
+                snapshot = db.category_snapshots.find_one({"category_id": str(category.get("_id"))}, {"_id": 0, "total_amount": 1}, sort=[("snapshot_date", -1)])
                 if snapshot:
                     total_fee = snapshot.get("total_amount", 0)
     
@@ -219,13 +387,8 @@ def get_fee_payment_summary_for_students(student_ids: List[str]) -> Dict[str, Di
 
     # Map student _id (string) -> class_id
     student_obj_map = {}
-    obj_ids = []
-    for sid in student_ids:
-        try:
-            obj_ids.append(ObjectId(sid))
-        except Exception:
-            # skip invalid ids
-            continue
+    # skip invalid ids
+    obj_ids = [ObjectId(sid) for sid in student_ids if ObjectId.is_valid(sid)]
 
     students = list(db.students.find({"_id": {"$in": obj_ids}}, {"_id": 1, "class_id": 1}))
     for s in students:
@@ -236,11 +399,22 @@ def get_fee_payment_summary_for_students(student_ids: List[str]) -> Dict[str, Di
     class_to_category = {}
     categories = {}
     if class_ids:
-        assignments = list(db.class_fee_assignments.find({"class_id": {"$in": class_ids}, "is_active": True}))
-        category_ids = {a.get("category_id") for a in assignments if a.get("category_id")}
+        assignments = list(db.class_fee_assignments.find(
+            {"class_id": {"$in": class_ids}, "is_active": True},
+            {"_id": 0, "class_id": 1, "category_id": 1, "expected_fee": 1}
+        ))
+        for a in assignments:
+            if a.get("expected_fee") is not None and a.get("category_id"):
+                categories[str(a["category_id"])] = a["expected_fee"]
+        # Only assignments made before expected_fee was stored need the category
+        category_ids = {a.get("category_id") for a in assignments
+                        if a.get("category_id") and str(a["category_id"]) not in categories}
         # fetch categories
         if category_ids:
-            cats = list(db.fee_categories.find({"_id": {"$in": [ObjectId(c) for c in category_ids]}}))
+            cats = list(db.fee_categories.find(
+                {"_id": {"$in": [ObjectId(c) for c in category_ids]}},
+                {"total_amount": 1, "components": 1}
+            ))
             for c in cats:
                 cid = str(c.get("_id"))
                 if "total_amount" in c and isinstance(c.get("total_amount"), (int, float)):
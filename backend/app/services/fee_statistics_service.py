@@ -3,13 +3,157 @@ Fee Statistics Service
 Provides aggregated fee and payment statistics for accountants and admins
 """
 from app.database import get_db
+from app.utils.cache import dashboard_cache
+from datetime import datetime, timedelta
 from typing import Dict, List
-from bson import ObjectId
 import logging
 from collections import defaultdict
 
 logger = logging.getLogger(__name__)
 
+# Dashboard payment aggregates only change when payments do; writes invalidate
+# them, the TTL bounds staleness across worker processes
+PAYMENT_STATS_TTL_SECONDS = 300
+
+
+def invalidate_payment_stats(school_id: str):
+    """Drop cached payment aggregates for a school (call after payment writes)"""
+    if not school_id:
+        return
+    dashboard_cache.invalidate_prefix(f"daily_collections:{school_id}:")
+    dashboard_cache.invalidate(f"payment_method_breakdown:{school_id}")
+    dashboard_cache.invalidate_prefix(f"dashboard_stats:{school_id}:")
+
+
+def _to_object_id(expr) -> Dict:
+    """$convert to ObjectId, yielding null for missing/invalid ids instead of failing"""
+    return {"$convert": {"input": expr, "to": "objectId", "onError": None, "onNull": None}}
+
+
+# paid_amount / expected_fee -> "unpaid" | "paid" | "partial"
+FEE_STATUS_EXPR = {"$switch": {
+    "branches": [
+        {"case": {"$eq": ["$paid_amount", 0]}, "then": "unpaid"},
+        {"case": {"$gte": ["$paid_amount", "$expected_fee"]}, "then": "paid"}
+    ],
+    "default": "partial"
+}}
+
+
+def student_fee_status_stages(match: Dict) -> List[Dict]:
+    """
+    Students matching `match` -> expected fee (active class assignment's category)
+    and amount paid, with a per-student status. Expected fee is the assignment's
+    stored expected_fee; assignments made before it was stored fall back to the
+    category's total_amount, else the sum of its component amounts.
+    """
+    return [
+        {"$match": match},
+        {"$project": {"_id": 0, "school_id": 1, "class_id": 1, "student_id": {"$toString": "$_id"}}},
+        {"$lookup": {
+            "from": "class_fee_assignments",
+            "let": {"cid": "$class_id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$class_id", "$$cid"]}, "is_active": True}},
+                {"$limit": 1},
+                {"$project": {"_id": 0, "category_id": 1, "expected_fee": 1}}
+            ],
+            "as": "assignment"
+        }},
+        {"$addFields": {"assigned_fee": {"$arrayElemAt": ["$assignment.expected_fee", 0]}}},
+        {"$lookup": {
+            "from": "fee_categories",
+            # Only legacy assignments without expected_fee need the category
+            "let": {"cat": {"$cond": [
+                {"$eq": [{"$type": "$assigned_fee"}, "missing"]},
+                _to_object_id({"$arrayElemAt": ["$assignment.category_id", 0]}),
+                None
+            ]}},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$_id", "$$cat"]}}},
+                {"$project": {
+                    "_id": 0,
+                    "amount": {"$ifNull": [
+                        "$total_amount",
+                        {"$sum": {"$map": {
+                            "input": {"$ifNull": ["$components", []]},
+                            "in": {"$ifNull": ["$$this.amount", 0]}
+                        }}}
+                    ]}
+                }}
+            ],
+            "as": "category"
+        }},
+        {"$lookup": {
+            "from": "fee_payments",
+            "let": {"sid": "$student_id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$student_id", "$$sid"]}}},
+                {"$group": {"_id": None, "total_paid": {"$sum": "$amount_paid"}}}
+            ],
+            "as": "payments"
+        }},
+        {"$project": {
+            "school_id": 1,
+            "class_id": 1,
+            "student_id": 1,
+            "expected_fee": {"$ifNull": [
+                "$assigned_fee",
+                {"$ifNull": [{"$arrayElemAt": ["$category.amount", 0]}, 0]}
+            ]},
+            "paid_amount": {"$ifNull": [{"$arrayElemAt": ["$payments.total_paid", 0]}, 0]}
+        }},
+        {"$addFields": {"status": FEE_STATUS_EXPR}}
+    ]
+
+
+def _class_rollup_stages() -> List[Dict]:
+    """Per-student status rows -> counts and amounts per class_id, with class_name"""
+    def _count_status(status: str) -> Dict:
+        return {"$sum": {"$cond": [{"$eq": ["$status", status]}, 1, 0]}}
+    
+    return [
+        {"$group": {
+            "_id": "$class_id",
+            "total_students": {"$sum": 1},
+            "paid": _count_status("paid"),
+            "partial": _count_status("partial"),
+            "unpaid": _count_status("unpaid"),
+            "collected": {"$sum": "$paid_amount"},
+            "expected": {"$sum": "$expected_fee"},
+            "pending": {"$sum": {"$max": [0, {"$subtract": ["$expected_fee", "$paid_amount"]}]}}
+        }},
+        {"$lookup": {
+            "from": "classes",
+            "let": {"cid": _to_object_id("$_id")},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$_id", "$$cid"]}}},
+                {"$project": {"_id": 0, "class_name": 1}}
+            ],
+            "as": "class_info"
+        }},
+        {"$addFields": {"class_name": {"$arrayElemAt": ["$class_info.class_name", 0]}}},
+        {"$project": {"class_info": 0}},
+        {"$sort": {"_id": 1}}
+    ]
+
+
+def _collection_by_class(db, school_id: str) -> List[Dict]:
+    """
+    Per-class rollups, read from the student_fee_summary collection when it
+    has a row for every student of this school, else computed live from the
+    source collections (summary not built yet, or students added or removed
+    by a path that doesn't maintain it, until the nightly rebuild)
+    """
+    summary_rows = db.student_fee_summary.count_documents({"school_id": school_id})
+    if summary_rows and summary_rows == db.students.count_documents({"school_id": school_id}):
+        return list(db.student_fee_summary.aggregate(
+            [{"$match": {"school_id": school_id}}] + _class_rollup_stages()
+        ))
+    return list(db.students.aggregate(
+        student_fee_status_stages({"school_id": school_id}) + _class_rollup_stages()
+    ))
+
 
 def get_fee_collection_stats(school_id: str) -> Dict:
     """
@@ -24,113 +168,205 @@ def get_fee_collection_stats(school_id: str) -> Dict:
     db = get_db()
     
     try:
-        # Get all students for the school
-        students = list(db.students.find({"school_id": school_id}))
-        total_students = len(students)
+        stats = _collection_totals(db, school_id)
         
-        # Initialize counters
-        stats = {
-            "total_students": total_students,
-            "paid_count": 0,
-            "partial_count": 0,
-            "unpaid_count": 0,
-            "total_collected": 0,
-            "total_pending": 0,
-            "total_expected": 0,
-            "collection_by_class": {},
-            "recent_payments": []
-        }
-        
-        # Get fee assignments and payments for each student
-        for student in students:
-            student_id = str(student["_id"])
-            class_id = student.get("class_id")
-            
-            # Get student's fee category through class assignment
-            assignment = db.class_fee_assignments.find_one({
-                "class_id": class_id,
-                "is_active": True
-            })
-            
-            expected_fee = 0
-            if assignment:
-                category = db.fee_categories.find_one({"_id": ObjectId(assignment["category_id"])})
-                if category:
-                    if "total_amount" in category:
-                        expected_fee = category.get("total_amount", 0)
-                    elif "components" in category:
-                        expected_fee = sum(c.get("amount", 0) for c in category.get("components", []))
-            
-            # Get total paid for this student
-            pipeline = [
-                {"$match": {"student_id": student_id}},
-                {"$group": {"_id": None, "total_paid": {"$sum": "$amount_paid"}}}
-            ]
-            result = list(db.fee_payments.aggregate(pipeline))
-            paid_amount = result[0]["total_paid"] if result else 0
-            
-            # Determine status
-            if paid_amount == 0:
-                stats["unpaid_count"] += 1
-                status = "unpaid"
-            elif paid_amount >= expected_fee:
-                stats["paid_count"] += 1
-                status = "paid"
-            else:
-                stats["partial_count"] += 1
-                status = "partial"
-            
-            stats["total_collected"] += paid_amount
-            stats["total_expected"] += expected_fee
-            stats["total_pending"] += max(0, expected_fee - paid_amount)
-            
-            # Collection by class
-            if class_id:
-                if class_id not in stats["collection_by_class"]:
-                    class_info = db.classes.find_one({"_id": ObjectId(class_id)})
-                    stats["collection_by_class"][class_id] = {
-                        "class_name": class_info.get("class_name") if class_info else "Unknown",
-                        "total_students": 0,
-                        "paid": 0,
-                        "partial": 0,
-                        "unpaid": 0,
-                        "collected": 0,
-                        "expected": 0
-                    }
-                
-                stats["collection_by_class"][class_id]["total_students"] += 1
-                stats["collection_by_class"][class_id][status] += 1
-                stats["collection_by_class"][class_id]["collected"] += paid_amount
-                stats["collection_by_class"][class_id]["expected"] += expected_fee
+        # Recent payments (last 20) with the student's name joined in the same pipeline
+        recent_payments = db.fee_payments.aggregate(
+            [{"$match": {"school_id": school_id}}] + _recent_payment_stages()
+        )
+        stats["recent_payments"] = _format_recent_payments(recent_payments)
         
-        # Get recent payments (last 20)
-        recent_payments = list(db.fee_payments.find(
-            {"school_id": school_id}
-        ).sort("paid_at", -1).limit(20))
+        return stats
         
-        for payment in recent_payments:
-            student = db.students.find_one({"_id": ObjectId(payment["student_id"])})
-            stats["recent_payments"].append({
-                "id": str(payment["_id"]),
-                "student_name": student.get("full_name") if student else "Unknown",
-                "amount": payment.get("amount_paid", 0),
-                "payment_method": payment.get("payment_method", "Unknown"),
-                "paid_at": payment.get("paid_at").isoformat() if payment.get("paid_at") else None
-            })
+    except Exception as e:
+        logger.error(f"Failed to get fee collection stats: {str(e)}")
+        raise
+
+
+def _collection_totals(db, school_id: str) -> Dict:
+    """Student counts and amounts overall and per class (no recent payments)"""
+    # Per-class rollups computed server-side (one $group over the
+    # materialized per-student summary)
+    by_class = _collection_by_class(db, school_id)
+    
+    stats = {
+        "total_students": 0,
+        "paid_count": 0,
+        "partial_count": 0,
+        "unpaid_count": 0,
+        "total_collected": 0,
+        "total_pending": 0,
+        "total_expected": 0,
+        "collection_by_class": {},
+        "recent_payments": []
+    }
+    
+    for row in by_class:
+        stats["total_students"] += row["total_students"]
+        stats["paid_count"] += row["paid"]
+        stats["partial_count"] += row["partial"]
+        stats["unpaid_count"] += row["unpaid"]
+        stats["total_collected"] += row["collected"]
+        stats["total_expected"] += row["expected"]
+        stats["total_pending"] += row["pending"]
         
-        # Convert collection_by_class dict to list for easier frontend consumption
-        stats["collection_by_class"] = list(stats["collection_by_class"].values())
+        # Students without a class count towards the totals only
+        class_id = row["_id"]
+        if class_id:
+            stats["collection_by_class"][class_id] = {
+                "class_name": row.get("class_name") or "Unknown",
+                "total_students": row["total_students"],
+                "paid": row["paid"],
+                "partial": row["partial"],
+                "unpaid": row["unpaid"],
+                "collected": row["collected"],
+                "expected": row["expected"]
+            }
+    
+    # Convert collection_by_class dict to list for easier frontend consumption
+    stats["collection_by_class"] = list(stats["collection_by_class"].values())
+    
+    # Calculate collection rate
+    if stats["total_expected"] > 0:
+        stats["collection_rate"] = (stats["total_collected"] / stats["total_expected"]) * 100
+    else:
+        stats["collection_rate"] = 0
+    
+    return stats
+
+
+def _recent_payment_stages(limit: int = 20) -> List[Dict]:
+    """School's payments -> latest `limit` with the student's name joined"""
+    return [
+        {"$sort": {"paid_at": -1}},
+        {"$limit": limit},
+        {"$lookup": {
+            "from": "students",
+            "let": {"sid": _to_object_id("$student_id")},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$_id", "$$sid"]}}},
+                {"$project": {"_id": 0, "full_name": 1}}
+            ],
+            "as": "student"
+        }},
+        {"$project": {
+            "student_name": {"$arrayElemAt": ["$student.full_name", 0]},
+            "amount_paid": 1,
+            "payment_method": 1,
+            "paid_at": 1
+        }}
+    ]
+
+
+def _format_recent_payments(rows) -> List[Dict]:
+    return [
+        {
+            "id": str(payment["_id"]),
+            "student_name": payment.get("student_name") or "Unknown",
+            "amount": payment.get("amount_paid", 0),
+            "payment_method": payment.get("payment_method", "Unknown"),
+            "paid_at": payment.get("paid_at").isoformat() if payment.get("paid_at") else None
+        }
+        for payment in rows
+    ]
+
+
+def _method_breakdown_stages() -> List[Dict]:
+    """School's payments -> count and total per payment method, largest first"""
+    return [
+        {
+            "$group": {
+                "_id": "$payment_method",
+                "count": {"$sum": 1},
+                "total_amount": {"$sum": "$amount_paid"}
+            }
+        },
+        {"$sort": {"total_amount": -1}}
+    ]
+
+
+def _format_method_breakdown(rows) -> List[Dict]:
+    return [
+        {
+            "method": result["_id"] or "Unknown",
+            "count": result["count"],
+            "amount": result["total_amount"]
+        }
+        for result in rows
+    ]
+
+
+def _daily_collection_stages() -> List[Dict]:
+    """School's payments in a date window -> total and count per day, oldest first"""
+    return [
+        {
+            "$group": {
+                "_id": {
+                    "$dateToString": {"format": "%Y-%m-%d", "date": "$paid_at"}
+                },
+                "total_amount": {"$sum": "$amount_paid"},
+                "count": {"$sum": 1}
+            }
+        },
+        {"$sort": {"_id": 1}}
+    ]
+
+
+def _format_daily_collections(rows) -> List[Dict]:
+    return [
+        {
+            "date": result["_id"],
+            "amount": result["total_amount"],
+            "count": result["count"]
+        }
+        for result in rows
+    ]
+
+
+def get_dashboard_stats(school_id: str, days: int = 30) -> Dict:
+    """
+    Fee collection stats, payment method breakdown and daily collections for
+    the accountant dashboard. The three fee_payments aggregates run as one
+    $facet pipeline, so the school's payments are read once.
+    """
+    db = get_db()
+    
+    try:
+        stats = _collection_totals(db, school_id)
         
-        # Calculate collection rate
-        if stats["total_expected"] > 0:
-            stats["collection_rate"] = (stats["total_collected"] / stats["total_expected"]) * 100
-        else:
-            stats["collection_rate"] = 0
+        # Only the payment aggregates are cached; payment writes invalidate them
+        cache_key = f"dashboard_stats:{school_id}:{days}"
+        facets = dashboard_cache.get(cache_key)
+        if facets is None:
+            end_date = datetime.utcnow()
+            start_date = end_date - timedelta(days=days)
+            
+            result = next(db.fee_payments.aggregate([
+                {"$match": {"school_id": school_id}},
+                {"$facet": {
+                    "by_method": _method_breakdown_stages(),
+                    "daily": [
+                        {"$match": {"paid_at": {"$gte": start_date, "$lte": end_date}}}
+                    ] + _daily_collection_stages(),
+                    "recent": _recent_payment_stages()
+                }}
+            ]))
+            facets = {
+                "payment_methods": _format_method_breakdown(result["by_method"]),
+                "daily_collections": _format_daily_collections(result["daily"]),
+                "recent_payments": _format_recent_payments(result["recent"])
+            }
+            dashboard_cache.set(cache_key, facets, ttl_seconds=PAYMENT_STATS_TTL_SECONDS)
         
-        return stats
+        stats["recent_payments"] = facets["recent_payments"]
+        return {
+            "fee_collection": stats,
+            "payment_methods": facets["payment_methods"],
+            "daily_collections": facets["daily_collections"]
+        }
         
     except Exception as e:
-        logger.error(f"Failed to get fee collection stats: {str(e)}")
+        logger.error(f"Failed to get dashboard stats: {str(e)}")
         raise
 
 
@@ -138,31 +374,19 @@ def get_payment_method_breakdown(school_id: str) -> List[Dict]:
     """
     Get breakdown of payments by payment method
     """
+    cache_key = f"payment_method_breakdown:{school_id}"
+    cached = dashboard_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
     db = get_db()
     
     try:
-        pipeline = [
-            {"$match": {"school_id": school_id}},
-            {
-                "$group": {
-                    "_id": "$payment_method",
-                    "count": {"$sum": 1},
-                    "total_amount": {"$sum": "$amount_paid"}
-                }
-            },
-            {"$sort": {"total_amount": -1}}
-        ]
+        pipeline = [{"$match": {"school_id": school_id}}] + _method_breakdown_stages()
         
-        results = list(db.fee_payments.aggregate(pipeline))
-        
-        breakdown = []
-        for result in results:
-            breakdown.append({
-                "method": result["_id"] or "Unknown",
-                "count": result["count"],
-                "amount": result["total_amount"]
-            })
+        breakdown = _format_method_breakdown(db.fee_payments.aggregate(pipeline))
         
+        dashboard_cache.set(cache_key, breakdown, ttl_seconds=PAYMENT_STATS_TTL_SECONDS)
         return breakdown
         
     except Exception as e:
@@ -174,11 +398,14 @@ def get_daily_collections(school_id: str, days: int = 30) -> List[Dict]:
     """
     Get daily collection history for the last N days
     """
+    cache_key = f"daily_collections:{school_id}:{days}"
+    cached = dashboard_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
     db = get_db()
     
     try:
-        from datetime import datetime, timedelta
-        
         end_date = datetime.utcnow()
         start_date = end_date - timedelta(days=days)
         
@@ -188,29 +415,12 @@ def get_daily_collections(school_id: str, days: int = 30) -> List[Dict]:
                     "school_id": school_id,
                     "paid_at": {"$gte": start_date, "$lte": end_date}
                 }
-            },
-            {
-                "$group": {
-                    "_id": {
-                        "$dateToString": {"format": "%Y-%m-%d", "date": "$paid_at"}
-                    },
-                    "total_amount": {"$sum": "$amount_paid"},
-                    "count": {"$sum": 1}
-                }
-            },
-            {"$sort": {"_id": 1}}
-        ]
-        
-        results = list(db.fee_payments.aggregate(pipeline))
+            }
+        ] + _daily_collection_stages()
         
-        daily_collections = []
-        for result in results:
-            daily_collections.append({
-                "date": result["_id"],
-                "amount": result["total_amount"],
-                "count": result["count"]
-            })
+        daily_collections = _format_daily_collections(db.fee_payments.aggregate(pipeline))
         
+        dashboard_cache.set(cache_key, daily_collections, ttl_seconds=PAYMENT_STATS_TTL_SECONDS)
         return daily_collections
         
     except Exception as e:
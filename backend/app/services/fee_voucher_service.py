@@ -4,11 +4,16 @@ Handles fee voucher generation and PDF export for students.
 """
 
 import io
+import os
 import base64
 import zipfile
 import logging
+import threading
+import multiprocessing
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 
 from PIL import Image as PILImage
 from reportlab.lib.pagesizes import A4, landscape
@@ -22,8 +27,109 @@ from app.database import get_db
 from bson import ObjectId
 from app.services.student_fee_service import compute_student_arrears_balance
 
+# pypdf is optional: it merges per-student PDFs rendered in parallel into one
+# combined PDF. Without it, combined PDFs are built serially in one document.
+try:
+    from pypdf import PdfReader, PdfWriter
+    PYPDF_AVAILABLE = True
+except ImportError:
+    PYPDF_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
+# Voucher layout is pure-Python reportlab work, so class batches are rendered in
+# worker processes. Workers only receive plain data (student doc + _voucher_values),
+# never a database handle.
+VOUCHER_RENDER_WORKERS = max(1, min(4, os.cpu_count() or 1))
+# Below this many students the pool's IPC overhead outweighs the parallelism
+VOUCHER_POOL_MIN_STUDENTS = 8
+
+# Reportlab styles are immutable once built, so the sample sheet, the static
+# TableStyles and the per-font_scale paragraph styles are built once per process
+# (each render worker builds its own on import)
+_STYLES = getSampleStyleSheet()
+
+_COPY_HEADER_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#1a365d')),
+    ('TOPPADDING', (0, 0), (-1, -1), 1.5),  # Reduced from 3
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 1.5),  # Reduced from 3
+])
+_HEADER_ROW_TABLE_STYLE = TableStyle([
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('ALIGN', (1, 0), (1, 0), 'CENTER'),
+])
+_INFO_PHOTO_TABLE_STYLE = TableStyle([
+    ('BOX', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 1),  # Reduced from 2
+    ('RIGHTPADDING', (0, 0), (-1, -1), 1),  # Reduced from 2
+    ('TOPPADDING', (0, 0), (-1, -1), 2),  # Reduced from 4
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 2),  # Reduced from 4
+])
+_SIGNATURE_LABELS_TABLE_STYLE = TableStyle([
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+])
+_SIGNATURE_LINES_TABLE_STYLE = TableStyle([
+    ('LINEABOVE', (0, 0), (0, 0), 0.6, colors.black),
+    ('LINEABOVE', (1, 0), (1, 0), 0.6, colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('TOPPADDING', (0, 0), (-1, -1), 3),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
+])
+_COPY_COLUMN_TABLE_STYLE = TableStyle([
+    # No outer box - columns separated by dotted lines in main table
+    ('LEFTPADDING', (0, 0), (-1, -1), 2),  # Reduced from 3
+    ('RIGHTPADDING', (0, 0), (-1, -1), 2),  # Reduced from 3
+    ('TOPPADDING', (0, 0), (-1, -1), 1.5),  # Reduced from 2
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 1.5),  # Reduced from 2
+])
+_COPY_COLUMN_TIGHT_TABLE_STYLE = TableStyle([
+    ('TOPPADDING', (0, 0), (-1, -1), 0.8),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 0.8),
+    ('LEFTPADDING', (0, 0), (-1, -1), 1),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 1),
+])
+_MAIN_TABLE_STYLE = TableStyle([
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    # Dotted separators between columns (no vertical lines at borders)
+    ('LINEABOVE', (0, 0), (-1, -1), 0, colors.white),
+    ('LINEBELOW', (0, 0), (-1, -1), 0, colors.white),
+    ('LINELEFT', (0, 0), (-1, -1), 0, colors.white),
+    ('LINERIGHT', (0, 0), (-1, -1), 0, colors.white),
+    # Separator between Bank Copy and Student Copy (thin grey line)
+    ('LINEAFTER', (0, 0), (0, -1), 0.5, colors.grey),
+    # Separator between Student Copy and Office Copy (thin grey line)
+    ('LINEAFTER', (1, 0), (1, -1), 0.5, colors.grey),
+])
+
+
+_render_pool: Optional[ProcessPoolExecutor] = None
+_render_pool_lock = threading.Lock()
+
+
+def _get_render_pool() -> ProcessPoolExecutor:
+    """Shared voucher render pool, created on first use"""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            # spawn, not fork: a forked child could inherit locks held by server threads
+            _render_pool = ProcessPoolExecutor(
+                max_workers=VOUCHER_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _render_pool
+
+
+def shutdown_render_pool():
+    """Stop the voucher render worker processes (app shutdown)"""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is not None:
+            _render_pool.shutdown(wait=False, cancel_futures=True)
+            _render_pool = None
+
 
 def _load_image_from_blob(blob: str) -> PILImage.Image:
     """Load image from blob, handling data-URI and raw base64 formats."""
@@ -81,6 +187,141 @@ def _pil_image_to_reportlab_image(pil_img: PILImage.Image, label: str) -> Image:
         return None
 
 
+_SCHOOL_INFO_PROJECTION = {
+    "_id": 0, "school_name": 1, "display_name": 1, "name": 1, "address": 1, "phone": 1, "email": 1
+}
+_CLASS_NAME_PROJECTION = {"_id": 0, "class_name": 1, "name": 1, "section": 1}
+
+
+def _fetch_school_info(db, school_id: str) -> dict:
+    """School name/contact details for the voucher header (SaaS root DB first)"""
+    try:
+        from app.services.saas_db import get_saas_root_db
+        saas_db = get_saas_root_db()
+        school = saas_db.schools.find_one({"school_id": school_id}, _SCHOOL_INFO_PROJECTION)
+        if not school:
+            school = db.schools.find_one({"school_id": school_id}, _SCHOOL_INFO_PROJECTION)
+    except Exception as e:
+        logger.warning(f"[FEE_VOUCHER] Could not fetch school from saas_db: {e}")
+        school = None
+
+    return {
+        "name": school.get("school_name") or school.get("display_name") or school.get("name", "School") if school else "School",
+        "address": school.get("address", "") if school else "",
+        "phone": school.get("phone", "") if school else "",
+        "email": school.get("email", "") if school else "",
+    }
+
+
+class _VoucherReferenceData:
+    """
+    Reference data shared by every voucher generated in one call: school info,
+    voucher settings (with decoded header images), fee components and class
+    names per class. Each item is read from the database once per instance.
+    """
+
+    def __init__(self, db, school_id: str):
+        self.db = db
+        self.school_id = school_id
+        self._school_info = None
+        self._voucher_settings = None
+        self._fee_components: Dict[str, list] = {}
+        self._class_names: Dict[str, str] = {}
+
+    def school_info(self) -> dict:
+        if self._school_info is None:
+            self._school_info = _fetch_school_info(self.db, self.school_id)
+        return self._school_info
+
+    def fee_components(self, class_id: str) -> list:
+        """Components of the class's active fee category ([] if none assigned)"""
+        if class_id not in self._fee_components:
+            fee_components = []
+            fee_assignment = self.db.class_fee_assignments.find_one({
+                "school_id": self.school_id,
+                "class_id": class_id,
+                "is_active": True
+            }, {"_id": 0, "category_id": 1})
+            if fee_assignment:
+                category_id = fee_assignment.get("category_id")
+                fee_category = self.db.fee_categories.find_one({"_id": ObjectId(category_id)}, {"components": 1})
+                if fee_category:
+                    fee_components = fee_category.get("components", [])
+            self._fee_components[class_id] = fee_components
+        return self._fee_components[class_id]
+
+    def voucher_settings(self) -> dict:
+        """Custom header/footer text, school name and decoded left/right images"""
+        if self._voucher_settings is None:
+            self._voucher_settings = _load_voucher_settings(self.db, self.school_id)
+        return self._voucher_settings
+
+    def class_name(self, class_id: str) -> str:
+        if class_id not in self._class_names:
+            self._class_names[class_id] = _lookup_class_name(self.db, class_id)
+        return self._class_names[class_id]
+
+
+def _load_voucher_settings(db, school_id: str) -> dict:
+    """Fetch voucher settings (header/footer/images) for a school"""
+    settings = {
+        "custom_header": "",
+        "custom_footer": "",
+        "school_name": "",
+        "left_image_data": None,
+        "right_image_data": None,
+    }
+    try:
+        voucher_settings = db.fee_voucher_settings.find_one(
+            {"school_id": school_id},
+            {"_id": 0, "header_text": 1, "footer_text": 1, "school_name": 1,
+             "left_image_blob": 1, "right_image_blob": 1}
+        )
+        if voucher_settings:
+            settings["custom_header"] = voucher_settings.get("header_text", "") or ""
+            settings["custom_footer"] = voucher_settings.get("footer_text", "") or ""
+            settings["school_name"] = voucher_settings.get("school_name", "") or ""
+
+            # Decode left/right images if available (robustly handle data-URLs)
+            for side in ("left", "right"):
+                image_blob = voucher_settings.get(f"{side}_image_blob")
+                if not image_blob:
+                    logger.info(f"[FEE_VOUCHER_IMG] ⚠️ Batch: No {side}_image_blob provided")
+                    continue
+                try:
+                    logger.info(f"[FEE_VOUCHER_IMG] 🔍 Batch: Loading {side} image blob (len:{len(image_blob)})")
+                    image_data = _load_image_from_blob(image_blob)
+                    if image_data:
+                        settings[f"{side}_image_data"] = image_data
+                        logger.info(f"[FEE_VOUCHER_IMG] ✅ Batch: {side.capitalize()} image loaded successfully, size: {image_data.size}")
+                    else:
+                        logger.warning(f"[FEE_VOUCHER_IMG] ⚠️ Batch: _load_image_from_blob returned None for {side} image")
+                except Exception as e:
+                    logger.error(f"[FEE_VOUCHER_IMG] ❌ Batch: Could not load {side} image: {str(e)}", exc_info=True)
+    except Exception as e:
+        logger.warning(f"[FEE_VOUCHER] Could not fetch voucher settings: {e}")
+    return settings
+
+
+def _lookup_class_name(db, class_id: str) -> str:
+    """Display name ("Class - Section") for a class by _id or legacy class_id"""
+    class_name = "N/A"
+    if class_id:
+        try:
+            class_doc = db.classes.find_one({"_id": ObjectId(class_id)}, _CLASS_NAME_PROJECTION)
+            if not class_doc:
+                class_doc = db.classes.find_one({"class_id": class_id}, _CLASS_NAME_PROJECTION)
+            if class_doc:
+                class_name = class_doc.get("class_name", class_doc.get("name", "N/A"))
+                section = class_doc.get("section", "")
+                if section:
+                    class_name = f"{class_name} - {section}"
+        except Exception as e:
+            logger.warning(f"[FEE_VOUCHER] Could not lookup class: {e}")
+            class_name = str(class_id) if class_id else "N/A"
+    return class_name
+
+
 class FeeVoucherService:
     """Fee Voucher Service class."""
 
@@ -97,7 +338,7 @@ class FeeVoucherService:
         return generate_class_vouchers_zip(class_id, school_id, db)
 
 
-def generate_student_fee_voucher_with_photo(student_id: str, school_id: str, db=None) -> bytes:
+def generate_student_fee_voucher_with_photo(student_id: str, school_id: str, db=None, refs: _VoucherReferenceData = None) -> bytes:
     """
     Generate a single student's fee voucher PDF with photo.
 
@@ -105,6 +346,7 @@ def generate_student_fee_voucher_with_photo(student_id: str, school_id: str, db=
         student_id: Student ID
         school_id: School ID for isolation
         db: Database connection (optional)
+        refs: Reference data shared across a batch of vouchers (optional)
 
     Returns:
         PDF bytes
@@ -120,70 +362,15 @@ def generate_student_fee_voucher_with_photo(student_id: str, school_id: str, db=
         if not student:
             raise ValueError(f"Student {student_id} not found")
 
-        # Get school info
-        try:
-            from app.services.saas_db import get_saas_root_db
-            saas_db = get_saas_root_db()
-            school = saas_db.schools.find_one({"school_id": school_id})
-            if not school:
-                school = db.schools.find_one({"school_id": school_id})
-        except Exception as e:
-            logger.warning(f"[FEE_VOUCHER] Could not fetch school from saas_db: {e}")
-            school = None
-
-        school_info = {
-            "name": school.get("school_name") or school.get("display_name") or school.get("name", "School") if school else "School",
-            "address": school.get("address", "") if school else "",
-            "phone": school.get("phone", "") if school else "",
-            "email": school.get("email", "") if school else "",
-        }
+        if refs is None:
+            refs = _VoucherReferenceData(db, school_id)
 
         # Get fee category for student's class
-        fee_assignment = db.class_fee_assignments.find_one({
-            "school_id": school_id,
-            "class_id": student.get("class_id"),
-            "is_active": True
-        })
-
-        fee_category = None
-        fee_components = []
-
-        if fee_assignment:
-            category_id = fee_assignment.get("category_id")
-            fee_category = db.fee_categories.find_one({"_id": ObjectId(category_id)})
-            if fee_category:
-                fee_components = fee_category.get("components", [])
+        fee_components = refs.fee_components(student.get("class_id"))
 
         # Generate PDF
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(
-            buffer,
-            pagesize=landscape(A4),
-            rightMargin=15*mm,
-            leftMargin=15*mm,
-            topMargin=15*mm,
-            bottomMargin=15*mm
-        )
-
-        styles = getSampleStyleSheet()
-        elements = []
-
-        # Generate voucher elements
-        student_elements = _generate_single_voucher_elements(
-            student,
-            school_info,
-            fee_components,
-            student.get("class_id"),
-            styles,
-            db,
-            doc
-        )
-        elements.extend(student_elements)
-
-        # Build PDF
-        doc.build(elements)
-        buffer.seek(0)
-        pdf_bytes = buffer.getvalue()
+        values = _voucher_values(student, fee_components, student.get("class_id"), db, refs)
+        pdf_bytes = _render_voucher_pdf(student, values)
 
         # Validate PDF
         if not pdf_bytes or len(pdf_bytes) < 100:
@@ -200,6 +387,57 @@ def generate_student_fee_voucher_with_photo(student_id: str, school_id: str, db=
         raise
 
 
+def _voucher_doc(buffer) -> SimpleDocTemplate:
+    """Landscape A4 document with the 15mm margins the voucher layout is sized for"""
+    return SimpleDocTemplate(
+        buffer,
+        pagesize=landscape(A4),
+        rightMargin=15*mm,
+        leftMargin=15*mm,
+        topMargin=15*mm,
+        bottomMargin=15*mm
+    )
+
+
+def _render_voucher_pdf(student: dict, values: dict) -> bytes:
+    """Render one student's voucher to PDF bytes (also the worker-process entry point)"""
+    buffer = io.BytesIO()
+    doc = _voucher_doc(buffer)
+    doc.build(_render_voucher_elements(student, values, _STYLES, doc))
+    return buffer.getvalue()
+
+
+def _render_vouchers(jobs: List[Tuple[dict, dict]]) -> Iterator[Optional[bytes]]:
+    """
+    Yield each (student, values) pair's PDF bytes, in order. Large batches go to the
+    worker pool; a voucher whose worker fails is retried in-process. None marks a
+    voucher that could not be rendered. Results are released as they are consumed,
+    so callers writing each PDF out hold one voucher in memory, not the whole batch.
+    """
+    futures = None
+    if len(jobs) >= VOUCHER_POOL_MIN_STUDENTS:
+        try:
+            pool = _get_render_pool()
+            futures = [pool.submit(_render_voucher_pdf, student, values) for student, values in jobs]
+        except Exception as e:
+            logger.warning(f"[FEE_VOUCHER] ⚠️ Render pool unavailable, rendering serially: {e}")
+
+    for idx, (student, values) in enumerate(jobs):
+        try:
+            if futures is not None:
+                future, futures[idx] = futures[idx], None
+                try:
+                    yield future.result()
+                    continue
+                except Exception as e:
+                    logger.warning(f"[FEE_VOUCHER] ⚠️ Worker failed for {student.get('full_name')}, retrying in-process: {e}")
+            pdf_bytes = _render_voucher_pdf(student, values)
+        except Exception as e:
+            logger.error(f"[FEE_VOUCHER] ❌ Failed to render voucher for {student.get('full_name')}: {str(e)}", exc_info=True)
+            pdf_bytes = None
+        yield pdf_bytes
+
+
 def _generate_single_voucher_elements(
     student: dict,
     school_info: dict,
@@ -207,30 +445,30 @@ def _generate_single_voucher_elements(
     class_id: str,
     styles,
     db,
-    doc
+    doc,
+    refs: _VoucherReferenceData = None
 ) -> list:
     """
     Helper function to generate 3-column voucher elements for a single student.
     Creates Office Copy | Student Copy | Notice Copy layout.
     Returns a list of reportlab elements.
     """
-    from reportlab.lib.pagesizes import A4, landscape
-    page_width, page_height = landscape(A4)
+    values = _voucher_values(student, fee_components, class_id, db, refs)
+    return _render_voucher_elements(student, values, styles, doc)
 
-    # Compute usable width based on document margins used by combined PDF (15mm each)
-    column_gap = 3 * mm
-    doc_side_margin = 15 * mm
-    usable_width = page_width - (doc_side_margin * 2) - (column_gap * 2)
-    # Scale overall content to 97% of usable width to make voucher nearly full-width
-    scale_factor = 0.97
-    scaled_usable = usable_width * scale_factor
-    # Column width (3 columns with small gaps)
-    col_width = scaled_usable / 3
-    # Available width for inner content (accounting for column paddings)
-    content_w = col_width - 10*mm
-    # Inner content further reduced so inner tables' borders fit inside the outer column padding
-    inner_content_w = content_w - 8*mm
 
+def _voucher_values(
+    student: dict,
+    fee_components: list,
+    class_id: str,
+    db,
+    refs: _VoucherReferenceData = None
+) -> dict:
+    """
+    Database-backed inputs for one student's voucher: fee components and monthly
+    totals, voucher settings and class name. Holds only plain data and PIL images,
+    so rendering can run without a database connection.
+    """
     # Prefer using the student's generated monthly fee if available (includes arrears and scholarship)
     total_fee = sum(comp.get("amount", 0) for comp in fee_components)
 
@@ -289,75 +527,70 @@ def _generate_single_voucher_elements(
         monthly_amount_paid = 0
         monthly_final_fee = total_fee - monthly_scholarship_amount + monthly_arrears_added
 
-    # Fetch school_id from student
-    school_id = student.get("school_id", "")
-
-    # Fetch voucher settings (header/footer/images) from database
-    voucher_settings = None
-    custom_header = ""
-    custom_footer = ""
-    school_name = ""
-    left_image_data = None
-    right_image_data = None
-    try:
-        voucher_settings = db.fee_voucher_settings.find_one({"school_id": school_id})
-        if voucher_settings:
-            custom_header = voucher_settings.get("header_text", "") or ""
-            custom_footer = voucher_settings.get("footer_text", "") or ""
-            school_name = voucher_settings.get("school_name", "") or ""
-
-            # Decode left image if available (robustly handle data-URLs)
-            left_image_blob = voucher_settings.get("left_image_blob")
-            if left_image_blob:
-                try:
-                    logger.info(f"[FEE_VOUCHER_IMG] 🔍 Batch: Loading left image blob (len:{len(left_image_blob)})")
-                    left_image_data = _load_image_from_blob(left_image_blob)
-                    if left_image_data:
-                        logger.info(f"[FEE_VOUCHER_IMG] ✅ Batch: Left image loaded successfully, size: {left_image_data.size}")
-                    else:
-                        logger.warning(f"[FEE_VOUCHER_IMG] ⚠️ Batch: _load_image_from_blob returned None for left image")
-                except Exception as e:
-                    logger.error(f"[FEE_VOUCHER_IMG] ❌ Batch: Could not load left image: {str(e)}", exc_info=True)
-            else:
-                logger.info(f"[FEE_VOUCHER_IMG] ⚠️ Batch: No left_image_blob provided")
+    # Voucher settings (header/footer/images) and class name are shared by the batch
+    if refs is None:
+        refs = _VoucherReferenceData(db, student.get("school_id", ""))
+    voucher_settings = refs.voucher_settings()
+    custom_header = voucher_settings["custom_header"]
+    custom_footer = voucher_settings["custom_footer"]
+    school_name = voucher_settings["school_name"]
+    left_image_data = voucher_settings["left_image_data"]
+    right_image_data = voucher_settings["right_image_data"]
+
+    class_name = refs.class_name(class_id)
+
+    return {
+        "fee_components": fee_components,
+        "total_fee": total_fee,
+        "monthly_scholarship_percent": monthly_scholarship_percent,
+        "monthly_scholarship_amount": monthly_scholarship_amount,
+        "monthly_arrears_added": monthly_arrears_added,
+        "monthly_amount_paid": monthly_amount_paid,
+        "monthly_final_fee": monthly_final_fee,
+        "custom_header": custom_header,
+        "custom_footer": custom_footer,
+        "school_name": school_name,
+        "left_image_data": left_image_data,
+        "right_image_data": right_image_data,
+        "class_name": class_name,
+    }
+
+
+def _render_voucher_elements(student: dict, values: dict, styles, doc) -> list:
+    """
+    Build the 3-column voucher (Office Copy | Student Copy | Notice Copy) for one
+    student from precomputed `_voucher_values`. Returns a list of reportlab elements.
+    """
+    from reportlab.lib.pagesizes import A4, landscape
+    page_width, page_height = landscape(A4)
 
-            # Decode right image if available (robustly handle data-URLs)
-            right_image_blob = voucher_settings.get("right_image_blob")
-            if right_image_blob:
-                try:
-                    logger.info(f"[FEE_VOUCHER_IMG] 🔍 Batch: Loading right image blob (len:{len(right_image_blob)})")
-                    right_image_data = _load_image_from_blob(right_image_blob)
-                    if right_image_data:
-                        logger.info(f"[FEE_VOUCHER_IMG] ✅ Batch: Right image loaded successfully, size: {right_image_data.size}")
-                    else:
-                        logger.warning(f"[FEE_VOUCHER_IMG] ⚠️ Batch: _load_image_from_blob returned None for right image")
-                except Exception as e:
-                    logger.error(f"[FEE_VOUCHER_IMG] ❌ Batch: Could not load right image: {str(e)}", exc_info=True)
-            else:
-                logger.info(f"[FEE_VOUCHER_IMG] ⚠️ Batch: No right_image_blob provided")
-    except Exception as e:
-        logger.warning(f"[FEE_VOUCHER] Could not fetch voucher settings: {e}")
+    # Compute usable width based on document margins used by combined PDF (15mm each)
+    column_gap = 3 * mm
+    doc_side_margin = 15 * mm
+    usable_width = page_width - (doc_side_margin * 2) - (column_gap * 2)
+    # Scale overall content to 97% of usable width to make voucher nearly full-width
+    scale_factor = 0.97
+    scaled_usable = usable_width * scale_factor
+    # Column width (3 columns with small gaps)
+    col_width = scaled_usable / 3
+    # Available width for inner content (accounting for column paddings)
+    content_w = col_width - 10*mm
+    # Inner content further reduced so inner tables' borders fit inside the outer column padding
+    inner_content_w = content_w - 8*mm
 
-    # Look up class document to get proper class name
-    class_name = "N/A"
-    if class_id:
-        try:
-            class_doc = db.classes.find_one({"_id": ObjectId(class_id)})
-            if class_doc:
-                class_name = class_doc.get("class_name", class_doc.get("name", "N/A"))
-                section = class_doc.get("section", "")
-                if section:
-                    class_name = f"{class_name} - {section}"
-            else:
-                class_doc = db.classes.find_one({"class_id": class_id})
-                if class_doc:
-                    class_name = class_doc.get("class_name", class_doc.get("name", "N/A"))
-                    section = class_doc.get("section", "")
-                    if section:
-                        class_name = f"{class_name} - {section}"
-        except Exception as e:
-            logger.warning(f"[FEE_VOUCHER] Could not lookup class: {e}")
-            class_name = str(class_id) if class_id else "N/A"
+    fee_components = values["fee_components"]
+    total_fee = values["total_fee"]
+    monthly_scholarship_percent = values["monthly_scholarship_percent"]
+    monthly_scholarship_amount = values["monthly_scholarship_amount"]
+    monthly_arrears_added = values["monthly_arrears_added"]
+    monthly_amount_paid = values["monthly_amount_paid"]
+    monthly_final_fee = values["monthly_final_fee"]
+    custom_header = values["custom_header"]
+    custom_footer = values["custom_footer"]
+    school_name = values["school_name"]
+    left_image_data = values["left_image_data"]
+    right_image_data = values["right_image_data"]
+    class_name = values["class_name"]
 
     # Prepare student photo if available
     logger.info(f"[FEE_VOUCHER] 📸 Loading student photo from profile")
@@ -390,6 +623,8 @@ def _generate_single_voucher_elements(
     while attempt < max_attempts:
         try:
             logger.info(f"[FEE_VOUCHER] Attempting to fit with font_scale={font_scale:.2f}")
+            # Styles depend only on font_scale, so build them once for all three copies
+            copy_styles = _copy_styles(font_scale)
 
             # Create each column with current font_scale
             office_copy = create_voucher_copy(
@@ -410,11 +645,12 @@ def _generate_single_voucher_elements(
                 content_w,
                 page_height,
                 doc,
-                locals().get('monthly_scholarship_percent', 0),
-                locals().get('monthly_scholarship_amount', 0),
-                locals().get('monthly_arrears_added', 0),
-                locals().get('monthly_amount_paid', 0),
-                locals().get('monthly_final_fee', None)
+                monthly_scholarship_percent,
+                monthly_scholarship_amount,
+                monthly_arrears_added,
+                monthly_amount_paid,
+                monthly_final_fee,
+                copy_styles=copy_styles
             )
             student_copy = create_voucher_copy(
                 "Student Copy",
@@ -434,11 +670,12 @@ def _generate_single_voucher_elements(
                 content_w,
                 page_height,
                 doc,
-                locals().get('monthly_scholarship_percent', 0),
-                locals().get('monthly_scholarship_amount', 0),
-                locals().get('monthly_arrears_added', 0),
-                locals().get('monthly_amount_paid', 0),
-                locals().get('monthly_final_fee', None)
+                monthly_scholarship_percent,
+                monthly_scholarship_amount,
+                monthly_arrears_added,
+                monthly_amount_paid,
+                monthly_final_fee,
+                copy_styles=copy_styles
             )
             notice_copy = create_voucher_copy(
                 "Notice Copy",
@@ -458,11 +695,12 @@ def _generate_single_voucher_elements(
                 content_w,
                 page_height,
                 doc,
-                locals().get('monthly_scholarship_percent', 0),
-                locals().get('monthly_scholarship_amount', 0),
-                locals().get('monthly_arrears_added', 0),
-                locals().get('monthly_amount_paid', 0),
-                locals().get('monthly_final_fee', None)
+                monthly_scholarship_percent,
+                monthly_scholarship_amount,
+                monthly_arrears_added,
+                monthly_amount_paid,
+                monthly_final_fee,
+                copy_styles=copy_styles
             )
 
             columns = [office_copy, student_copy, notice_copy]
@@ -497,23 +735,58 @@ def _generate_single_voucher_elements(
     # Create main table with 3 columns and dotted separators between them
     logger.info(f"[FEE_VOUCHER] 🔲 Creating 3-column table with dotted separators")
     main_table = Table([columns], colWidths=[col_width, col_width, col_width])
-    main_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        # Dotted separators between columns (no vertical lines at borders)
-        ('LINEABOVE', (0, 0), (-1, -1), 0, colors.white),
-        ('LINEBELOW', (0, 0), (-1, -1), 0, colors.white),
-        ('LINELEFT', (0, 0), (-1, -1), 0, colors.white),
-        ('LINERIGHT', (0, 0), (-1, -1), 0, colors.white),
-        # Separator between Bank Copy and Student Copy (thin grey line)
-        ('LINEAFTER', (0, 0), (0, -1), 0.5, colors.grey),
-        # Separator between Student Copy and Office Copy (thin grey line)
-        ('LINEAFTER', (1, 0), (1, -1), 0.5, colors.grey),
-    ]))
+    main_table.setStyle(_MAIN_TABLE_STYLE)
 
     return [main_table]
 
 
+@lru_cache(maxsize=16)
+def _copy_styles(font_scale: float) -> Dict[str, ParagraphStyle]:
+    """Paragraph styles for a voucher copy at `font_scale` (shared by all copies and vouchers)"""
+    return {
+        "header": ParagraphStyle(
+            'CopyHeader',
+            parent=_STYLES['Normal'],
+            fontSize=7 * font_scale,  # Reduced from 8
+            alignment=TA_CENTER,
+            textColor=colors.white,
+            fontName='Helvetica-Bold'
+        ),
+        "school_name": ParagraphStyle(
+            'SchoolName',
+            parent=_STYLES['Normal'],
+            fontSize=7 * font_scale,  # Reduced from 8
+            alignment=TA_CENTER,
+            textColor=colors.HexColor('#1a365d'),
+            fontName='Helvetica-Bold',
+            spaceAfter=0,
+            spaceBefore=0
+        ),
+        "title": ParagraphStyle(
+            'VoucherTitle',
+            parent=_STYLES['Heading2'],
+            fontSize=7 * font_scale,  # Reduced from 8
+            alignment=TA_CENTER,
+            textColor=colors.HexColor('#2c5282'),
+            spaceAfter=0.3*mm,  # Reduced from 0.5mm
+            spaceBefore=0.3*mm  # Reduced from 0.5mm
+        ),
+        "header_custom": ParagraphStyle('CustomHeader', parent=_STYLES['Normal'], fontSize=5.5 * font_scale, alignment=TA_CENTER, textColor=colors.HexColor('#333333'), fontName='Helvetica-Bold', spaceAfter=0.3*mm, spaceBefore=0),
+        "info": ParagraphStyle('Info', parent=_STYLES['Normal'], fontSize=6 * font_scale, leading=7 * font_scale),  # Reduced from 7/9
+        "bold": ParagraphStyle('BoldInfo', parent=_STYLES['Normal'], fontSize=6 * font_scale, leading=7 * font_scale, fontName='Helvetica-Bold'),  # Reduced from 7/9
+        "fee_header": ParagraphStyle('FeeHeader', parent=_STYLES['Normal'], fontSize=5.5 * font_scale, fontName='Helvetica-Bold', textColor=colors.white),  # Reduced from 6
+        "fee_item": ParagraphStyle('FeeItem', parent=_STYLES['Normal'], fontSize=5.5 * font_scale),  # Reduced from 6
+        "fee_amount": ParagraphStyle('FeeAmount', parent=_STYLES['Normal'], fontSize=5.5 * font_scale, alignment=TA_RIGHT),  # Reduced from 6
+        "scholarship": ParagraphStyle('ScholarshipItem', parent=_STYLES['Normal'], fontSize=5.5 * font_scale, textColor=colors.HexColor('#22543d')),
+        "scholarship_amount": ParagraphStyle('ScholarshipAmount', parent=_STYLES['Normal'], fontSize=5.5 * font_scale, alignment=TA_RIGHT, textColor=colors.HexColor('#22543d')),
+        "total": ParagraphStyle('Total', parent=_STYLES['Normal'], fontSize=7 * font_scale, fontName='Helvetica-Bold'),
+        "total_amount": ParagraphStyle('TotalAmount', parent=_STYLES['Normal'], fontSize=7 * font_scale, fontName='Helvetica-Bold', alignment=TA_RIGHT),
+        "date": ParagraphStyle('DateInfo', parent=_STYLES['Normal'], fontSize=5 * font_scale),  # Reduced from 5.5
+        "footer_custom": ParagraphStyle('CustomFooter', parent=_STYLES['Normal'], fontSize=5 * font_scale, alignment=TA_CENTER, textColor=colors.HexColor('#444444'), fontName='Helvetica-Oblique', leading=6 * font_scale),  # Reduced from 6/7
+        "sig_stamp": ParagraphStyle('SigStamp', parent=_STYLES['Normal'], fontSize=5 * font_scale, alignment=TA_CENTER),  # Reduced from 5.5
+    }
+
+
 def create_voucher_copy(
     copy_title: str,
     font_scale: float,
@@ -536,35 +809,27 @@ def create_voucher_copy(
     monthly_scholarship_amount: float = 0,
     monthly_arrears_added: float = 0,
     monthly_amount_paid: float = 0,
-    monthly_final_fee = None
+    monthly_final_fee = None,
+    copy_styles: Dict[str, ParagraphStyle] = None
 ):
     """Create a single voucher copy for one column. Includes student photo, reduced spacing, and one-line signature layout. `font_scale` scales font sizes for auto-fit.
 
     The function now accepts precomputed monthly values for scholarship and arrears so
     the PDF shows consistent calculations with the UI.
     """
+    if copy_styles is None:
+        copy_styles = _copy_styles(font_scale)
     copy_elements = []
     logger.info(f"[FEE_VOUCHER] Creating {copy_title} with font_scale={font_scale:.2f}, photo_available={photo_data is not None}")
 
     # Copy header (Bank Copy / Student Copy / Office Copy)
-    header_style = ParagraphStyle(
-        'CopyHeader',
-        parent=styles['Normal'],
-        fontSize=7 * font_scale,  # Reduced from 8
-        alignment=TA_CENTER,
-        textColor=colors.white,
-        fontName='Helvetica-Bold'
-    )
+    header_style = copy_styles["header"]
 
     copy_header = Table(
         [[Paragraph(copy_title, header_style)]],
         colWidths=[inner_content_w]
     )
-    copy_header.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#1a365d')),
-        ('TOPPADDING', (0, 0), (-1, -1), 1.5),  # Reduced from 3
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 1.5),  # Reduced from 3
-    ]))
+    copy_header.setStyle(_COPY_HEADER_TABLE_STYLE)
     copy_elements.append(copy_header)
     logger.info(f"[FEE_VOUCHER] Added {copy_title} header")
 
@@ -591,16 +856,7 @@ def create_voucher_copy(
         header_row_elements.append(Spacer(15*mm, 15*mm))
 
     # School name (center)
-    school_name_style = ParagraphStyle(
-        'SchoolName',
-        parent=styles['Normal'],
-        fontSize=7 * font_scale,  # Reduced from 8
-        alignment=TA_CENTER,
-        textColor=colors.HexColor('#1a365d'),
-        fontName='Helvetica-Bold',
-        spaceAfter=0,
-        spaceBefore=0
-    )
+    school_name_style = copy_styles["school_name"]
     if school_name:
         header_row_elements.append(Paragraph(school_name, school_name_style))
     else:
@@ -629,37 +885,26 @@ def create_voucher_copy(
         [header_row_elements],
         colWidths=[18*mm, inner_content_w - 36*mm, 18*mm]
     )
-    header_row_table.setStyle(TableStyle([
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('ALIGN', (1, 0), (1, 0), 'CENTER'),
-    ]))
+    header_row_table.setStyle(_HEADER_ROW_TABLE_STYLE)
     copy_elements.append(header_row_table)
     # Reserve fixed header spacing so header area is consistent across vouchers
     copy_elements.append(Spacer(1, 2.5*mm))
 
     # Fee Voucher centered title - smaller font, reduced spacing
-    title_style = ParagraphStyle(
-        'VoucherTitle',
-        parent=styles['Heading2'],
-        fontSize=7 * font_scale,  # Reduced from 8
-        alignment=TA_CENTER,
-        textColor=colors.HexColor('#2c5282'),
-        spaceAfter=0.3*mm,  # Reduced from 0.5mm
-        spaceBefore=0.3*mm  # Reduced from 0.5mm
-    )
+    title_style = copy_styles["title"]
     copy_elements.append(Paragraph("<b>Fee Voucher</b>", title_style))
 
     # Custom header (if provided) - directly under Fee Voucher
     if custom_header:
-        header_custom_style = ParagraphStyle('CustomHeader', parent=styles['Normal'], fontSize=5.5 * font_scale, alignment=TA_CENTER, textColor=colors.HexColor('#333333'), fontName='Helvetica-Bold', spaceAfter=0.3*mm, spaceBefore=0)
+        header_custom_style = copy_styles["header_custom"]
         copy_elements.append(Paragraph(custom_header, header_custom_style))
 
     # Student photo now shown next to student details (see info_photo_table below)
     logger.info(f"[FEE_VOUCHER] Photo data available: {photo_data is not None}")
 
     # Student info section
-    info_style = ParagraphStyle('Info', parent=styles['Normal'], fontSize=6 * font_scale, leading=7 * font_scale)  # Reduced from 7/9
-    bold_style = ParagraphStyle('BoldInfo', parent=styles['Normal'], fontSize=6 * font_scale, leading=7 * font_scale, fontName='Helvetica-Bold')  # Reduced from 7/9
+    info_style = copy_styles["info"]
+    bold_style = copy_styles["bold"]
 
     guardian_info = student.get("guardian_info") or {}
     father_name = guardian_info.get("father_name") or guardian_info.get("name") or "N/A"
@@ -705,22 +950,15 @@ def create_voucher_copy(
         info_photo_row = [[info_table]]
         info_photo_table = Table(info_photo_row, colWidths=[inner_content_w])
 
-    info_photo_table.setStyle(TableStyle([
-        ('BOX', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 1),  # Reduced from 2
-        ('RIGHTPADDING', (0, 0), (-1, -1), 1),  # Reduced from 2
-        ('TOPPADDING', (0, 0), (-1, -1), 2),  # Reduced from 4
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 2),  # Reduced from 4
-    ]))
+    info_photo_table.setStyle(_INFO_PHOTO_TABLE_STYLE)
     copy_elements.append(info_photo_table)
     copy_elements.append(Spacer(1, 0.8*mm))  # Further reduced from 1.5mm
     logger.info(f"[FEE_VOUCHER] Added student info section to {copy_title}")
 
     # Fee details header - compact, reduced font
-    fee_header_style = ParagraphStyle('FeeHeader', parent=styles['Normal'], fontSize=5.5 * font_scale, fontName='Helvetica-Bold', textColor=colors.white)  # Reduced from 6
-    fee_item_style = ParagraphStyle('FeeItem', parent=styles['Normal'], fontSize=5.5 * font_scale)  # Reduced from 6
-    fee_amount_style = ParagraphStyle('FeeAmount', parent=styles['Normal'], fontSize=5.5 * font_scale, alignment=TA_RIGHT)  # Reduced from 6
+    fee_header_style = copy_styles["fee_header"]
+    fee_item_style = copy_styles["fee_item"]
+    fee_amount_style = copy_styles["fee_amount"]
 
     # Fee table rows
     fee_rows = [
@@ -804,8 +1042,8 @@ def create_voucher_copy(
     base_fee = total_fee
 
     # Scholarship row (always show scholarship percent and amount)
-    scholarship_style = ParagraphStyle('ScholarshipItem', parent=styles['Normal'], fontSize=5.5 * font_scale, textColor=colors.HexColor('#22543d'))
-    scholarship_amount_style = ParagraphStyle('ScholarshipAmount', parent=styles['Normal'], fontSize=5.5 * font_scale, alignment=TA_RIGHT, textColor=colors.HexColor('#22543d'))
+    scholarship_style = copy_styles["scholarship"]
+    scholarship_amount_style = copy_styles["scholarship_amount"]
     fee_rows.append([
         Paragraph(f"Scholarship ({scholarship_percent:.0f}%)", scholarship_style),
         Paragraph(f"−Rs. {scholarship_amount:,.0f}", scholarship_amount_style)
@@ -838,8 +1076,8 @@ def create_voucher_copy(
 
     # Total / Grand Total row (include arrears, subtract scholarship)
     total_with_arrears = monthly_final_fee if monthly_final_fee is not None else (base_fee - scholarship_amount + arrears_amount)
-    total_style = ParagraphStyle('Total', parent=styles['Normal'], fontSize=7 * font_scale, fontName='Helvetica-Bold')
-    total_amount_style = ParagraphStyle('TotalAmount', parent=styles['Normal'], fontSize=7 * font_scale, fontName='Helvetica-Bold', alignment=TA_RIGHT)
+    total_style = copy_styles["total"]
+    total_amount_style = copy_styles["total_amount"]
     fee_rows.append([
         Paragraph("<b>GRAND TOTAL</b>", total_style),
         Paragraph(f"<b>Rs. {total_with_arrears:,.0f}</b>", total_amount_style)
@@ -865,7 +1103,7 @@ def create_voucher_copy(
     logger.info(f"[FEE_VOUCHER] Added fee table to {copy_title} with {len(fee_components)} components")
 
     # Issue/Due date row
-    date_style = ParagraphStyle('DateInfo', parent=styles['Normal'], fontSize=5 * font_scale)  # Reduced from 5.5
+    date_style = copy_styles["date"]
     issue_dt = datetime.now()
     due_date_obj = issue_dt.replace(day=28)  # Default due date
     date_row = Table([
@@ -880,7 +1118,7 @@ def create_voucher_copy(
 
     # Custom footer (if provided)
     if custom_footer:
-        footer_custom_style = ParagraphStyle('CustomFooter', parent=styles['Normal'], fontSize=5 * font_scale, alignment=TA_CENTER, textColor=colors.HexColor('#444444'), fontName='Helvetica-Oblique', leading=6 * font_scale)  # Reduced from 6/7
+        footer_custom_style = copy_styles["footer_custom"]
         copy_elements.append(Paragraph(custom_footer, footer_custom_style))
         copy_elements.append(Spacer(1, 0.5*mm))  # Further reduced from 1.5mm
 
@@ -889,7 +1127,7 @@ def create_voucher_copy(
 
     # One-line signature layout: Accountant (left) and Bank Stamp (right) with underlines
     logger.info(f"[FEE_VOUCHER] Adding signature/stamp line to {copy_title}")
-    sig_stamp_style = ParagraphStyle('SigStamp', parent=styles['Normal'], fontSize=5 * font_scale, alignment=TA_CENTER)  # Reduced from 5.5
+    sig_stamp_style = copy_styles["sig_stamp"]
     
     # Create a single row with two cells: left for signature, right for stamp
     sig_left_width = inner_content_w * 0.48
@@ -900,35 +1138,20 @@ def create_voucher_copy(
     
     # Combine labels in one row
     labels_row = Table([[sig_label, stamp_label]], colWidths=[sig_left_width, sig_right_width])
-    labels_row.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-    ]))
+    labels_row.setStyle(_SIGNATURE_LABELS_TABLE_STYLE)
     copy_elements.append(labels_row)
     copy_elements.append(Spacer(1, 0.3*mm))
     
     # Add underlines for filling
     # Draw horizontal lines under each label using table cell borders
     underline_table = Table([['', '']], colWidths=[sig_left_width, sig_right_width])
-    underline_table.setStyle(TableStyle([
-        ('LINEABOVE', (0, 0), (0, 0), 0.6, colors.black),
-        ('LINEABOVE', (1, 0), (1, 0), 0.6, colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('TOPPADDING', (0, 0), (-1, -1), 3),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
-    ]))
+    underline_table.setStyle(_SIGNATURE_LINES_TABLE_STYLE)
     copy_elements.append(underline_table)
     logger.info(f"[FEE_VOUCHER] Added one-line signature/stamp layout to {copy_title}")
 
     # Combine all elements into a single column table - no outer box border
     column_table = Table([[elem] for elem in copy_elements], colWidths=[content_w])
-    column_table.setStyle(TableStyle([
-        # No outer box - columns separated by dotted lines in main table
-        ('LEFTPADDING', (0, 0), (-1, -1), 2),  # Reduced from 3
-        ('RIGHTPADDING', (0, 0), (-1, -1), 2),  # Reduced from 3
-        ('TOPPADDING', (0, 0), (-1, -1), 1.5),  # Reduced from 2
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 1.5),  # Reduced from 2
-    ]))
+    column_table.setStyle(_COPY_COLUMN_TABLE_STYLE)
 
     # Auto-fit: if column height exceeds available printable height, reduce padding
     try:
@@ -937,12 +1160,7 @@ def create_voucher_copy(
         logger.info(f"[FEE_VOUCHER] {copy_title} wrapped height: {h:.1f}mm (max: {max_col_h:.1f}mm)")
         if h > max_col_h:
             logger.warning(f"[FEE_VOUCHER] {copy_title} too tall ({h:.1f} > {max_col_h:.1f}), reducing paddings to fit")
-            column_table.setStyle(TableStyle([
-                ('TOPPADDING', (0, 0), (-1, -1), 0.8),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 0.8),
-                ('LEFTPADDING', (0, 0), (-1, -1), 1),
-                ('RIGHTPADDING', (0, 0), (-1, -1), 1),
-            ]))
+            column_table.setStyle(_COPY_COLUMN_TIGHT_TABLE_STYLE)
     except Exception as e:
         logger.error(f"[FEE_VOUCHER] Error during auto-fit sizing: {str(e)}", exc_info=True)
 
@@ -983,54 +1201,23 @@ def generate_class_vouchers_combined_pdf(
             logger.warning(f"[FEE_VOUCHER] No students found in class {class_id}")
             raise ValueError("No students found in this class")
 
-        # Get school info once - School IDs are strings in saas_root_db
-        try:
-            from app.services.saas_db import get_saas_root_db
-            saas_db = get_saas_root_db()
-            school = saas_db.schools.find_one({"school_id": school_id})
-            if not school:
-                school = db.schools.find_one({"school_id": school_id})
-        except Exception as e:
-            logger.warning(f"[FEE_VOUCHER] Could not fetch school from saas_db: {e}")
-            school = None
-
-        school_info = {
-            "name": school.get("school_name") or school.get("display_name") or school.get("name", "School") if school else "School",
-            "address": school.get("address", "") if school else "",
-            "phone": school.get("phone", "") if school else "",
-            "email": school.get("email", "") if school else "",
-        }
+        # School info, fee category, voucher settings and class name are read once
+        refs = _VoucherReferenceData(db, school_id)
+        school_info = refs.school_info()
 
         logger.info(f"[FEE_VOUCHER] School info for combined PDF: {school_info['name']}")
 
         # Get fee category for the class
-        fee_assignment = db.class_fee_assignments.find_one({
-            "school_id": school_id,
-            "class_id": class_id,
-            "is_active": True
-        })
-
-        fee_category = None
-        fee_components = []
+        fee_components = refs.fee_components(class_id)
 
-        if fee_assignment:
-            category_id = fee_assignment.get("category_id")
-            fee_category = db.fee_categories.find_one({"_id": ObjectId(category_id)})
-            if fee_category:
-                fee_components = fee_category.get("components", [])
+        if PYPDF_AVAILABLE and len(students) >= VOUCHER_POOL_MIN_STUDENTS:
+            return _merge_class_vouchers(students, fee_components, class_id, db, refs)
 
         # Create combined PDF
         buffer = io.BytesIO()
-        doc = SimpleDocTemplate(
-            buffer,
-            pagesize=landscape(A4),
-            rightMargin=15*mm,
-            leftMargin=15*mm,
-            topMargin=15*mm,
-            bottomMargin=15*mm
-        )
+        doc = _voucher_doc(buffer)
 
-        styles = getSampleStyleSheet()
+        styles = _STYLES
         elements = []
 
         # Generate voucher for each student
@@ -1048,7 +1235,8 @@ def generate_class_vouchers_combined_pdf(
                     class_id,
                     styles,
                     db,
-                    doc
+                    doc,
+                    refs
                 )
                 elements.extend(student_elements)
 
@@ -1062,7 +1250,6 @@ def generate_class_vouchers_combined_pdf(
         # Build PDF
         try:
             doc.build(elements)
-            buffer.seek(0)
             pdf_bytes = buffer.getvalue()
 
             # Validate PDF
@@ -1083,6 +1270,35 @@ def generate_class_vouchers_combined_pdf(
         raise
 
 
+def _merge_class_vouchers(students: List[dict], fee_components: list, class_id: str, db, refs: _VoucherReferenceData) -> bytes:
+    """Render each student's voucher in the worker pool and merge the pages in order"""
+    jobs = []
+    for student in students:
+        try:
+            jobs.append((student, _voucher_values(student, fee_components, class_id, db, refs)))
+        except Exception as e:
+            logger.error(f"[FEE_VOUCHER] ❌ Failed to add voucher for student: {str(e)}", exc_info=True)
+
+    writer = PdfWriter()
+    for (student, _), pdf_bytes in zip(jobs, _render_vouchers(jobs)):
+        if not pdf_bytes:
+            continue
+        for page in PdfReader(io.BytesIO(pdf_bytes)).pages:
+            writer.add_page(page)
+        logger.info(f"[FEE_VOUCHER] Added voucher for {student.get('full_name')} to combined PDF")
+
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    pdf_bytes = buffer.getvalue()
+
+    # Validate PDF
+    if not pdf_bytes or len(pdf_bytes) < 100 or not writer.pages:
+        raise ValueError(f"Generated combined PDF is too small ({len(pdf_bytes)} bytes)")
+
+    logger.info(f"[FEE_VOUCHER] ✅ Successfully generated combined PDF with {len(students)} vouchers ({len(pdf_bytes)} bytes)")
+    return pdf_bytes
+
+
 def generate_class_vouchers_zip(
     class_id: str,
     school_id: str,
@@ -1122,19 +1338,27 @@ def generate_class_vouchers_zip(
         successful_count = 0
         failed_count = 0
 
+        # Reference data shared by every voucher in the class
+        refs = _VoucherReferenceData(db, school_id)
+
+        # Database reads stay in this thread; rendering fans out to the worker pool
+        jobs = []
+        for student in students:
+            try:
+                fee_components = refs.fee_components(student.get("class_id"))
+                jobs.append((student, _voucher_values(student, fee_components, student.get("class_id"), db, refs)))
+            except Exception as e:
+                logger.error(f"[FEE_VOUCHER] ❌ Failed to generate voucher for student {student.get('full_name', 'unknown')}: {str(e)}", exc_info=True)
+                failed_count += 1
+
         with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for student in students:
+            for (student, _), pdf_bytes in zip(jobs, _render_vouchers(jobs)):
                 try:
                     student_id = str(student["_id"])
                     student_name = student.get("full_name", "unknown").replace(" ", "_").replace("/", "_")
                     roll_number = student.get("roll_number", "N/A").replace("/", "_")
 
-                    logger.info(f"[FEE_VOUCHER] Generating voucher for student: {student_name} ({student_id})")
-
-                    # Generate individual PDF
-                    pdf_bytes = generate_student_fee_voucher_with_photo(student_id, school_id, db)
-
-                    if pdf_bytes and len(pdf_bytes) > 0:
+                    if pdf_bytes and pdf_bytes.startswith(b'%PDF'):
                         # Add to ZIP
                         filename = f"{roll_number}_{student_name}.pdf"
                         zip_file.writestr(filename, pdf_bytes)
@@ -1145,13 +1369,10 @@ def generate_class_vouchers_zip(
                         failed_count += 1
 
                 except Exception as e:
-                    logger.error(f"[FEE_VOUCHER] ❌ Failed to generate voucher for student {student.get('full_name', 'unknown')}: {str(e)}", exc_info=True)
+                    logger.error(f"[FEE_VOUCHER] ❌ Failed to add voucher for student {student.get('full_name', 'unknown')}: {str(e)}", exc_info=True)
                     failed_count += 1
-                    # Continue with other students
-                    continue
 
-        zip_buffer.seek(0)
-        zip_size = len(zip_buffer.getvalue())
+        zip_size = zip_buffer.getbuffer().nbytes
         logger.info(f"[FEE_VOUCHER] ✅ Successfully generated ZIP with {successful_count} vouchers ({failed_count} failed). ZIP size: {zip_size} bytes")
 
         if successful_count == 0:
@@ -1169,41 +1390,44 @@ def get_classes_with_fee_summary(school_id: str) -> List[Dict[str, Any]]:
     db = get_db()
 
     # Get all classes
-    classes = list(db.classes.find({"school_id": school_id}))
-
-    result = []
-    for cls in classes:
-        class_id = str(cls["_id"])
-        class_name = cls.get("class_name") or cls.get("name", class_id)
-
-        # Count students
-        student_count = db.students.count_documents({
-            "class_id": class_id,
-            "school_id": school_id,
-            "status": "active"
-        })
-
-        # Calculate fee stats
-        pipeline = [
-            {"$match": {"class_id": class_id, "school_id": school_id}},
+    classes = list(db.classes.find({"school_id": school_id}, {"_id": 1, "class_name": 1, "name": 1, "section": 1}))
+
+    # Active student counts and fee record stats for every class in one pass each
+    student_counts = {
+        row["_id"]: row["count"]
+        for row in db.students.aggregate([
+            {"$match": {"school_id": school_id, "status": "active"}},
+            {"$project": {"_id": 0, "class_id": 1}},
+            {"$group": {"_id": "$class_id", "count": {"$sum": 1}}}
+        ])
+    }
+
+    fee_stats_by_class = {
+        row["_id"]: row
+        for row in db.fee_records.aggregate([
+            {"$match": {"school_id": school_id}},
             {"$group": {
-                "_id": None,
+                "_id": "$class_id",
                 "total_due": {"$sum": "$amount"},
                 "total_paid": {"$sum": "$amount_paid"},
                 "pending_count": {
                     "$sum": {"$cond": [{"$in": ["$status", ["pending", "unpaid"]]}, 1, 0]}
                 }
             }}
-        ]
+        ])
+    }
 
-        stats = list(db.fee_records.aggregate(pipeline))
-        fee_stats = stats[0] if stats else {"total_due": 0, "total_paid": 0, "pending_count": 0}
+    result = []
+    for cls in classes:
+        class_id = str(cls["_id"])
+        class_name = cls.get("class_name") or cls.get("name", class_id)
+        fee_stats = fee_stats_by_class.get(class_id, {})
 
         result.append({
             "id": class_id,
             "class_name": class_name,
             "section": cls.get("section", "A"),
-            "student_count": student_count,
+            "student_count": student_counts.get(class_id, 0),
             "total_due": fee_stats.get("total_due", 0),
             "total_paid": fee_stats.get("total_paid", 0),
             "pending_count": fee_stats.get("pending_count", 0)
@@ -3,14 +3,43 @@ Image Service - MongoDB Blob Storage
 Handles image storage as base64 blobs directly in MongoDB documents.
 Replaces Cloudinary for self-hosted image storage.
 """
-import base64
+import hashlib
 import io
+try:
+    import pybase64 as base64  # SIMD-accelerated, drop-in for the stdlib module
+except ImportError:
+    import base64
 import logging
-from typing import Optional, Tuple, Dict, Any
+from typing import Optional, Tuple, Dict, Any, Union
+import numpy as np
 from PIL import Image
 
 logger = logging.getLogger(__name__)
 
+# libjpeg-turbo JPEG decoder (optional); Pillow is used when unavailable
+try:
+    import simplejpeg
+    SIMPLEJPEG_AVAILABLE = True
+except ImportError:
+    SIMPLEJPEG_AVAILABLE = False
+
+JPEG_MAGIC = b"\xff\xd8\xff"
+PNG_MAGIC = b"\x89PNG\r\n\x1a\n"
+
+
+def has_image_signature(data: bytes) -> bool:
+    """Cheap magic-byte check for JPEG/PNG/WEBP before handing bytes to a decoder"""
+    return (
+        data[:3] == JPEG_MAGIC
+        or data[:8] == PNG_MAGIC
+        or (data[:4] == b"RIFF" and data[8:12] == b"WEBP")
+    )
+
+
+def image_digest(image_bytes: bytes) -> str:
+    """Content hash used to key per-image caches"""
+    return hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+
 
 class ImageService:
     """Service for handling image storage as base64 blobs in MongoDB"""
@@ -133,6 +162,21 @@ class ImageService:
             logger.error(f"Failed to convert base64 to PIL image: {e}")
             return None
     
+    @staticmethod
+    def decode_for_embedding(image_bytes: bytes) -> Union[np.ndarray, Image.Image]:
+        """
+        Decode image bytes for the embedding pipeline.
+        JPEGs go through simplejpeg (SIMD IDCT) and come back as an RGB
+        numpy array; other formats, or a missing simplejpeg, use Pillow.
+        Raises on undecodable input.
+        """
+        if SIMPLEJPEG_AVAILABLE and image_bytes[:3] == JPEG_MAGIC:
+            try:
+                return simplejpeg.decode_jpeg(image_bytes, colorspace="RGB", fastdct=True)
+            except Exception as e:
+                logger.debug(f"simplejpeg decode failed, falling back to Pillow: {e}")
+        return Image.open(io.BytesIO(image_bytes))
+    
     @staticmethod
     def extract_for_embedding(base64_str: str) -> Optional[bytes]:
         """
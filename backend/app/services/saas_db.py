@@ -14,6 +14,7 @@ from datetime import datetime
 from bson import ObjectId
 from app.config import settings
 from app.utils.mongo_uri_patch import patch_mongo_uri
+from app.utils.indexes import ensure_daily_attendance_indexes
 
 logger = logging.getLogger(__name__)
 
@@ -157,6 +158,10 @@ def create_school_database(database_name: str) -> bool:
         db.fees.create_index("school_id")
         db.payments.create_index("school_id")
         db.attendance.create_index([("school_id", 1), ("date", -1)])
+        # Required by the $merge that maintains the fee summary rows
+        db.student_fee_summary.create_index("student_id", unique=True)
+        # One attendance record per person per day (face check-in/out relies on it)
+        ensure_daily_attendance_indexes(db)
         
         logger.info(f"✅ Created school database: {database_name}")
         return True
@@ -336,10 +336,83 @@ class DataCleanupJob:
         self.is_running = False
 
 
+class FeeSummaryRebuildJob:
+    """
+    Nightly rebuild of each school's student_fee_summary collection.
+    Payment writes keep rows current in between; the rebuild picks up new
+    students and fee category / class assignment changes.
+    """
+    
+    def __init__(self):
+        self.is_running = False
+        self.last_run: Optional[datetime] = None
+        self.stop_event: Optional[asyncio.Event] = None
+    
+    async def rebuild_all_schools(self) -> int:
+        """Rebuild fee summaries for every active school; returns schools rebuilt"""
+        from app.services.saas_db import get_school_database
+        from app.services.student_fee_summary_service import rebuild_student_fee_summaries
+        
+        root_db = get_saas_root_db()
+        schools = list(root_db.schools.find(
+            {"status": {"$ne": SchoolStatus.DELETED.value}},
+            {"school_id": 1, "database_name": 1}
+        ))
+        
+        rebuilt = 0
+        for school in schools:
+            school_id = school.get("school_id")
+            db_name = school.get("database_name")
+            if not school_id or not db_name:
+                continue
+            try:
+                school_db = get_school_database(db_name)
+                await asyncio.to_thread(rebuild_student_fee_summaries, school_id, school_db)
+                rebuilt += 1
+            except Exception as e:
+                logger.error(f"[FEE_SUMMARY_JOB] ❌ Rebuild failed for {school_id}: {e}")
+        
+        self.last_run = datetime.utcnow()
+        logger.info(f"[FEE_SUMMARY_JOB] ✅ Rebuilt fee summaries for {rebuilt}/{len(schools)} schools")
+        return rebuilt
+    
+    async def start_scheduled_job(self, interval_hours: int = 24):
+        """Start the scheduled rebuild job"""
+        self.is_running = True
+        self.stop_event = asyncio.Event()
+        
+        logger.info(f"[FEE_SUMMARY_JOB] 🚀 Starting scheduled fee summary rebuild (interval: {interval_hours}h)")
+        
+        while not self.stop_event.is_set():
+            try:
+                await self.rebuild_all_schools()
+            except Exception as e:
+                logger.error(f"[FEE_SUMMARY_JOB] ❌ Rebuild failed: {e}")
+            
+            try:
+                await asyncio.wait_for(
+                    self.stop_event.wait(),
+                    timeout=interval_hours * 3600
+                )
+                break
+            except asyncio.TimeoutError:
+                pass
+        
+        self.is_running = False
+        logger.info("[FEE_SUMMARY_JOB] 🛑 Scheduled fee summary rebuild stopped")
+    
+    def stop(self):
+        """Stop the scheduled job"""
+        if self.stop_event:
+            self.stop_event.set()
+        self.is_running = False
+
+
 # Global job instances
 _snapshot_job: Optional[UsageSnapshotJob] = None
 _cleanup_job: Optional[DataCleanupJob] = None
 _billing_job: Optional[BillingCheckJob] = None
+_fee_summary_job: Optional[FeeSummaryRebuildJob] = None
 
 
 def get_snapshot_job() -> UsageSnapshotJob:
@@ -366,17 +439,27 @@ def get_billing_job() -> BillingCheckJob:
     return _billing_job
 
 
+def get_fee_summary_job() -> FeeSummaryRebuildJob:
+    """Get or create the fee summary rebuild job instance"""
+    global _fee_summary_job
+    if _fee_summary_job is None:
+        _fee_summary_job = FeeSummaryRebuildJob()
+    return _fee_summary_job
+
+
 async def start_background_jobs():
     """Start all background jobs (called from app startup)"""
     snapshot_job = get_snapshot_job()
     cleanup_job = get_cleanup_job()
     billing_job = get_billing_job()
+    fee_summary_job = get_fee_summary_job()
     
     # Start jobs in background
     # Snapshot job scheduled to run every 1 hour
     asyncio.create_task(snapshot_job.start_scheduled_job(interval_hours=1))
     asyncio.create_task(cleanup_job.start_scheduled_job(interval_hours=48))
     asyncio.create_task(billing_job.start_scheduled_job(interval_hours=24))
+    asyncio.create_task(fee_summary_job.start_scheduled_job(interval_hours=24))
     # Start embedding sync job (polling fallback for change-stream updates)
     try:
         embedding_job = EmbeddingSyncJob()
@@ -396,6 +479,8 @@ async def stop_background_jobs():
         _cleanup_job.stop()
     if _billing_job:
         _billing_job.stop()
+    if _fee_summary_job:
+        _fee_summary_job.stop()
     # Note: EmbeddingSyncJob stop handled by event loop shutdown
     # Give jobs time to stop gracefully
     await asyncio.sleep(1)
@@ -441,9 +526,9 @@ class EmbeddingSyncJob:
 
     async def sync_once(self):
         from datetime import datetime
-        import numpy as np
         from app.services.saas_db import get_school_database
         from app.services.face_service import FaceRecognitionService
+        from app.utils.embeddings import unpack_embedding
 
         # fetch active schools
         schools = list(self._root_db.schools.find({}))
@@ -482,7 +567,7 @@ class EmbeddingSyncJob:
                             continue
 
                         try:
-                            emb = np.array(student.get("face_embedding"), dtype=np.float32)
+                            emb = unpack_embedding(student.get("face_embedding"))
                         except Exception:
                             logger.warning(f"[EMBEDDING_SYNC] Invalid embedding for student {pid}")
                             continue
@@ -514,7 +599,7 @@ class EmbeddingSyncJob:
                             continue
 
                         try:
-                            emb = np.array(teacher.get("face_embedding"), dtype=np.float32)
+                            emb = unpack_embedding(teacher.get("face_embedding"))
                         except Exception:
                             logger.warning(f"[EMBEDDING_SYNC] Invalid embedding for teacher {pid}")
                             continue
@@ -6,6 +6,7 @@ from io import BytesIO
 from typing import List, Tuple
 from app.utils.student_id_utils import generate_student_id, validate_student_id_uniqueness, generate_registration_number
 from app.utils.validators import normalize_phone
+from app.services.student_fee_summary_service import refresh_student_fee_summary, delete_student_fee_summary
 import logging
 import zipfile
 
@@ -19,6 +20,13 @@ except Exception:
 
 # ================= Student Operations =================
 
+def _sync_fee_summary(action, student_id: str) -> None:
+    """Keep the student's fee summary row current; never fails the student write"""
+    try:
+        action(student_id)
+    except Exception as e:
+        logger.error(f"[FEE SUMMARY] Failed to sync summary for student {student_id}: {str(e)}")
+
 def create_student(student_data: dict) -> Optional[dict]:
     """Create a new student with schoolId isolation"""
     try:
@@ -84,6 +92,7 @@ def create_student(student_data: dict) -> Optional[dict]:
 
         result = db.students.insert_one(student_data)
         student_data["id"] = str(result.inserted_id)
+        _sync_fee_summary(refresh_student_fee_summary, student_data["id"])
         logger.info(f"[SCHOOL:{school_id}] ✅ Student created successfully: {student_data['student_id']} - {student_data['full_name']}")
         return student_data
     except Exception as e:
@@ -276,6 +285,8 @@ def update_student(student_id: str, school_id: str = None, **kwargs) -> Optional
         )
         if result:
             result["id"] = str(result["_id"])
+            if "class_id" in kwargs:
+                _sync_fee_summary(refresh_student_fee_summary, result["id"])
             logger.info(f"[SCHOOL:{school_id or 'N/A'}] ✅ Student updated: {student_id}") if school_id else None
         return result
     except:
@@ -291,6 +302,7 @@ def delete_student(student_id: str, school_id: str = None) -> bool:
         
         result = db.students.delete_one(query)
         if result.deleted_count > 0:
+            _sync_fee_summary(delete_student_fee_summary, student_id)
             logger.info(f"[SCHOOL:{school_id or 'N/A'}] ✅ Student deleted: {student_id}") if school_id else None
         return result.deleted_count > 0
     except:
@@ -0,0 +1,195 @@
+"""
+Student Fee Summary Service
+Maintains the materialized `student_fee_summary` collection: one row per
+student with expected_fee, paid_amount and status, so per-student lookups and
+collection stats don't re-sum fee_payments on every request.
+
+Rows are created before a student's first payment is inserted and adjusted in
+place as payments are recorded, edited or deleted. Student and class fee
+assignment writes refresh the affected rows, and the whole collection is
+rebuilt nightly from the source collections to catch anything missed.
+"""
+from app.database import get_db
+from app.services.fee_statistics_service import FEE_STATUS_EXPR, student_fee_status_stages
+from datetime import datetime
+from typing import Optional, Dict, Iterable, Set
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_SUMMARY_PROJECTION = {"_id": 0, "class_id": 1, "expected_fee": 1, "paid_amount": 1, "status": 1}
+
+
+# Tenant databases whose student_fee_summary.student_id unique index has
+# been ensured by this process
+_indexed_databases: Set[str] = set()
+_indexed_lock = threading.Lock()
+
+
+def _ensure_summary_index(db) -> None:
+    """
+    $merge "on": "student_id" fails without a unique index on that field, and
+    school databases don't all go through ensure_performance_indexes, so
+    create it (idempotently) before the first merge into each database.
+    """
+    if db.name in _indexed_databases:
+        return
+    with _indexed_lock:
+        if db.name in _indexed_databases:
+            return
+        db.student_fee_summary.create_index("student_id", unique=True)
+        _indexed_databases.add(db.name)
+
+
+def _summary_merge_pipeline(match: Dict, now: datetime, when_matched: str) -> list:
+    """Students pipeline that upserts their status rows by student_id"""
+    return student_fee_status_stages(match) + [
+        {"$addFields": {"updated_at": now}},
+        {"$merge": {
+            "into": "student_fee_summary",
+            "on": "student_id",
+            "whenMatched": when_matched,
+            "whenNotMatched": "insert"
+        }}
+    ]
+
+
+def _merge_into_summary(db, match: Dict, now: datetime, when_matched: str = "replace") -> None:
+    """Recompute the summary rows of the students matching `match`"""
+    _ensure_summary_index(db)
+    db.students.aggregate(_summary_merge_pipeline(match, now, when_matched))
+
+
+def refresh_student_fee_summary(student_id: str, db=None) -> None:
+    """Recompute one student's summary row from the source collections"""
+    db = db if db is not None else get_db()
+    try:
+        oid = ObjectId(student_id)
+    except (InvalidId, TypeError):
+        return
+    _merge_into_summary(db, {"_id": oid}, datetime.utcnow())
+
+
+def ensure_student_fee_summaries(student_ids: Iterable[str], db=None) -> None:
+    """
+    Create missing summary rows from the payments recorded so far. Call before
+    inserting a payment, so the payment itself only ever arrives as a delta:
+    a row built after the insert could already include it and the delta would
+    then count it twice. Existing rows are left as they are.
+    """
+    db = db if db is not None else get_db()
+    student_ids = {sid for sid in student_ids if sid}
+    if not student_ids:
+        return
+    existing = {
+        row["student_id"]
+        for row in db.student_fee_summary.find(
+            {"student_id": {"$in": list(student_ids)}}, {"_id": 0, "student_id": 1}
+        )
+    }
+    missing = [ObjectId(sid) for sid in student_ids - existing if ObjectId.is_valid(sid)]
+    if not missing:
+        return
+    try:
+        _merge_into_summary(db, {"_id": {"$in": missing}}, datetime.utcnow(), when_matched="keepExisting")
+    except OperationFailure as e:
+        # A concurrent first payment created the row between our check and the merge
+        if e.code != 11000:
+            raise
+
+
+def refresh_class_fee_summaries(class_ids: Iterable[str], school_id: Optional[str] = None, db=None) -> None:
+    """Recompute the rows of every student in `class_ids` (after a fee assignment change)"""
+    class_ids = [cid for cid in class_ids if cid]
+    if not class_ids:
+        return
+    db = db if db is not None else get_db()
+    match = {"class_id": {"$in": class_ids}}
+    if school_id:
+        match["school_id"] = school_id
+    _merge_into_summary(db, match, datetime.utcnow())
+
+
+def delete_student_fee_summary(student_id: str, db=None) -> None:
+    """Drop a deleted student's row"""
+    db = db if db is not None else get_db()
+    db.student_fee_summary.delete_one({"student_id": student_id})
+
+
+def apply_payment_delta(student_id: str, amount_delta: float, db=None) -> None:
+    """
+    Add `amount_delta` to a student's paid_amount and recompute status in one
+    update. A student without a row (ensure_student_fee_summaries not called,
+    or the row was removed meanwhile) gets a full recompute instead, since
+    expected_fee isn't known here.
+    """
+    if not student_id:
+        return
+    db = db if db is not None else get_db()
+    result = db.student_fee_summary.update_one(
+        {"student_id": student_id},
+        [
+            {"$set": {
+                "paid_amount": {"$add": [{"$ifNull": ["$paid_amount", 0]}, amount_delta]},
+                "updated_at": datetime.utcnow()
+            }},
+            {"$set": {"status": FEE_STATUS_EXPR}}
+        ]
+    )
+    if result.matched_count == 0:
+        refresh_student_fee_summary(student_id, db)
+
+
+def apply_payment_deltas(deltas: Dict[str, float], db=None) -> None:
+    """
+    Batch form of apply_payment_delta: one bulk_write for students that already
+    have a row, a full recompute for those that don't.
+    """
+    deltas = {sid: amount for sid, amount in deltas.items() if sid}
+    if not deltas:
+        return
+    db = db if db is not None else get_db()
+    existing = {
+        row["student_id"]
+        for row in db.student_fee_summary.find(
+            {"student_id": {"$in": list(deltas)}}, {"_id": 0, "student_id": 1}
+        )
+    }
+    now = datetime.utcnow()
+    ops = [
+        UpdateOne(
+            {"student_id": sid},
+            [
+                {"$set": {
+                    "paid_amount": {"$add": [{"$ifNull": ["$paid_amount", 0]}, deltas[sid]]},
+                    "updated_at": now
+                }},
+                {"$set": {"status": FEE_STATUS_EXPR}}
+            ]
+        )
+        for sid in existing
+    ]
+    if ops:
+        db.student_fee_summary.bulk_write(ops, ordered=False)
+    for sid in deltas.keys() - existing:
+        refresh_student_fee_summary(sid, db)
+
+
+def get_student_fee_summary(student_id: str) -> Optional[Dict]:
+    """Materialized {class_id, expected_fee, paid_amount, status} for a student, or None"""
+    db = get_db()
+    return db.student_fee_summary.find_one({"student_id": student_id}, _SUMMARY_PROJECTION)
+
+
+def rebuild_student_fee_summaries(school_id: str, db=None) -> None:
+    """Rebuild every summary row for a school and drop rows of removed students"""
+    db = db if db is not None else get_db()
+    started = datetime.utcnow()
+    _merge_into_summary(db, {"school_id": school_id}, started)
+    # Rows not touched by this rebuild belong to students that no longer exist
+    db.student_fee_summary.delete_many({"school_id": school_id, "updated_at": {"$lt": started}})
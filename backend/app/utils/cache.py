@@ -2,8 +2,10 @@
 Simple in-memory cache for dashboard data with TTL
 Reduces database load for frequently accessed data
 """
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Any, Optional, Dict
+from typing import Any, Callable, Optional, Dict, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
@@ -43,6 +45,12 @@ class SimpleCache:
             del self._cache[key]
             logger.debug(f"[CACHE INVALIDATE] {key}")
     
+    def invalidate_prefix(self, prefix: str):
+        """Remove every cached value whose key starts with `prefix`"""
+        for key in [k for k in list(self._cache) if k.startswith(prefix)]:
+            self._cache.pop(key, None)
+        logger.debug(f"[CACHE INVALIDATE] {prefix}*")
+    
     def clear(self):
         """Clear all cache"""
         self._cache.clear()
@@ -60,5 +68,49 @@ class SimpleCache:
         }
 
 
+class LRUCache:
+    """Size-bounded in-memory cache with TTL; evicts least recently used entries"""
+    
+    def __init__(self, maxsize: int = 1024, ttl_seconds: int = 3600):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._cache: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+    
+    def get(self, key: Any) -> Optional[Any]:
+        """Get cached value if present and not expired"""
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return value
+    
+    def set(self, key: Any, value: Any):
+        """Set cached value, evicting the oldest entry when full"""
+        self._cache[key] = (time.monotonic() + self.ttl_seconds, value)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+    
+    def __contains__(self, key: Any) -> bool:
+        return self.get(key) is not None
+    
+    def invalidate_matching(self, predicate: Callable[[Any], bool]) -> int:
+        """Drop every entry whose key satisfies `predicate`; returns how many"""
+        stale = [key for key in self._cache if predicate(key)]
+        for key in stale:
+            del self._cache[key]
+        return len(stale)
+    
+    def clear(self):
+        self._cache.clear()
+    
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
 # Global cache instance
 dashboard_cache = SimpleCache()
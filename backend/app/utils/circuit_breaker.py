@@ -0,0 +1,83 @@
+"""
+Minimal circuit breaker for calls to optional external services.
+
+CLOSED    -> calls pass through; consecutive failures are counted
+OPEN      -> calls are rejected until `recovery_time` seconds have passed
+HALF_OPEN -> a single probe call is allowed; success closes, failure re-opens.
+             A probe that never reports back is replaced after `recovery_time`
+
+State changes never await, so a breaker is safe to share between coroutines
+on one event loop without a lock.
+"""
+import time
+import logging
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_time: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+
+    def allow_request(self) -> bool:
+        """Return True if a call may be attempted now"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.recovery_time:
+                return False
+            self.state = HALF_OPEN
+            self._probe_in_flight = False
+            logger.info(f"[CIRCUIT] {self.name} half-open, allowing probe")
+        # HALF_OPEN: only one probe at a time
+        now = time.monotonic()
+        if self._probe_in_flight and now - self._probe_started < self.recovery_time:
+            return False
+        self._probe_in_flight = True
+        self._probe_started = now
+        return True
+
+    def release_probe(self):
+        """Hand back a half-open probe that ended without an outcome (e.g. cancelled)"""
+        self._probe_in_flight = False
+
+    def record_success(self):
+        if self.state != CLOSED:
+            logger.info(f"[CIRCUIT] {self.name} closed")
+        self.state = CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self._failures += 1
+        self._probe_in_flight = False
+        if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+            if self.state != OPEN:
+                logger.warning(f"[CIRCUIT] {self.name} opened after {self._failures} consecutive failures")
+            self.state = OPEN
+            self._opened_at = time.monotonic()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(name: str, failure_threshold: int = 5, recovery_time: float = 30.0) -> CircuitBreaker:
+    """Return the shared breaker for `name` (e.g. a service base URL)"""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(name, failure_threshold, recovery_time)
+    return breaker
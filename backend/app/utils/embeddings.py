@@ -0,0 +1,34 @@
+"""
+Storage format for face embeddings.
+
+New embeddings are written as little-endian float16 bytes (BSON Binary) with
+`embedding_dtype: "float16"` on the document; older documents still hold a
+plain list of floats. unpack_embedding reads either form.
+"""
+from typing import Optional
+
+import numpy as np
+from bson import Binary
+
+EMBEDDING_DTYPE = "float16"
+_STORED_DTYPE = np.dtype("<f2")
+
+
+def pack_embedding(vec) -> Binary:
+    """Encode an embedding vector as float16 BSON Binary"""
+    return Binary(np.asarray(vec, dtype=_STORED_DTYPE).tobytes())
+
+
+def unpack_embedding(value) -> Optional[np.ndarray]:
+    """Decode a stored embedding (Binary or legacy list) to a float32 vector"""
+    if value is None:
+        return None
+    if isinstance(value, (bytes, bytearray, memoryview)):  # bson.Binary is a bytes subclass
+        return np.frombuffer(value, dtype=_STORED_DTYPE).astype(np.float32)
+    return np.asarray(value, dtype=np.float32)
+
+
+def embedding_as_list(value) -> Optional[list]:
+    """Stored embedding as a list of floats, for API responses and models"""
+    vec = unpack_embedding(value)
+    return None if vec is None else vec.tolist()
@@ -15,7 +15,11 @@ logger = logging.getLogger(__name__)
 
 def _student_indexes() -> List[Any]:
     return [
-        ([("school_id", 1), ("status", 1)], {}),
+        # Active students by school; the trailing class_id lets the per-class
+        # count ($match school/status -> $group class_id) run from the index alone
+        ([("school_id", 1), ("status", 1), ("class_id", 1)], {}),
+        # Per-class rosters
+        ([("school_id", 1), ("class_id", 1), ("status", 1)], {}),
         ([("school_id", 1)], {}),
         ([("student_id", 1)], {}),
         ([("class_id", 1)], {}),
@@ -31,6 +35,9 @@ def _attendance_indexes() -> List[Any]:
         ([("school_id", 1), ("date", -1)], {}),
         ([("school_id", 1), ("date", -1), ("status", 1)], {}),
         ([("student_id", 1), ("date", -1)], {}),
+        # Face attendance existence check / upsert target; unique so concurrent
+        # captures of the same student cannot create two records for one day
+        ([("school_id", 1), ("student_id", 1), ("date", 1)], {"unique": True, "name": "school_student_date"}),
     ]
 
 
@@ -39,6 +46,14 @@ def _employee_attendance_indexes() -> List[Any]:
         ([("school_id", 1), ("date", -1)], {}),
         ([("school_id", 1), ("date", -1), ("status", 1)], {}),
         ([("teacher_id", 1), ("date", -1)], {}),
+        ([("school_id", 1), ("teacher_id", 1), ("date", 1)], {"unique": True, "name": "school_teacher_date"}),
+    ]
+
+
+def _face_activity_logs_indexes() -> List[Any]:
+    return [
+        # Dashboard: today's activity per school, newest first
+        ([("school_id", 1), ("timestamp", -1)], {}),
     ]
 
 
@@ -52,6 +67,47 @@ def _teachers_indexes() -> List[Any]:
     ]
 
 
+def _fees_indexes() -> List[Any]:
+    return [
+        # Per-student fee lookups; the school_id prefix also serves school-wide listing
+        ([("school_id", 1), ("student_id", 1)], {}),
+    ]
+
+
+def _fee_payments_indexes() -> List[Any]:
+    return [
+        # Payment history per student / class and school-wide, newest first;
+        # the paid_at key also serves date-range $match before $group
+        ([("student_id", 1), ("paid_at", -1)], {}),
+        ([("class_id", 1), ("paid_at", -1)], {}),
+        ([("school_id", 1), ("paid_at", -1)], {}),
+        # Payment method breakdown
+        ([("school_id", 1), ("payment_method", 1)], {}),
+    ]
+
+
+def _class_fee_assignments_indexes() -> List[Any]:
+    return [
+        # Active assignment lookup per class
+        ([("class_id", 1), ("is_active", 1)], {}),
+    ]
+
+
+def _fee_categories_indexes() -> List[Any]:
+    return [
+        # Category list: equality on school/archived, newest first
+        ([("school_id", 1), ("is_archived", 1), ("created_at", -1)], {}),
+    ]
+
+
+def _student_fee_summary_indexes() -> List[Any]:
+    return [
+        # $merge "on": "student_id" requires a unique index on the match field
+        ([("student_id", 1)], {"unique": True}),
+        ([("school_id", 1), ("class_id", 1)], {}),
+    ]
+
+
 def _classes_indexes() -> List[Any]:
     return [
         ([("school_id", 1)], {}),
@@ -64,9 +120,73 @@ INDEX_MAP: Dict[str, List[Any]] = {
     "employee_attendance": _employee_attendance_indexes(),
     "teachers": _teachers_indexes(),
     "classes": _classes_indexes(),
+    "face_activity_logs": _face_activity_logs_indexes(),
+    "fees": _fees_indexes(),
+    "fee_payments": _fee_payments_indexes(),
+    "class_fee_assignments": _class_fee_assignments_indexes(),
+    "fee_categories": _fee_categories_indexes(),
+    "student_fee_summary": _student_fee_summary_indexes(),
 }
 
 
+# One record per person per day: collection -> (person field, unique index name)
+DAILY_ATTENDANCE_KEYS: Dict[str, Any] = {
+    "attendance": ("student_id", "school_student_date"),
+    "employee_attendance": ("teacher_id", "school_teacher_date"),
+}
+
+
+def dedupe_daily_attendance(db) -> int:
+    """Collapse same-day duplicate attendance records so the unique daily
+    indexes can be built.
+
+    The earliest record of each (school, person, date) is kept (it holds the
+    first check-in); it inherits the latest check-out time of the group if it
+    has none. Returns the number of records removed.
+    """
+    removed = 0
+    for coll_name, (person_field, _) in DAILY_ATTENDANCE_KEYS.items():
+        collection = db[coll_name]
+        coll_removed = 0
+        groups = collection.aggregate([
+            {"$sort": {"_id": 1}},
+            {"$group": {
+                "_id": {"school_id": "$school_id", "person": f"${person_field}", "date": "$date"},
+                "ids": {"$push": "$_id"},
+                "check_out_time": {"$max": "$check_out_time"},
+                "count": {"$sum": 1},
+            }},
+            {"$match": {"count": {"$gt": 1}}},
+        ], allowDiskUse=True)
+        for group in groups:
+            keep, extra = group["ids"][0], group["ids"][1:]
+            if group.get("check_out_time"):
+                collection.update_one(
+                    {"_id": keep, "check_out_time": None},
+                    {"$set": {"check_out_time": group["check_out_time"]}}
+                )
+            coll_removed += collection.delete_many({"_id": {"$in": extra}}).deleted_count
+        if coll_removed:
+            logger.info("   🧹 Removed %s duplicate same-day records from %s", coll_removed, coll_name)
+        removed += coll_removed
+    return removed
+
+
+def ensure_daily_attendance_indexes(db) -> None:
+    """Dedupe, then create the unique (school, person, date) attendance indexes.
+
+    Face check-in/check-out relies on these to keep concurrent scans from
+    creating two records for one day. Raises if an index cannot be built.
+    """
+    dedupe_daily_attendance(db)
+    for coll_name, (person_field, index_name) in DAILY_ATTENDANCE_KEYS.items():
+        db[coll_name].create_index(
+            [("school_id", 1), (person_field, 1), ("date", 1)],
+            unique=True,
+            name=index_name,
+        )
+
+
 def ensure_performance_indexes(db) -> None:
     """Create performance indexes for collections listed in INDEX_MAP.
 
@@ -75,6 +195,12 @@ def ensure_performance_indexes(db) -> None:
     """
     logger.info("🔧 Ensuring performance indexes for collections: %s", list(INDEX_MAP.keys()))
 
+    # Existing duplicates would make the unique daily attendance indexes fail
+    try:
+        dedupe_daily_attendance(db)
+    except Exception as e:
+        logger.warning("⚠️ Failed to dedupe daily attendance records: %s", e)
+
     for coll_name, indexes in INDEX_MAP.items():
         try:
             collection = db[coll_name]
@@ -2,7 +2,9 @@
 Student ID Generation Utilities
 """
 
+import re
 from datetime import datetime
+from functools import lru_cache
 from pymongo.collection import Collection
 from typing import Optional
 import logging
@@ -88,17 +90,22 @@ def generate_student_id(admission_year: int, db_collection: Collection, school_i
         logger.error(f"❌ Failed to generate student ID: {str(e)}")
         raise
 
+_TRAILING_DIGITS_RE = re.compile(r'(\d+)$')
+
+
+@lru_cache(maxsize=16384)
 def generate_imported_student_id(excel_id: str) -> str:
     """
     Generate student ID for Excel import.
     Format: 0000-<cleaned_excel_id>
     Strips any non-numeric prefixes like 'REG' from the excel_id.
+    Pure function of excel_id, so results are memoized across the import
+    pipeline (duplicate check, insert and post-insert lookup).
     """
     try:
         # Clean the excel_id by removing any non-numeric prefix
         # Extract only the numeric part (e.g., "REG1002" -> "1002")
-        import re
-        match = re.search(r'(\d+)$', excel_id.strip())
+        match = _TRAILING_DIGITS_RE.search(excel_id.strip())
         if match:
             cleaned_id = match.group(1)
         else: